@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from core.webpay_stub import StubWebpay
+
+
+class Command(BaseCommand):
+    help = (
+        "Stub local de Webpay Plus para pruebas de carga sin red. "
+        "Apuntar WEBPAY_HOST a la URL que imprime."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8766)
+        parser.add_argument("--latency-ms", type=int, default=0, help="Demora simulada por llamada.")
+        parser.add_argument("--reject-rate", type=float, default=0.0, help="Fracción de pagos rechazados (0-1).")
+
+    def handle(self, *args, **opts):
+        server = StubWebpay(
+            (opts["host"], opts["port"]), latencia_ms=opts["latency_ms"], tasa_rechazo=opts["reject_rate"]
+        )
+        self.stdout.write(self.style.SUCCESS(f"Stub Webpay en {server.url} (WEBPAY_HOST={server.url})"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
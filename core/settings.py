@@ -142,6 +142,77 @@ LOGIN_REDIRECT_URL = "public:home"
 LOGOUT_REDIRECT_URL = "public:home"
 
 
+# Bitácora de validaciones en puerta: "sync" (un INSERT por lectura) o
+# "buffered" (buffer en memoria + spool en disco, ver orders/services/bitacora.py)
+VALIDATION_LOG_MODE = os.environ.get("VALIDATION_LOG_MODE", "sync")
+VALIDATION_LOG_BUFFER_SIZE = int(os.environ.get("VALIDATION_LOG_BUFFER_SIZE", "200"))
+VALIDATION_LOG_FLUSH_SECONDS = float(os.environ.get("VALIDATION_LOG_FLUSH_SECONDS", "2"))
+VALIDATION_LOG_SPOOL_DIR = os.environ.get("VALIDATION_LOG_SPOOL_DIR", str(BASE_DIR / "var" / "validation_log_spool"))
+VALIDATION_LOG_UA_MAX = 255
+
+# Clave HMAC de los QR firmados (por defecto se deriva de SECRET_KEY)
+QR_SIGNING_KEY = os.environ.get("QR_SIGNING_KEY", "")
+
+# Filtro de Bloom de códigos emitidos (NOT_FOUND sin quemar ni loguear cada
+# lectura). Un hilo por proceso lo refresca cada CODE_FILTER_REFRESH_SECONDS:
+# un ticket creado en otro worker puede dar NOT_FOUND durante ese desfase.
+CODE_FILTER_ENABLED = os.environ.get("CODE_FILTER_ENABLED", "True") == "True"
+CODE_FILTER_REFRESH_SECONDS = 1
+CODE_FILTER_LAG_SECONDS = 60
+CODE_FILTER_MISS_SAMPLE = 50
+
+# Métricas en vivo por puerta (contadores por minuto en el cache). Con el
+# LocMemCache por defecto cada worker ve sólo sus lecturas: en producción
+# apuntar CACHES a Redis/Memcached para agregarlas entre workers.
+GATE_METRICS_ENABLED = os.environ.get("GATE_METRICS_ENABLED", "True") == "True"
+GATE_METRICS_WINDOW_MINUTES = 5
+
+# Cliente Webpay (core/webpay.py). WEBPAY_HOST apunta al ambiente de
+# integración; para pruebas de carga sin red, al stub (manage.py run_webpay_stub).
+WEBPAY_HOST = "https://webpay3gint.transbank.cl"
+WEBPAY_POOL_SIZE = 10  # conexiones keep-alive por proceso
+WEBPAY_TIMEOUTS = {"create": (3, 10), "commit": (3, 20), "status": (3, 10), "refund": (3, 20)}
+WEBPAY_SLOW_MS = 3000
+
+# Commit Webpay: "async" (webpay_return encola y process_webpay_commits
+# confirma) o "sync" (en el mismo request; desarrollo sin worker)
+WEBPAY_COMMIT_MODE = os.environ.get("WEBPAY_COMMIT_MODE", "async")
+WEBPAY_COMMIT_LEASE_SECONDS = 120  # retoma lo que dejó "procesando" un worker caído
+# Una clave de idempotencia "en curso" más vieja que esto es de un proceso caído
+IDEMPOTENCY_LEASE_SECONDS = 300
+
+# Minutos que se retiene el stock mientras el comprador paga en Webpay
+CHECKOUT_HOLD_MINUTES = 15
+
+# Filas en que se reparte el cupo de cada DiscountCode (menos contención del lock)
+DISCOUNT_COUNTER_SHARDS = 8
+
+# Tabla de precios en memoria por evento (orders.services.precios). Igual que
+# el mapa de códigos de abajo, los cambios se avisan con una versión en el
+# cache y sólo cruzan workers con CACHES compartido; si no, al vencer el TTL.
+PRICE_TABLE_TTL_SECONDS = 30
+
+# Mapa en memoria de códigos de descuento por evento (orders.services.codigos_promo).
+# Los cambios se avisan con una versión en el cache: con el LocMemCache por
+# defecto los demás workers sólo los ven al vencer este TTL, así que en
+# producción apuntar CACHES a Redis/Memcached.
+PROMO_CODES_TTL_SECONDS = 60
+
+# Índice de nombres de eventos para buscar órdenes (orders.services.busqueda_ordenes).
+# Se invalida al guardar un Evento; con el LocMemCache por defecto los demás
+# workers lo ven recién al vencer este TTL (en producción, CACHES compartido).
+ORDER_SEARCH_INDEX_TTL_SECONDS = 60
+
+# Sala de espera: vigencia del turno una vez admitido (requiere CACHES
+# compartido entre workers para que el ritmo de admisión sea global)
+WAITING_ROOM_ADMISSION_SECONDS = 30 * 60
+
+# Stream SSE de validaciones para supervisores (sólo con ASGI; bajo WSGI
+# responde 501 y el dashboard refresca el resumen por polling)
+FEED_SNAPSHOT_SECONDS = 5
+FEED_KEEPALIVE_SECONDS = 15
+
+
 EMAIL_BACKEND = "django.core.mail.backends.console.EmailBackend"
 DEFAULT_FROM_EMAIL = "no-reply@ticket-f.local"
 
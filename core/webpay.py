@@ -1,20 +1,161 @@
 # core/webpay.py
+"""
+Cliente Webpay Plus (REST) para el checkout.
 
-from transbank.webpay.webpay_plus.transaction import Transaction
-from transbank.common.options import WebpayOptions
-from transbank.common.integration_type import IntegrationType
+El SDK de Transbank arma un Transaction nuevo por llamada y usa
+requests.post suelto: sin reutilizar conexiones y con un timeout único. Con
+workers sync, un Transbank lento los deja todos colgados. Este cliente habla
+el mismo API REST con:
+
+  - una requests.Session por proceso (pool de conexiones keep-alive);
+  - timeouts (conexión, lectura) por operación, WEBPAY_TIMEOUTS;
+  - reintentos sólo donde es seguro: errores de conexión (el request no
+    salió) en todas las llamadas, y además 502/503/504 y lecturas cortadas
+    en status (GET). create y commit no se repiten si Transbank ya los
+    recibió;
+  - métricas de latencia por operación (metricas(), en la vista
+    orders:webpay-metrics y en la salida de process_webpay_commits).
+
+WEBPAY_HOST permite apuntar al stub local (comando run_webpay_stub) para
+pruebas de carga sin red.
+"""
+import logging
+import threading
+import time
+from collections import deque
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from transbank.error.transbank_error import TransbankError
+from urllib3.util.retry import Retry
 
 # Credenciales de INTEGRACIÓN Webpay Plus (REST)
 WEBPAY_COMMERCE_CODE = "597055555532"
 WEBPAY_API_KEY = "579B532A7440BB0C9079DED94D31EA1615BACEB56610332264630D42D0A36B1C"
+WEBPAY_HOST_INTEGRACION = "https://webpay3gint.transbank.cl"
+
+API = "/rswebpaytransaction/api/webpay/v1.2/transactions"
+
+logger = logging.getLogger(__name__)
+
+_session = None
+_session_lock = threading.Lock()
+_latencias = {}  # operación -> deque[(ms, ok)]
+_metricas_lock = threading.Lock()
+MUESTRAS = 1000
+
+
+def _host():
+    return getattr(settings, "WEBPAY_HOST", WEBPAY_HOST_INTEGRACION).rstrip("/")
+
+
+def _timeout(op):
+    """(conexión, lectura) en segundos, de settings.WEBPAY_TIMEOUTS."""
+    return settings.WEBPAY_TIMEOUTS[op]
+
+
+def _nueva_sesion():
+    s = requests.Session()
+    s.headers.update({
+        "Content-Type": "application/json",
+        "Tbk-Api-Key-Id": getattr(settings, "WEBPAY_COMMERCE_CODE", WEBPAY_COMMERCE_CODE),
+        "Tbk-Api-Key-Secret": getattr(settings, "WEBPAY_API_KEY", WEBPAY_API_KEY),
+    })
+    retry = Retry(
+        total=3,
+        connect=2,
+        read=1,
+        status=2,
+        backoff_factor=0.2,
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset({"GET"}),  # read/status sólo para GET
+        raise_on_status=False,
+    )
+    pool = getattr(settings, "WEBPAY_POOL_SIZE", 10)
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool, max_retries=retry)
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+def session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _nueva_sesion()
+    return _session
+
 
-def wb() -> Transaction:
+def _registrar(op, ms, ok):
+    with _metricas_lock:
+        _latencias.setdefault(op, deque(maxlen=MUESTRAS)).append((ms, ok))
+    if ms > getattr(settings, "WEBPAY_SLOW_MS", 3000):
+        logger.warning("Webpay %s lento: %.0f ms", op, ms)
+
+
+def metricas():
+    """{op: {"llamadas", "errores", "p50_ms", "p95_ms", "max_ms"}} de las últimas MUESTRAS llamadas."""
+    with _metricas_lock:
+        copia = {op: list(d) for op, d in _latencias.items()}
+    data = {}
+    for op, filas in copia.items():
+        ms = sorted(m for m, _ in filas)
+        data[op] = {
+            "llamadas": len(filas),
+            "errores": sum(1 for _, ok in filas if not ok),
+            "p50_ms": round(ms[len(ms) // 2], 1),
+            "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 1),
+            "max_ms": round(ms[-1], 1),
+        }
+    return data
+
+
+def _llamar(op, method, path, json=None):
+    inicio = time.perf_counter()
+    ok = False
+    try:
+        resp = session().request(method, _host() + API + path, json=json, timeout=_timeout(op))
+        if resp.status_code not in (200, 204):
+            try:
+                data = resp.json()
+            except ValueError:
+                data = {}
+            mensaje = data.get("error_message") or data.get("description") or resp.text
+            raise TransbankError(message=mensaje, code=resp.status_code)
+        ok = True
+        return resp.json() if resp.content else {}
+    finally:
+        _registrar(op, (time.perf_counter() - inicio) * 1000, ok)
+
+
+class WebpayClient:
+    """Misma interfaz que transbank Transaction: cada método retorna el dict de Transbank."""
+
+    def create(self, buy_order, session_id, amount, return_url):
+        return _llamar("create", "POST", "", {
+            "buy_order": buy_order,
+            "session_id": session_id,
+            "amount": amount,
+            "return_url": return_url,
+        })
+
+    def commit(self, token):
+        return _llamar("commit", "PUT", f"/{token}")
+
+    def status(self, token):
+        return _llamar("status", "GET", f"/{token}")
+
+    def refund(self, token, amount):
+        return _llamar("refund", "POST", f"/{token}/refunds", {"amount": amount})
+
+
+_cliente = WebpayClient()
+
+
+def wb() -> WebpayClient:
     """
-    Retorna una instancia de Transaction configurada para el ambiente de integración.
+    Retorna el cliente Webpay del proceso (ambiente de integración por defecto).
     """
-    options = WebpayOptions(
-        commerce_code=WEBPAY_COMMERCE_CODE,
-        api_key=WEBPAY_API_KEY,
-        integration_type=IntegrationType.TEST,  # importante: ambiente de integración
-    )
-    return Transaction(options)
\ No newline at end of file
+    return _cliente
@@ -0,0 +1,139 @@
+# core/webpay_stub.py
+"""
+Stub local del API REST de Webpay Plus (comando run_webpay_stub).
+
+Implementa lo que usa el checkout: crear, formulario de pago, confirmar
+(commit) y estado. El formulario aprueba solo: reenvía token_ws a la
+return_url, así una prueba de carga completa el flujo sin salir de la
+máquina. Con WEBPAY_HOST apuntando acá, core.webpay no nota la diferencia.
+"""
+import json
+import random
+import secrets
+import threading
+import time
+from datetime import datetime, timezone
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from core.webpay import API
+
+
+FORM_PATH = "/webpayserver/initTransaction"
+
+
+class StubWebpay(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, latencia_ms=0, tasa_rechazo=0.0):
+        super().__init__(addr, _Handler)
+        self.latencia_ms = latencia_ms
+        self.tasa_rechazo = tasa_rechazo
+        self.transacciones = {}
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: StubWebpay
+
+    def _json(self, status, data):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _leer(self):
+        largo = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(largo) or b"{}")
+
+    def _demora(self):
+        if self.server.latencia_ms:
+            time.sleep(self.server.latencia_ms / 1000)
+
+    def _token(self):
+        path = urlparse(self.path).path
+        if not path.startswith(API + "/"):
+            return None
+        return path[len(API) + 1:]
+
+    def do_POST(self):
+        if urlparse(self.path).path != API:
+            return self._json(404, {"error_message": "Not found"})
+        self._demora()
+        data = self._leer()
+        token = secrets.token_hex(32)
+        with self.server.lock:
+            self.server.transacciones[token] = {**data, "estado": "INITIALIZED"}
+        self._json(200, {"token": token, "url": self.server.url + FORM_PATH})
+
+    def do_PUT(self):
+        token = self._token()
+        self._demora()
+        with self.server.lock:
+            tx = self.server.transacciones.get(token)
+            if tx is None:
+                return self._json(422, {"error_message": "Invalid value for parameter: token"})
+            if tx["estado"] != "INITIALIZED":
+                return self._json(422, {"error_message": "Transaction already locked by another process"})
+            aprobada = random.random() >= self.server.tasa_rechazo
+            tx["estado"] = "AUTHORIZED" if aprobada else "FAILED"
+            tx["authorization_code"] = f"{random.randint(0, 999999):06d}" if aprobada else None
+            tx["transaction_date"] = datetime.now(timezone.utc).isoformat()
+        self._json(200, self._detalle(tx))
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path == FORM_PATH:
+            return self._formulario(parse_qs(url.query).get("token_ws", [""])[0])
+        token = self._token()
+        self._demora()
+        with self.server.lock:
+            tx = self.server.transacciones.get(token)
+        if tx is None:
+            return self._json(422, {"error_message": "Invalid value for parameter: token"})
+        self._json(200, self._detalle(tx))
+
+    def _detalle(self, tx):
+        autorizada = tx["estado"] == "AUTHORIZED"
+        return {
+            "vci": "TSY",
+            "amount": tx.get("amount"),
+            "status": tx["estado"],
+            "buy_order": tx.get("buy_order"),
+            "session_id": tx.get("session_id"),
+            "card_detail": {"card_number": "6623"},
+            "accounting_date": datetime.now().strftime("%m%d"),
+            "transaction_date": tx.get("transaction_date"),
+            "authorization_code": tx.get("authorization_code"),
+            "payment_type_code": "VN",
+            "response_code": 0 if autorizada else -1,
+            "installments_number": 0,
+        }
+
+    def _formulario(self, token):
+        with self.server.lock:
+            tx = self.server.transacciones.get(token)
+        if tx is None:
+            return self._json(404, {"error_message": "Token desconocido"})
+        html = (
+            "<!doctype html><html><body onload='document.forms[0].submit()'>"
+            f"<form method='post' action='{escape(tx['return_url'])}'>"
+            f"<input type='hidden' name='token_ws' value='{escape(token)}'>"
+            "<noscript><button>Pagar (stub)</button></noscript></form></body></html>"
+        ).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(html)))
+        self.end_headers()
+        self.wfile.write(html)
+
+    def log_message(self, *args):
+        pass
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0003_remove_evento_banner_url_evento_banner'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='evento',
+            name='admisiones_por_segundo',
+            field=models.PositiveIntegerField(default=20),
+        ),
+        migrations.AddField(
+            model_name='evento',
+            name='sala_espera',
+            field=models.BooleanField(default=False),
+        ),
+    ]
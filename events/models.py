@@ -15,6 +15,9 @@ class Evento(models.Model):
     ubicacion = models.CharField(max_length=200, blank=True)
     banner = models.ImageField(upload_to="event_banners/", blank=True, null=True)
     descripcion = models.TextField(blank=True)  
+    # Sala de espera virtual para ventas de alta demanda (orders.services.sala_espera)
+    sala_espera = models.BooleanField(default=False)
+    admisiones_por_segundo = models.PositiveIntegerField(default=20)
     creado_en = models.DateTimeField(auto_now_add=True)
     actualizado_en = models.DateTimeField(auto_now=True)
 
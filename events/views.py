@@ -14,6 +14,8 @@ class EventoForm(forms.ModelForm):
             "ubicacion",
             "banner",      
             "descripcion",
+            "sala_espera",
+            "admisiones_por_segundo",
         ]
         widgets = {
             "descripcion": forms.Textarea(
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class OrdersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'orders'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from .services import codigos_promo
+
+        # Se resuelve una vez al arrancar, no en cada checkout
+        codigos_promo.modelo_descuento()
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from orders.services.montos import LOTE, backfill
+
+
+class Command(BaseCommand):
+    help = (
+        "Completa subtotal/descuento/total de las órdenes anteriores a los montos "
+        "congelados (y precio/neto de sus tickets), por lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=LOTE)
+
+    def handle(self, *args, **opts):
+        total = backfill(lote=opts["batch"])
+        self.stdout.write(self.style.SUCCESS(f"{total} órdenes completadas."))
@@ -0,0 +1,41 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from orders.services import bench_descuentos
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark de contención de un DiscountCode: compara el lock de fila con los contadores "
+        "repartidos para 1..N workers. Usa la base de DATABASES; no correr en producción."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", default="1,2,4,8", help="Lista separada por comas.")
+        parser.add_argument("--checkouts", type=int, default=200)
+        parser.add_argument("--hold-ms", type=int, default=5, help="Tiempo que el checkout retiene la transacción.")
+        parser.add_argument("--json", action="store_true", help="Imprime el reporte como JSON.")
+
+    def handle(self, *args, **opts):
+        workers = [int(w) for w in opts["workers"].split(",") if w.strip()]
+        datos = bench_descuentos.sembrar(usos_maximos=opts["checkouts"])
+        filas = []
+        try:
+            for modo in ("fila", "repartido"):
+                for w in workers:
+                    bench_descuentos.reiniciar(datos)
+                    filas.append(bench_descuentos.medir(datos, modo, w, opts["checkouts"], opts["hold_ms"]))
+        finally:
+            bench_descuentos.limpiar(datos)
+
+        if opts["json"]:
+            self.stdout.write(json.dumps(filas, indent=2))
+            return
+
+        fila = "{:<10} {:>8} {:>10} {:>8} {:>10} {:>14}"
+        self.stdout.write(fila.format("modo", "workers", "consumidos", "errores", "segundos", "checkouts/s"))
+        for r in filas:
+            self.stdout.write(fila.format(
+                r["modo"], r["workers"], r["consumidos"], r["errores"], r["segundos"], r["checkouts_por_segundo"],
+            ))
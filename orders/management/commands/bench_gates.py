@@ -0,0 +1,49 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from orders.services import bench_puertas
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark del camino de puerta: siembra un evento con N tickets y simula M puertas "
+        "concurrentes contra validate_ticket. Usa la base de DATABASES; no correr en producción."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--tickets", type=int, default=2000)
+        parser.add_argument("--gates", type=int, default=8)
+        parser.add_argument("--scans", type=int, default=None, help="Por defecto, igual a --tickets.")
+        parser.add_argument("--uuid", action="store_true", help="Lee UUID pelados en vez de QR firmados.")
+        parser.add_argument("--seed", type=int, default=None)
+        parser.add_argument("--keep", action="store_true", help="No borra los datos sembrados.")
+        parser.add_argument("--json", action="store_true", help="Imprime el reporte como JSON.")
+
+    def handle(self, *args, **opts):
+        datos = bench_puertas.sembrar(opts["tickets"], opts["gates"])
+        try:
+            lecturas = bench_puertas.armar_lecturas(
+                datos, opts["scans"] or opts["tickets"], signed=not opts["uuid"], semilla=opts["seed"]
+            )
+            mediciones, segundos = bench_puertas.simular(datos, lecturas, opts["gates"])
+            data = bench_puertas.reporte(mediciones, segundos)
+        finally:
+            if not opts["keep"]:
+                bench_puertas.limpiar(datos)
+
+        if opts["json"]:
+            self.stdout.write(json.dumps(data, indent=2))
+            return
+
+        self.stdout.write(
+            f"{data['lecturas']} lecturas en {data['segundos']} s "
+            f"({data['lecturas_por_segundo']} lecturas/s, {opts['gates']} puertas)"
+        )
+        fila = "{:<12} {:>8} {:>9} {:>9} {:>9} {:>10}  {}"
+        self.stdout.write(fila.format("tipo", "lecturas", "p50 ms", "p95 ms", "p99 ms", "consultas", "status"))
+        for tipo, r in [("total", data), *data["por_tipo"].items()]:
+            self.stdout.write(fila.format(
+                tipo, r["lecturas"], f"{r['p50_ms']:.2f}", f"{r['p95_ms']:.2f}", f"{r['p99_ms']:.2f}",
+                r["consultas_por_lectura"], r["status"],
+            ))
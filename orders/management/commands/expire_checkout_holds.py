@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from orders.services.reservas import LOTE_BARRIDO, barrer_vencidas
+
+
+class Command(BaseCommand):
+    help = "Libera el stock de las reservas de checkout vencidas (correr cada minuto por cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=LOTE_BARRIDO)
+
+    def handle(self, *args, **opts):
+        total = barrer_vencidas(lote=opts["batch"])
+        self.stdout.write(self.style.SUCCESS(f"{total} reservas vencidas liberadas."))
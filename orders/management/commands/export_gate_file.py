@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from events.models import Evento
+from orders.services.gate_file import exportar_evento
+
+
+class Command(BaseCommand):
+    help = "Exporta el archivo binario de puerta (códigos ordenados + flags) de un evento."
+
+    def add_arguments(self, parser):
+        parser.add_argument("evento_id", type=int)
+        parser.add_argument("path")
+
+    def handle(self, *args, **opts):
+        try:
+            evento = Evento.objects.get(id=opts["evento_id"])
+        except Evento.DoesNotExist:
+            raise CommandError(f"No existe el evento {opts['evento_id']}.")
+        n = exportar_evento(evento, opts["path"])
+        self.stdout.write(self.style.SUCCESS(f"{n} tickets exportados a {opts['path']}."))
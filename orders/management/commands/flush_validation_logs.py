@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from orders.services.bitacora import recuperar_spool
+
+
+class Command(BaseCommand):
+    help = "Recupera en ValidationLog los registros que quedaron en el spool de workers caídos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--spool-dir", default=None)
+        parser.add_argument(
+            "--min-age", type=int, default=300,
+            help="Segundos sin modificar que debe tener un archivo del spool antes de recuperarlo.",
+        )
+
+    def handle(self, *args, **opts):
+        total = recuperar_spool(spool_dir=opts["spool_dir"], min_age_seconds=opts["min_age"])
+        self.stdout.write(self.style.SUCCESS(f"{total} registros recuperados."))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.models import AccessPoint
+from orders.services.gate_file import GateFileError, conciliar_journal
+
+
+class Command(BaseCommand):
+    help = "Concilia en Ticket y ValidationLog las quemas del journal de un validador de puerta."
+
+    def add_arguments(self, parser):
+        parser.add_argument("journal")
+        parser.add_argument("--access-point", type=int, default=None)
+
+    def handle(self, *args, **opts):
+        ap = None
+        if opts["access_point"]:
+            ap = AccessPoint.objects.filter(id=opts["access_point"]).first()
+            if ap is None:
+                raise CommandError(f"No existe el punto de acceso {opts['access_point']}.")
+        try:
+            total = conciliar_journal(opts["journal"], access_point=ap)
+        except (GateFileError, FileNotFoundError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"{total} lecturas conciliadas."))
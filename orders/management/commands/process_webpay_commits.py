@@ -0,0 +1,44 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import webpay
+from orders.services.pagos_webpay import LOTE, procesar_pendientes
+
+
+METRICAS_CADA = 60  # segundos entre resúmenes de latencia de Webpay
+
+
+class Command(BaseCommand):
+    help = (
+        "Worker de pagos: confirma en Webpay las transacciones recibidas y crea "
+        "sus órdenes. Se pueden correr varios en paralelo."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch", type=int, default=LOTE)
+        parser.add_argument("--interval", type=float, default=0.5, help="Segundos de espera sin trabajo.")
+        parser.add_argument("--once", action="store_true", help="Una sola pasada (cron o pruebas).")
+
+    def handle(self, *args, **opts):
+        if opts["once"]:
+            total = procesar_pendientes(lote=opts["batch"])
+            self.stdout.write(self.style.SUCCESS(f"{total} pagos procesados."))
+            return
+
+        self.stdout.write(self.style.SUCCESS("Procesando pagos Webpay (Ctrl+C para salir)."))
+        ultimo = time.monotonic()
+        try:
+            while True:
+                close_old_connections()
+                if not procesar_pendientes(lote=opts["batch"]):
+                    time.sleep(opts["interval"])
+                if time.monotonic() - ultimo >= METRICAS_CADA:
+                    ultimo = time.monotonic()
+                    m = webpay.metricas()
+                    if m:
+                        self.stdout.write(f"webpay {json.dumps(m)}")
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,48 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from orders.services.conciliacion import LOTE, conciliar, leer_export
+
+
+class Command(BaseCommand):
+    help = (
+        "Concilia el libro de pagos contra el export de transacciones del portal "
+        "de Transbank (CSV), en lotes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("export", help="CSV exportado del portal de Transbank.")
+        parser.add_argument("--batch", type=int, default=LOTE)
+        parser.add_argument("--event", type=int, default=None, help="Sólo pagos de este evento.")
+        parser.add_argument("--since", default=None, help="YYYY-MM-DD (por defecto, el rango del export).")
+        parser.add_argument("--until", default=None, help="YYYY-MM-DD")
+        parser.add_argument("--out", default=None, help="CSV con las diferencias encontradas.")
+
+    def handle(self, *args, **opts):
+        desde = parse_date(opts["since"]) if opts["since"] else None
+        hasta = parse_date(opts["until"]) if opts["until"] else None
+        try:
+            with open(opts["export"], newline="", encoding="utf-8-sig") as f:
+                res = conciliar(
+                    leer_export(f), lote=opts["batch"], evento_id=opts["event"], desde=desde, hasta=hasta
+                )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+
+        if opts["out"]:
+            with open(opts["out"], "w", newline="", encoding="utf-8") as f:
+                w = csv.writer(f)
+                w.writerow(["buy_order", "motivo"])
+                w.writerows(res["detalle"])
+                w.writerows((bo, "autorizado en Transbank sin pago en el libro") for bo in res["sin_libro"])
+
+        self.stdout.write(
+            f"{res['ok']} cuadran, {res['diferencias']} con diferencias, "
+            f"{res['faltantes']} faltan en Transbank, {len(res['sin_libro'])} sin pago en el libro."
+        )
+        if res["diferencias"] or res["faltantes"] or res["sin_libro"]:
+            self.stdout.write(self.style.WARNING("Hay pagos por revisar."))
+        else:
+            self.stdout.write(self.style.SUCCESS("Todo cuadra."))
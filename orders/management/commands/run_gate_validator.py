@@ -0,0 +1,91 @@
+import hmac
+import json
+import os
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.services.gate_file import GateValidator
+
+
+STATUS = {"OK": 200, "NOT_FOUND": 404, "DENIED": 403, "ALREADY_USED": 409}
+
+
+class Command(BaseCommand):
+    help = (
+        "Validador local de puerta: responde lecturas desde el archivo exportado "
+        "(mmap) y anota las quemas en un journal, sin tocar la base. Los "
+        "escáneres se autentican con 'Authorization: Bearer <token>'."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--file", required=True, help="Archivo generado por export_gate_file.")
+        parser.add_argument("--journal", required=True)
+        parser.add_argument("--host", default="0.0.0.0")
+        parser.add_argument("--port", type=int, default=8765)
+        parser.add_argument("--no-fsync", action="store_true", help="No hace fsync por quema.")
+        parser.add_argument(
+            "--token", default=os.environ.get("GATE_VALIDATOR_TOKEN", ""),
+            help="Token compartido con los escáneres (por defecto GATE_VALIDATOR_TOKEN).",
+        )
+
+    def handle(self, *args, **opts):
+        token = opts["token"].encode()
+        if not token:
+            raise CommandError("Falta --token (o GATE_VALIDATOR_TOKEN): cualquiera en la red podría quemar tickets.")
+        validador = GateValidator(opts["file"], opts["journal"], fsync=not opts["no_fsync"])
+
+        class Handler(BaseHTTPRequestHandler):
+            def _responder(self, status, data):
+                body = json.dumps(data).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _autorizado(self):
+                enviado = self.headers.get("Authorization", "").removeprefix("Bearer ").strip().encode()
+                if hmac.compare_digest(enviado, token):
+                    return True
+                self._responder(401, {"ok": False, "error": "UNAUTHORIZED"})
+                return False
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/health":
+                    return self._responder(200, {"ok": True})
+                if not self._autorizado():
+                    return
+                if url.path == "/validate":
+                    return self._validar(parse_qs(url.query).get("code", [""])[0])
+                self._responder(404, {"ok": False, "error": "NOT_FOUND"})
+
+            def do_POST(self):
+                url = urlparse(self.path)
+                if not self._autorizado():
+                    return
+                if url.path.startswith("/validate/"):
+                    return self._validar(url.path[len("/validate/"):])
+                self._responder(404, {"ok": False, "error": "NOT_FOUND"})
+
+            def _validar(self, raw):
+                result, note = validador.validar(raw)
+                data = {"ok": result == "OK", "result": result}
+                if note:
+                    data["error"] = note
+                self._responder(STATUS[result], data)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((opts["host"], opts["port"]), Handler)
+        self.stdout.write(f"Validador de puerta evento {validador.evento_id} en {opts['host']}:{opts['port']}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            validador.close()
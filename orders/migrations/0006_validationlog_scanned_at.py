@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_promocode_sharedpurchasecode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='validationlog',
+            name='scanned_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_ticket_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TicketEntrada',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dia', models.DateField()),
+                ('entradas', models.PositiveIntegerField(default=1)),
+                ('primera_at', models.DateTimeField()),
+                ('ultima_at', models.DateTimeField()),
+                ('ticket', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='entradas', to='orders.ticket')),
+            ],
+            options={
+                'unique_together': {('ticket', 'dia')},
+            },
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:40
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0003_remove_evento_banner_url_evento_banner'),
+        ('orders', '0008_ticketentrada'),
+        ('tickets', '0004_tipoticket_inventario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reserva',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grupo', models.UUIDField(db_index=True)),
+                ('cantidad', models.PositiveIntegerField()),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('evento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='events.evento')),
+                ('tipo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservas', to='tickets.tipoticket')),
+            ],
+        ),
+    ]
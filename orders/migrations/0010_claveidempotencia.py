@@ -0,0 +1,28 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_reserva'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClaveIdempotencia',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ambito', models.CharField(max_length=20)),
+                ('clave', models.CharField(max_length=128)),
+                ('huella', models.CharField(blank=True, max_length=64)),
+                ('status', models.PositiveSmallIntegerField(null=True)),
+                ('respuesta', models.JSONField(null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+            options={
+                'unique_together': {('ambito', 'clave')},
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0004_evento_sala_espera'),
+        ('orders', '0010_claveidempotencia'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TransaccionWebpay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64, unique=True)),
+                ('buy_order', models.CharField(max_length=26)),
+                ('monto', models.PositiveIntegerField()),
+                ('payload', models.JSONField()),
+                ('buyer', models.JSONField()),
+                ('estado', models.CharField(choices=[('creada', 'En Webpay'), ('recibida', 'Recibida'), ('procesando', 'Procesando'), ('pagada', 'Pagada'), ('rechazada', 'Rechazada'), ('fallida', 'Fallida')], default='creada', max_length=12)),
+                ('intentos', models.PositiveSmallIntegerField(default=0)),
+                ('resultado', models.JSONField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('evento', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transacciones_webpay', to='events.evento')),
+                ('orden', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='orders.orden')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['estado', 'updated_at'], name='orders_tran_estado_3956a5_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:00
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0004_evento_sala_espera'),
+        ('orders', '0011_transaccionwebpay'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Pago',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64, unique=True)),
+                ('buy_order', models.CharField(db_index=True, max_length=26)),
+                ('monto', models.PositiveIntegerField()),
+                ('authorization_code', models.CharField(blank=True, max_length=12)),
+                ('card_last4', models.CharField(blank=True, max_length=4)),
+                ('status', models.CharField(max_length=20)),
+                ('transaction_date', models.DateTimeField(blank=True, null=True)),
+                ('conciliacion', models.CharField(choices=[('pendiente', 'Pendiente'), ('ok', 'Cuadra'), ('diferencia', 'Con diferencias'), ('faltante', 'No está en Transbank')], default='pendiente', max_length=10)),
+                ('conciliacion_detalle', models.CharField(blank=True, max_length=255)),
+                ('conciliado_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('evento', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='pagos', to='events.evento')),
+                ('orden', models.OneToOneField(on_delete=django.db.models.deletion.PROTECT, related_name='pago', to='orders.orden')),
+            ],
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_profile_cargo_profile_comuna_profile_empresa_and_more'),
+        ('events', '0004_evento_sala_espera'),
+        ('orders', '0013_montos_congelados'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='orden',
+            index=models.Index(fields=['cuenta', '-created_at', '-id'], name='orden_cuenta_cursor_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='orden',
+            index=models.Index(fields=['evento', '-created_at', '-id'], name='orden_evento_cursor_idx'),
+        ),
+    ]
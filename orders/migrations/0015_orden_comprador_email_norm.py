@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:04
+
+from django.db import migrations, models
+from django.db.models.functions import Lower, Trim
+
+
+def normalizar_emails(apps, schema_editor):
+    Orden = apps.get_model("orders", "Orden")
+    Orden.objects.update(comprador_email_norm=Lower(Trim("comprador_email")))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_profile_cargo_profile_comuna_profile_empresa_and_more'),
+        ('events', '0004_evento_sala_espera'),
+        ('orders', '0014_orden_cursor_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='orden',
+            name='comprador_email_norm',
+            field=models.CharField(default='', editable=False, max_length=254),
+        ),
+        migrations.AddIndex(
+            model_name='orden',
+            index=models.Index(fields=['cuenta', 'comprador_email_norm'], name='orden_cuenta_email_idx'),
+        ),
+        migrations.RunPython(normalizar_emails, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 14:42
+
+from django.db import migrations, models
+from django.db.models.functions import Trim, Upper
+
+
+def normalizar_codigos(apps, schema_editor):
+    PromoCode = apps.get_model("orders", "PromoCode")
+    PromoCode.objects.update(codigo_norm=Upper(Trim("codigo")))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_profile_cargo_profile_comuna_profile_empresa_and_more'),
+        ('events', '0004_evento_sala_espera'),
+        ('orders', '0016_ticket_created_at_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='promocode',
+            name='codigo_norm',
+            field=models.CharField(default='', editable=False, max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='promocode',
+            index=models.Index(fields=['evento', 'codigo_norm'], name='orders_prom_evento__39ace8_idx'),
+        ),
+        migrations.RunPython(normalizar_codigos, migrations.RunPython.noop),
+    ]
@@ -13,14 +13,31 @@ class Orden(models.Model):
     cuenta = models.ForeignKey(Cuenta, on_delete=models.CASCADE, related_name="ordenes")
     evento = models.ForeignKey(Evento, on_delete=models.PROTECT, related_name="ordenes")
     comprador_email = models.EmailField()
+    # email en minúsculas: búsqueda por prefijo con índice (orders.services.busqueda_ordenes)
+    comprador_email_norm = models.CharField(max_length=254, editable=False, default="")
+    # Montos congelados al comprar (orders.services.montos). NULL: orden
+    # anterior a estos campos, pendiente de backfill_order_totals.
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    descuento = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    total = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
         ordering = ("-created_at",)
+        # Paginación por cursor de los listados (orders.services.paginacion)
+        indexes = [
+            models.Index(fields=["cuenta", "-created_at", "-id"], name="orden_cuenta_cursor_idx"),
+            models.Index(fields=["evento", "-created_at", "-id"], name="orden_evento_cursor_idx"),
+            models.Index(fields=["cuenta", "comprador_email_norm"], name="orden_cuenta_email_idx"),
+        ]
 
     def __str__(self):
         return f"Orden #{self.id} · {self.evento.nombre}"
 
+    def save(self, *args, **kwargs):
+        self.comprador_email_norm = (self.comprador_email or "").strip().lower()
+        super().save(*args, **kwargs)
+
 class Ticket(models.Model):
     orden = models.ForeignKey(Orden, on_delete=models.CASCADE, related_name="tickets")
     evento = models.ForeignKey(Evento, on_delete=models.PROTECT, related_name="tickets")
@@ -30,10 +47,15 @@ class Ticket(models.Model):
     estado = models.CharField(max_length=20, choices=ESTADO_TICKET, default="disponible")
     used_at = models.DateTimeField(null=True, blank=True)
     asistente_email = models.EmailField(blank=True)
+    # Precio de lista al comprar, parte del descuento de la orden y neto
+    precio = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    descuento = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    neto = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
     replaced_by = models.OneToOneField("self",null=True,blank=True,on_delete=models.SET_NULL,related_name="replaces",
 )
 
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)  # refresco del filtro de códigos
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)  # cursor de sincronización de puertas
 
     def save(self, *args, **kwargs):
         if not self.code:
@@ -44,6 +66,124 @@ class Ticket(models.Model):
         return f"{self.tipo.nombre} · {self.code}"
 
 
+class TicketEntrada(models.Model):
+    """Ingresos por ticket y día: permite validar reingresos y abonos multi-día sin recorrer ValidationLog."""
+    ticket = models.ForeignKey(Ticket, on_delete=models.CASCADE, related_name="entradas")
+    dia = models.DateField()
+    entradas = models.PositiveIntegerField(default=1)
+    primera_at = models.DateTimeField()
+    ultima_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("ticket", "dia")
+
+    def __str__(self):
+        return f"Ticket #{self.ticket_id} · {self.dia} · {self.entradas}"
+
+
+class Reserva(models.Model):
+    """
+    Stock retenido mientras el comprador paga en Webpay. Una fila por tipo;
+    las filas de un mismo checkout comparten `grupo`. Se convierten en
+    tickets al confirmar el pago o se borran al vencer (expire_checkout_holds).
+    """
+    grupo = models.UUIDField(db_index=True)
+    evento = models.ForeignKey(Evento, on_delete=models.CASCADE, related_name="reservas")
+    tipo = models.ForeignKey(TipoTicket, on_delete=models.CASCADE, related_name="reservas")
+    cantidad = models.PositiveIntegerField()
+    expires_at = models.DateTimeField(db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Reserva {self.grupo} · {self.tipo_id} x{self.cantidad}"
+
+
+class ClaveIdempotencia(models.Model):
+    """
+    Primer resultado de una operación de checkout (orders.services.idempotencia).
+    ambito: "api-checkout" (header Idempotency-Key) o "webpay" (token_ws).
+    """
+    ambito = models.CharField(max_length=20)
+    clave = models.CharField(max_length=128)
+    huella = models.CharField(max_length=64, blank=True)  # sha256 del request
+    status = models.PositiveSmallIntegerField(null=True)
+    respuesta = models.JSONField(null=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        unique_together = ("ambito", "clave")
+
+    def __str__(self):
+        return f"{self.ambito}:{self.clave} → {self.status}"
+
+
+class TransaccionWebpay(models.Model):
+    """
+    Pago Webpay en curso. La crea public_checkout_pay con el carrito y el
+    comprador (antes vivían sólo en la sesión); webpay_return la marca
+    "recibida" y el worker process_webpay_commits hace el commit y crea la
+    orden (orders.services.pagos_webpay).
+    """
+    ESTADOS = (
+        ("creada", "En Webpay"),
+        ("recibida", "Recibida"),
+        ("procesando", "Procesando"),
+        ("pagada", "Pagada"),
+        ("rechazada", "Rechazada"),
+        ("fallida", "Fallida"),
+    )
+
+    token = models.CharField(max_length=64, unique=True)
+    evento = models.ForeignKey(Evento, on_delete=models.CASCADE, related_name="transacciones_webpay")
+    buy_order = models.CharField(max_length=26)
+    monto = models.PositiveIntegerField()
+    payload = models.JSONField()
+    buyer = models.JSONField()
+    estado = models.CharField(max_length=12, choices=ESTADOS, default="creada")
+    intentos = models.PositiveSmallIntegerField(default=0)
+    resultado = models.JSONField(null=True, blank=True)  # {"reason", "detail"} si no se pagó
+    orden = models.ForeignKey("Orden", null=True, blank=True, on_delete=models.SET_NULL, related_name="+")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["estado", "updated_at"])]
+
+    def __str__(self):
+        return f"Webpay {self.buy_order} · {self.estado}"
+
+
+class Pago(models.Model):
+    """
+    Libro de pagos: una fila por pago autorizado, escrita en la misma
+    transacción que la Orden. El comando reconcile_payments la compara con
+    el export de Transbank y deja el resultado en `conciliacion`.
+    """
+    CONCILIACION = (
+        ("pendiente", "Pendiente"),
+        ("ok", "Cuadra"),
+        ("diferencia", "Con diferencias"),
+        ("faltante", "No está en Transbank"),
+    )
+
+    orden = models.OneToOneField(Orden, on_delete=models.PROTECT, related_name="pago")
+    evento = models.ForeignKey(Evento, on_delete=models.PROTECT, related_name="pagos")
+    token = models.CharField(max_length=64, unique=True)
+    buy_order = models.CharField(max_length=26, db_index=True)
+    monto = models.PositiveIntegerField()
+    authorization_code = models.CharField(max_length=12, blank=True)
+    card_last4 = models.CharField(max_length=4, blank=True)
+    status = models.CharField(max_length=20)  # status de Transbank al confirmar
+    transaction_date = models.DateTimeField(null=True, blank=True)
+    conciliacion = models.CharField(max_length=10, choices=CONCILIACION, default="pendiente")
+    conciliacion_detalle = models.CharField(max_length=255, blank=True)
+    conciliado_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Pago {self.buy_order} · ${self.monto} · {self.status}"
+
+
 class TicketActionLog(models.Model):
     ticket = models.ForeignKey("Ticket", related_name="action_logs", on_delete=models.CASCADE)
     action = models.CharField(max_length=30)  # "anular" | "reemitir" | "reenviar"
@@ -103,6 +243,7 @@ class ValidationLog(models.Model):
     note = models.CharField(max_length=160, blank=True)
     ip = models.GenericIPAddressField(null=True, blank=True)
     user_agent = models.TextField(blank=True)
+    scanned_at = models.DateTimeField(null=True, blank=True)  # hora de lectura informada por el escáner
     created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
@@ -118,6 +259,8 @@ class PromoCode(models.Model):
     cuenta = models.ForeignKey("accounts.Cuenta", on_delete=models.CASCADE, related_name="promocodes")
     evento = models.ForeignKey("events.Evento", on_delete=models.CASCADE, related_name="promocodes")
     codigo = models.CharField(max_length=50, unique=True)
+    # codigo en mayúsculas (como DiscountCode.codigo_norm): búsqueda exacta por índice
+    codigo_norm = models.CharField(max_length=50, editable=False, default="")
     tipo = models.CharField(max_length=10, choices=TIPOS)
     valor = models.PositiveIntegerField(help_text="Porcentaje o monto fijo en CLP según tipo.")
     usos_maximos = models.PositiveIntegerField(default=1)
@@ -126,9 +269,16 @@ class PromoCode(models.Model):
     valido_desde = models.DateField(null=True, blank=True)
     valido_hasta = models.DateField(null=True, blank=True)
 
+    class Meta:
+        indexes = [models.Index(fields=["evento", "codigo_norm"])]
+
     def __str__(self):
         return f"{self.codigo} ({self.evento.nombre})"
 
+    def save(self, *args, **kwargs):
+        self.codigo_norm = (self.codigo or "").strip().upper()
+        super().save(*args, **kwargs)
+
     @property
     def disponible(self):
         """Retorna True si puede usarse."""
@@ -144,9 +294,13 @@ class PromoCode(models.Model):
         return True
 
     def registrar_uso(self):
-        """Incrementa usos cuando una orden pagada lo aplica."""
-        self.usos_actuales = models.F('usos_actuales') + 1
-        self.save(update_fields=['usos_actuales'])
+        """
+        Toma un uso con un UPDATE condicional: compradores concurrentes no
+        pasan de usos_maximos. False si ya no quedaba cupo.
+        """
+        return PromoCode.objects.filter(
+            pk=self.pk, usos_actuales__lt=models.F('usos_maximos')
+        ).update(usos_actuales=models.F('usos_actuales') + 1) == 1
 
 def generate_shared_code():
     return str(uuid.uuid4())
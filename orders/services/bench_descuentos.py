@@ -0,0 +1,113 @@
+# orders/services/bench_descuentos.py
+"""
+Benchmark de consumo de un DiscountCode muy usado (comando bench_discounts).
+
+Cada "checkout" abre una transacción, consume un uso del código y la
+mantiene abierta retencion_ms (el resto del checkout: orden, tickets, stock)
+antes del commit, que es cuando se suelta el lock. Compara:
+
+    fila        select_for_update sobre DiscountCode + F("usos_actuales") + 1
+    repartido   cupos_descuento.consumir (ContadorDescuento)
+
+con 1..N workers. En MySQL/Postgres "fila" queda plano al sumar workers y
+"repartido" escala hasta DISCOUNT_COUNTER_SHARDS. SQLite serializa toda
+escritura, así que ahí sólo sirve para verificar que no se excede el cupo.
+"""
+import threading
+import time
+import uuid
+
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F
+
+from accounts.models import Cuenta
+from events.models import Evento
+from orders.services import cupos_descuento
+from tickets.models import DiscountCode
+
+
+ETIQUETA = "bench-discounts"
+
+
+def sembrar(usos_maximos):
+    sufijo = uuid.uuid4().hex[:8]
+    cuenta = Cuenta.objects.create(nombre=f"{ETIQUETA}-{sufijo}")
+    evento = Evento.objects.create(cuenta=cuenta, nombre=f"{ETIQUETA}-{sufijo}", estado="activo")
+    codigo = DiscountCode.objects.create(
+        cuenta=cuenta, evento=evento, nombre="Bench", codigo=f"BENCH-{sufijo}".upper(),
+        monto_descuento=1000, usos_maximos=usos_maximos,
+    )
+    cupos_descuento.redimensionar(codigo)
+    return {"cuenta": cuenta, "evento": evento, "codigo": codigo}
+
+
+def _consumir_fila(codigo_id):
+    d = DiscountCode.objects.select_for_update().get(pk=codigo_id)
+    if d.usos_actuales >= d.usos_maximos:
+        return False
+    DiscountCode.objects.filter(pk=codigo_id).update(usos_actuales=F("usos_actuales") + 1)
+    return True
+
+
+def medir(datos, modo, workers, checkouts, retencion_ms=5):
+    """Corre `checkouts` consumos repartidos en `workers` hilos. Retorna métricas."""
+    codigo = datos["codigo"]
+    ok = []
+    lock = threading.Lock()
+    barrera = threading.Barrier(workers)
+
+    def worker(n):
+        tomados = errores = 0
+        try:
+            barrera.wait()
+            for _ in range(n):
+                try:
+                    with transaction.atomic():
+                        if modo == "fila":
+                            tomado = _consumir_fila(codigo.id)
+                        else:
+                            tomado = cupos_descuento.consumir(codigo)
+                        time.sleep(retencion_ms / 1000)
+                except DatabaseError:
+                    # Deadlock / lock wait timeout (en SQLite, "database is locked")
+                    errores += 1
+                    continue
+                tomados += tomado
+        finally:
+            connection.close()
+            with lock:
+                ok.append((tomados, errores))
+
+    por_worker = [checkouts // workers + (1 if i < checkouts % workers else 0) for i in range(workers)]
+    hilos = [threading.Thread(target=worker, args=(n,)) for n in por_worker]
+    inicio = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    segundos = time.perf_counter() - inicio
+
+    return {
+        "modo": modo,
+        "workers": workers,
+        "checkouts": checkouts,
+        "consumidos": sum(t for t, _ in ok),
+        "errores": sum(e for _, e in ok),
+        "segundos": round(segundos, 3),
+        "checkouts_por_segundo": round(checkouts / segundos, 1) if segundos else None,
+    }
+
+
+def reiniciar(datos):
+    """Deja el código sin usos para la siguiente medición."""
+    codigo = datos["codigo"]
+    DiscountCode.objects.filter(pk=codigo.id).update(usos_actuales=0)
+    codigo.contadores.all().delete()
+    codigo.usos_actuales = 0
+    cupos_descuento.redimensionar(codigo)
+
+
+def limpiar(datos):
+    datos["codigo"].delete()
+    datos["evento"].delete()
+    datos["cuenta"].delete()
@@ -0,0 +1,203 @@
+# orders/services/bench_puertas.py
+"""
+Simulador de carga de puertas contra validate_ticket (comando bench_gates).
+
+Siembra una cuenta de prueba con un evento de N tickets (y otra cuenta con
+tickets "ajenos"), arma una mezcla de lecturas y la reparte entre M puertas
+concurrentes, cada una con su propio cliente y conexión a la base:
+
+    valido      primera lectura de un ticket del evento
+    repetido    un ticket ya leído (ALREADY_USED)
+    falsificado QR firmado con la firma alterada (BAD_SIGNATURE)
+    ajeno       ticket de otra cuenta (cross-tenant)
+
+Mide latencia y consultas SQL por lectura. Corre contra la base configurada
+en DATABASES (SQLite local, MySQL o Postgres según los settings).
+"""
+import logging
+import random
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from accounts.models import Cuenta, User, UsuarioRol
+from events.models import Evento
+from orders.models import AccessPoint, Orden, Ticket
+from orders.services import qr_firma
+from tickets.models import TipoTicket
+
+
+MEZCLA = {"valido": 0.80, "repetido": 0.10, "falsificado": 0.05, "ajeno": 0.05}
+ETIQUETA = "bench-gates"
+
+
+def _sembrar_cuenta(nombre, n, n_puertas=0):
+    cuenta = Cuenta.objects.create(nombre=nombre)
+    evento = Evento.objects.create(cuenta=cuenta, nombre=nombre, estado="activo")
+    tipo = TipoTicket.objects.create(evento=evento, nombre="General", precio=0)
+    orden = Orden.objects.create(cuenta=cuenta, evento=evento, comprador_email=f"{ETIQUETA}@test.cl")
+    tickets = Ticket.objects.bulk_create(
+        [Ticket(orden=orden, evento=evento, tipo=tipo) for _ in range(n)], batch_size=1000
+    )
+    aps = [AccessPoint.objects.create(cuenta=cuenta, nombre=f"Puerta {i + 1}") for i in range(n_puertas)]
+    return cuenta, evento, tipo, tickets, aps
+
+
+def sembrar(n_tickets, n_puertas):
+    """Crea los datos del benchmark. Retorna un dict con todo lo necesario."""
+    sufijo = uuid.uuid4().hex[:8]
+    cuenta, evento, _, tickets, aps = _sembrar_cuenta(f"{ETIQUETA}-{sufijo}", n_tickets, n_puertas)
+    ajena, _, _, ajenos, _ = _sembrar_cuenta(f"{ETIQUETA}-ajena-{sufijo}", max(n_tickets // 20, 10))
+
+    user = User.objects.create_user(email=f"{ETIQUETA}-{sufijo}@test.cl", password=uuid.uuid4().hex)
+    UsuarioRol.objects.create(usuario=user, cuenta=cuenta, rol="staff")
+
+    return {
+        "cuentas": [cuenta, ajena],
+        "cuenta": cuenta,
+        "evento": evento,
+        "user": user,
+        "aps": aps,
+        "tickets": tickets,
+        "ajenos": ajenos,
+    }
+
+
+def _payload(ticket, signed):
+    return qr_firma.payload_qr(ticket) if signed else str(ticket.code)
+
+
+def armar_lecturas(datos, n_lecturas, signed=True, semilla=None):
+    """Lista de (tipo, payload) con la MEZCLA indicada."""
+    rnd = random.Random(semilla)
+    disponibles = list(datos["tickets"])
+    rnd.shuffle(disponibles)
+    leidos = []
+    lecturas = []
+
+    tipos, pesos = zip(*MEZCLA.items())
+    for _ in range(n_lecturas):
+        tipo = rnd.choices(tipos, pesos)[0]
+        if tipo == "repetido" and not leidos:
+            tipo = "valido"
+        if tipo == "valido" and not disponibles:
+            tipo = "repetido"
+
+        if tipo == "valido":
+            t = disponibles.pop()
+            leidos.append(t)
+            payload = _payload(t, signed)
+        elif tipo == "repetido":
+            payload = _payload(rnd.choice(leidos), signed)
+        elif tipo == "falsificado":
+            p = qr_firma.payload_qr(rnd.choice(datos["tickets"]))
+            payload = p[:-1] + ("A" if p[-1] != "A" else "B")
+        else:
+            payload = _payload(rnd.choice(datos["ajenos"]), signed)
+        lecturas.append((tipo, payload))
+    return lecturas
+
+
+def _percentil(valores, p):
+    if not valores:
+        return None
+    orden = sorted(valores)
+    return orden[min(len(orden) - 1, max(0, round(p / 100 * len(orden)) - 1))]
+
+
+def simular(datos, lecturas, n_puertas):
+    """
+    Reparte las lecturas entre n_puertas hilos que postean a validate_ticket.
+    Retorna (mediciones, segundos) con mediciones = [(tipo, status, ms, consultas)].
+    """
+    cuenta = datos["cuenta"]
+    aps = datos["aps"]
+    mediciones = []
+    lock = threading.Lock()
+
+    clientes = []
+    for i in range(n_puertas):
+        c = Client()
+        c.force_login(datos["user"])
+        session = c.session
+        session["cuenta_id"] = str(cuenta.id)
+        session.save()
+        clientes.append((c, aps[i].id if i < len(aps) else None))
+
+    barrera = threading.Barrier(n_puertas)
+
+    def puerta(i):
+        c, ap_id = clientes[i]
+        post = {"evento_id": datos["evento"].id}
+        if ap_id:
+            post["access_point_id"] = ap_id
+        propias = []
+        try:
+            barrera.wait()
+            for tipo, payload in lecturas[i::n_puertas]:
+                url = reverse("orders:validate", args=[payload])
+                with CaptureQueriesContext(connection) as ctx:
+                    inicio = time.perf_counter()
+                    r = c.post(url, post)
+                    ms = (time.perf_counter() - inicio) * 1000
+                propias.append((tipo, r.status_code, ms, len(ctx.captured_queries)))
+        finally:
+            connection.close()
+            with lock:
+                mediciones.extend(propias)
+
+    # Los 403/404/409 son parte de la mezcla: no ensuciar la salida con ellos
+    log_request = logging.getLogger("django.request")
+    nivel = log_request.level
+    log_request.setLevel(logging.ERROR)
+    with override_settings(ALLOWED_HOSTS=["testserver"]):
+        hilos = [threading.Thread(target=puerta, args=(i,)) for i in range(n_puertas)]
+        inicio = time.perf_counter()
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+        total_s = time.perf_counter() - inicio
+    log_request.setLevel(nivel)
+
+    return mediciones, total_s
+
+
+def reporte(mediciones, total_s):
+    """Resumen global y por tipo de lectura."""
+    def resumir(filas):
+        ms = [m[2] for m in filas]
+        return {
+            "lecturas": len(filas),
+            "p50_ms": _percentil(ms, 50),
+            "p95_ms": _percentil(ms, 95),
+            "p99_ms": _percentil(ms, 99),
+            "consultas_por_lectura": round(sum(m[3] for m in filas) / len(filas), 2) if filas else 0,
+            "status": dict(Counter(m[1] for m in filas)),
+        }
+
+    por_tipo = defaultdict(list)
+    for m in mediciones:
+        por_tipo[m[0]].append(m)
+
+    data = resumir(mediciones)
+    data["segundos"] = round(total_s, 3)
+    data["lecturas_por_segundo"] = round(len(mediciones) / total_s, 1) if total_s else None
+    data["por_tipo"] = {tipo: resumir(filas) for tipo, filas in sorted(por_tipo.items())}
+    return data
+
+
+def limpiar(datos):
+    for cuenta in datos["cuentas"]:
+        # Evento.cuenta es PROTECT: se borra de las hojas hacia la cuenta
+        Ticket.objects.filter(evento__cuenta=cuenta).delete()
+        Orden.objects.filter(cuenta=cuenta).delete()
+        Evento.objects.filter(cuenta=cuenta).delete()
+        cuenta.delete()
+    datos["user"].delete()
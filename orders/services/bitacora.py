@@ -0,0 +1,241 @@
+# orders/services/bitacora.py
+"""
+Escritura de ValidationLog.
+
+Modo "sync" (por defecto): un INSERT por validación, como siempre.
+
+Modo "buffered": cada registro se agrega primero a un archivo spool local
+(una línea JSON, con flush al sistema operativo) y luego a un buffer en
+memoria. El buffer se vacía con un solo bulk_create al llegar a
+VALIDATION_LOG_BUFFER_SIZE registros o cada VALIDATION_LOG_FLUSH_SECONDS.
+Si el worker muere antes de vaciar, el spool queda en disco y el comando
+`flush_validation_logs` lo recupera (entrega al menos una vez).
+
+Cada spool tiene nombre único (pid, un id aleatorio del sink y secuencia) y
+se crea en modo exclusivo: un worker nuevo que reusa el PID de uno muerto
+nunca escribe en su archivo. El worker mantiene un flock sobre su spool
+activo; el lock se libera solo cuando el proceso muere, así la
+recuperación sabe qué archivos tienen dueño sin mirar PIDs.
+"""
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connection
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from orders.models import ValidationLog
+
+try:
+    import fcntl
+except ImportError:  # Windows (desarrollo): sin flock
+    fcntl = None
+
+
+logger = logging.getLogger(__name__)
+
+CAMPOS = ("cuenta_id", "evento_id", "ticket_id", "access_point_id", "usuario_id",
+          "result", "note", "ip", "user_agent", "scanned_at")
+
+
+def _modo():
+    return getattr(settings, "VALIDATION_LOG_MODE", "sync")
+
+
+def _spool_dir():
+    return Path(getattr(settings, "VALIDATION_LOG_SPOOL_DIR", Path(settings.BASE_DIR) / "var" / "validation_log_spool"))
+
+
+def _normalizar(campos):
+    """Recorta el user agent y fija scanned_at a la hora de la lectura."""
+    ua_max = getattr(settings, "VALIDATION_LOG_UA_MAX", 255)
+    data = {k: campos.get(k) for k in CAMPOS}
+    data["note"] = data["note"] or ""
+    data["user_agent"] = (data["user_agent"] or "")[:ua_max]
+    data["scanned_at"] = data["scanned_at"] or timezone.now()
+    return data
+
+
+def _a_modelo(data):
+    return ValidationLog(**data)
+
+
+def _a_json(data):
+    d = dict(data)
+    d["scanned_at"] = d["scanned_at"].isoformat()
+    return json.dumps(d, default=str)
+
+
+def _desde_json(linea):
+    d = json.loads(linea)
+    d["scanned_at"] = parse_datetime(d["scanned_at"]) if d.get("scanned_at") else None
+    return _normalizar(d)
+
+
+class BufferedLogSink:
+    """Buffer en memoria por proceso con respaldo durable en un spool."""
+
+    def __init__(self, size, flush_seconds, spool_dir):
+        self.size = size
+        self.flush_seconds = flush_seconds
+        self.spool_dir = Path(spool_dir)
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._id = f"{os.getpid()}-{uuid.uuid4().hex[:12]}"
+        self._seq = 0
+        self._ultimo_flush = time.monotonic()
+        self._spool = None
+        self._timer = None
+
+    # --- spool ---
+    def _spool_path(self):
+        return self.spool_dir / f"{self._id}-{self._seq}.jsonl"
+
+    def _abrir_spool(self):
+        self.spool_dir.mkdir(parents=True, exist_ok=True)
+        self._spool = open(self._spool_path(), "x", encoding="utf-8")
+        if fcntl:
+            fcntl.flock(self._spool, fcntl.LOCK_EX | fcntl.LOCK_NB)
+
+    def _arrancar_timer(self):
+        if self._timer is None:
+            self._timer = threading.Thread(target=self._loop, name="validation-log-flush", daemon=True)
+            self._timer.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            if time.monotonic() - self._ultimo_flush >= self.flush_seconds:
+                try:
+                    self.flush()
+                finally:
+                    connection.close()
+
+    # --- API ---
+    def agregar(self, registros):
+        lleno = False
+        with self._lock:
+            if self._spool is None:
+                self._abrir_spool()
+                self._arrancar_timer()
+            for data in registros:
+                self._spool.write(_a_json(data) + "\n")
+            self._spool.flush()
+            self._buffer.extend(registros)
+            lleno = len(self._buffer) >= self.size
+        if lleno:
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            if not self._buffer:
+                return 0
+            pendientes, self._buffer = self._buffer, []
+            self._spool.close()
+            en_vuelo = self._spool_path().with_suffix(".flushing")
+            os.replace(self._spool_path(), en_vuelo)
+            self._seq += 1
+            self._abrir_spool()
+            self._ultimo_flush = time.monotonic()
+
+        try:
+            ValidationLog.objects.bulk_create([_a_modelo(d) for d in pendientes])
+        except Exception:
+            # El archivo .flushing queda para flush_validation_logs
+            logger.exception("No se pudo vaciar el buffer de ValidationLog (%s registros)", len(pendientes))
+            return 0
+        en_vuelo.unlink(missing_ok=True)
+        return len(pendientes)
+
+
+_sink = None
+_sink_lock = threading.Lock()
+
+
+def _get_sink():
+    global _sink
+    with _sink_lock:
+        if _sink is None:
+            _sink = BufferedLogSink(
+                size=getattr(settings, "VALIDATION_LOG_BUFFER_SIZE", 200),
+                flush_seconds=getattr(settings, "VALIDATION_LOG_FLUSH_SECONDS", 2),
+                spool_dir=_spool_dir(),
+            )
+            atexit.register(_sink.flush)
+        return _sink
+
+
+def registrar_validaciones(registros):
+    """
+    Registra una o varias validaciones.
+    registros: lista de dicts con las claves de CAMPOS (ids, no instancias).
+    """
+    datos = [_normalizar(r) for r in registros]
+    if not datos:
+        return
+    if _modo() == "buffered":
+        _get_sink().agregar(datos)
+    elif len(datos) == 1:
+        ValidationLog.objects.create(**datos[0])
+    else:
+        ValidationLog.objects.bulk_create([_a_modelo(d) for d in datos])
+
+
+def registrar_validacion(**campos):
+    registrar_validaciones([campos])
+
+
+def _con_dueno(path):
+    """True si un proceso vivo tiene el flock del spool (su archivo activo)."""
+    if fcntl is None:
+        return False
+    with open(path, "rb") as fh:
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return True
+        fcntl.flock(fh, fcntl.LOCK_UN)
+        return False
+
+
+def recuperar_spool(spool_dir=None, min_age_seconds=300):
+    """
+    Inserta los registros de archivos spool huérfanos sin modificar hace más
+    de min_age_seconds: los .jsonl que ningún proceso tiene bloqueados
+    (worker muerto) y los .flushing cuyo bulk_create falló. El spool activo
+    de un worker vivo nunca se toca. Retorna la cantidad de registros
+    recuperados.
+    """
+    spool_dir = Path(spool_dir or _spool_dir())
+    if not spool_dir.exists():
+        return 0
+
+    limite = time.time() - min_age_seconds
+    total = 0
+    for path in sorted(spool_dir.iterdir()):
+        if path.suffix not in (".jsonl", ".flushing"):
+            continue
+        if path.stat().st_mtime > limite or (path.suffix == ".jsonl" and _con_dueno(path)):
+            continue
+        with open(path, encoding="utf-8") as fh:
+            # Una última línea truncada (worker muerto a mitad de escritura) se descarta
+            datos = []
+            for linea in fh:
+                try:
+                    datos.append(_desde_json(linea))
+                except ValueError:
+                    logger.warning("Línea inválida en %s", path)
+        ValidationLog.objects.bulk_create([_a_modelo(d) for d in datos], batch_size=500)
+        try:
+            path.unlink()
+        except PermissionError:
+            continue  # Windows sin flock: spool activo (vacío) de un worker vivo
+        total += len(datos)
+    return total
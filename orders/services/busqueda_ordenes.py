@@ -0,0 +1,104 @@
+# orders/services/busqueda_ordenes.py
+"""
+Búsqueda de órdenes del listado.
+
+Antes: id__icontains | evento__nombre__icontains | comprador_email__icontains,
+un LIKE '%q%' sobre tres columnas con join: recorre todas las órdenes de la
+cuenta en cada búsqueda. Ahora el texto se enruta:
+
+  "123" o "#123"    id exacto (llave primaria)
+  con "@"           prefijo de comprador_email_norm, índice (cuenta, email)
+  otro texto        eventos de la cuenta cuyo nombre tiene palabras que
+                    empiezan con las del texto (índice en el cache, ver
+                    abajo) y, si es una sola palabra, también prefijo del
+                    email ("juan" encuentra juan.perez@...)
+
+El email se compara con istartswith sobre la columna ya en minúsculas: en
+MySQL startswith se traduce a LIKE BINARY, que con la collation de la
+columna no usa el índice; istartswith es un LIKE 'q%' normal.
+
+El índice de nombres de eventos es, por cuenta, la lista (evento_id,
+palabras normalizadas). Son pocos eventos por cuenta: se arma con una
+consulta, se cachea y orders.signals lo invalida al guardar o borrar un
+Evento. La invalidación sólo llega a los demás workers con CACHES
+compartido; si no, el índice vence tras ORDER_SEARCH_INDEX_TTL_SECONDS.
+Las órdenes se filtran después por evento_id, con el índice (evento,
+created_at, id) que usa la paginación.
+"""
+import re
+import unicodedata
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+
+from events.models import Evento
+
+
+_ID = re.compile(r"#?(\d{1,18})")
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes."""
+    sin_tildes = unicodedata.normalize("NFKD", texto or "").encode("ascii", "ignore").decode()
+    return sin_tildes.strip().lower()
+
+
+def _palabras(texto):
+    return re.findall(r"\w+", normalizar(texto))
+
+
+def _key(cuenta_id):
+    return f"busqueda:eventos:{cuenta_id}"
+
+
+def invalidar(cuenta_id):
+    cache.delete(_key(cuenta_id))
+
+
+def indice_eventos(cuenta_id):
+    """[(evento_id, [palabras del nombre]), ...] de la cuenta."""
+    indice = cache.get(_key(cuenta_id))
+    if indice is None:
+        indice = [
+            (pk, _palabras(nombre))
+            for pk, nombre in Evento.objects.filter(cuenta_id=cuenta_id).values_list("id", "nombre")
+        ]
+        cache.set(_key(cuenta_id), indice, getattr(settings, "ORDER_SEARCH_INDEX_TTL_SECONDS", 60))
+    return indice
+
+
+def eventos_por_nombre(cuenta_id, q):
+    """Ids de eventos en que cada palabra de q es prefijo de alguna palabra del nombre."""
+    buscadas = _palabras(q)
+    if not buscadas:
+        return []
+    return [
+        pk for pk, palabras in indice_eventos(cuenta_id)
+        if all(any(p.startswith(b) for p in palabras) for b in buscadas)
+    ]
+
+
+def filtrar(qs, cuenta_id, q, por_evento=True):
+    """
+    Aplica la búsqueda a un queryset de órdenes de la cuenta. Con
+    por_evento=False (listado de un solo evento) no se buscan nombres.
+    """
+    q = (q or "").strip()
+    if not q:
+        return qs
+
+    m = _ID.fullmatch(q)
+    if m:
+        return qs.filter(pk=int(m.group(1)))
+
+    email = q.lower()
+    if "@" in q:
+        return qs.filter(comprador_email_norm__istartswith=email)
+
+    filtro = Q(comprador_email_norm__istartswith=email) if " " not in q else Q(pk__in=[])
+    if por_evento:
+        ids = eventos_por_nombre(cuenta_id, q)
+        if ids:
+            filtro |= Q(evento_id__in=ids)
+    return qs.filter(filtro)
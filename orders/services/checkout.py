@@ -1,49 +1,19 @@
 # orders/services/checkout.py
-from django.apps import apps
 from django.db import transaction
 from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from django.db.models import F
-from orders.models import Orden, Ticket
+from orders.models import Orden, Pago
 from orders.models import SharedPurchaseCode
+from orders.services.emision import emitir_tickets
+from orders.services import codigos_promo, cupos_descuento, montos, precios, reservas
+from orders.services.inventario import tomar_stock
 #from tickets.models import Discount
-from tickets.models import TipoTicket
 
 from decimal import Decimal
 
 
-def _get_discount_model():
-    """
-    Devuelve el modelo de descuentos del app 'tickets'.
-    Primero intenta nombres comunes; si no, detecta por campos típicos.
-    """
-    # 1) nombres más comunes
-    for model_name in ('Discount', 'TicketDiscount', 'Descuento', 'PromoCode', 'Promo'):
-        try:
-            return apps.get_model('tickets', model_name)
-        except LookupError:
-            pass
-
-    # 2) autodetección por campos
-    try:
-        app = apps.get_app_config('tickets')
-    except LookupError:
-        return None
-
-    required = {'codigo', 'evento', 'tipo_ticket', 'monto_descuento',
-                'usos_actuales', 'usos_maximos', 'vigente_desde', 'vigente_hasta', 'activo'}
-    for model in app.get_models():
-        try:
-            field_names = {f.name for f in model._meta.get_fields()}
-        except Exception:
-            continue
-        if required.issubset(field_names):
-            return model
-
-    return None
-
-
-
-def crear_orden_y_tickets(*, evento, comprador_email, items, created_by=None, promo_code=None):
+def crear_orden_y_tickets(*, evento, comprador_email, items, created_by=None, promo_code=None, reserva=None):
     with transaction.atomic():
         orden = Orden.objects.create(
             cuenta=evento.cuenta,
@@ -51,34 +21,43 @@ def crear_orden_y_tickets(*, evento, comprador_email, items, created_by=None, pr
             comprador_email=comprador_email,
         )
 
-        tickets_creados = []
+        lineas = []
         for it in items:
-            tt = it["tipo_ticket"]
             cantidad = int(it["cantidad"])
             if cantidad <= 0 or cantidad > 10:
                 raise ValueError("Cantidad inválida para un tipo de ticket.")
-            for _ in range(cantidad):
-                tk = Ticket.objects.create(orden=orden, evento=evento, tipo=tt)
-                tickets_creados.append(tk)
+            lineas.append((it["tipo_ticket"], cantidad))
+
+        # Con reserva (checkout Webpay) el cupo ya está apartado
+        if reserva:
+            reservas.convertir(reserva, lineas)
+        else:
+            tomar_stock(lineas)
+        tickets_creados = emitir_tickets(orden, lineas)
 
-        _consumir_descuento(evento=evento, promo_code=promo_code)
+        d = _consumir_descuento(evento=evento, promo_code=promo_code, lineas=lineas)
+        if d:
+            montos.congelar(orden, tickets_creados, descuento=d.monto_descuento, tipo_ticket_id=d.tipo_ticket_id)
+        else:
+            montos.congelar(orden, tickets_creados)
 
         return orden, tickets_creados
 
 
 
-def _consumir_descuento(*, evento, promo_code):
+def _consumir_descuento(*, evento, promo_code, lineas=()):
+    """Consume un uso del código y retorna el descuento aplicado (o None)."""
     if not promo_code:
-        return
+        return None
 
-    Discount = _get_discount_model()
+    Discount = codigos_promo.modelo_descuento()
     if Discount is None:
         raise ValueError("No está configurado el modelo de descuentos.")
 
     hoy = timezone.now().date()
+    # Sin select_for_update: el cupo se descuenta en cupos_descuento.consumir
     d = (Discount.objects
-         .select_for_update()
-         .filter(evento=evento, codigo__iexact=promo_code, activo=True)
+         .filter(evento=evento, codigo_norm=codigos_promo.normalizar(promo_code), activo=True)
          .first())
 
     if not d:
@@ -87,11 +66,11 @@ def _consumir_descuento(*, evento, promo_code):
         raise ValueError("El código aún no está vigente.")
     if d.vigente_hasta and hoy > d.vigente_hasta:
         raise ValueError("El código ya no está vigente.")
-    if d.usos_maximos is not None and d.usos_actuales >= d.usos_maximos:
+    if d.tipo_ticket_id and not any(tipo.id == d.tipo_ticket_id for tipo, _ in lineas):
+        raise ValueError("Este código requiere un tipo de ticket específico en el carrito.")
+    if not cupos_descuento.consumir(d):
         raise ValueError("Este código ya fue utilizado o alcanzó su límite de usos.")
-
-    d.usos_actuales = F('usos_actuales') + 1
-    d.save(update_fields=['usos_actuales'])
+    return d
 
 
 
@@ -99,6 +78,21 @@ def _count_non_parking_tickets(orden):
     # Ajusta según tu modelo: asumiendo orden.tickets relaciona Ticket -> TipoTicket con flag is_parking
     return orden.tickets.filter(tipo__is_parking=False).count()
 
+def registrar_pago(orden, webpay_data):
+    """Fila del libro de pagos con lo que devolvió el commit de Webpay."""
+    return Pago.objects.create(
+        orden=orden,
+        evento_id=orden.evento_id,
+        token=webpay_data["token"],
+        buy_order=webpay_data.get("buy_order") or "",
+        monto=int(webpay_data.get("amount") or 0),
+        authorization_code=webpay_data.get("authorization_code") or "",
+        card_last4=(webpay_data.get("card_last4") or "")[-4:],
+        status=webpay_data.get("status") or "AUTHORIZED",
+        transaction_date=parse_datetime(webpay_data.get("transaction_date") or ""),
+    )
+
+
 def finalizar_pago_y_generar_codigo(*, evento, payload, buyer, webpay_data=None):
     """
     Se llama desde webpay_return después de que Webpay autoriza el pago.
@@ -119,29 +113,21 @@ def finalizar_pago_y_generar_codigo(*, evento, payload, buyer, webpay_data=None)
             "discount": <int>,
             "total": <int>,
             "promo_code": <str|None>,
+            "reserva": <uuid str|None>,   # grupo de Reserva creado al iniciar el pago
         }
     - buyer: dict con datos del comprador (al menos "email")
-    - webpay_data: dict con info de Webpay (token, authorization_code, etc.)
-      (por ahora la dejamos disponible por si luego quieres guardarla en la Orden)
+    - webpay_data: dict con info de Webpay (token, authorization_code, etc.);
+      si viene, queda una fila Pago junto a la orden
     """
 
-    # 1) Preparar items para crear la orden y los tickets
-    raw_items = payload.get("items", []) or []
-    items = []
-
-    for it in raw_items:
-        tipo_id = it.get("tipo_ticket_id")
-        cantidad = int(it.get("cantidad", 0) or 0)
-        if not tipo_id or cantidad <= 0:
-            continue
-
-        # Obtenemos el TipoTicket asociado a este evento
-        tipo = TipoTicket.objects.get(id=tipo_id, evento=evento)
-
-        items.append({
-            "tipo_ticket": tipo,
-            "cantidad": cantidad,
-        })
+    # 1) Items desde la tabla de precios del evento (en memoria, sin una
+    # consulta por ítem), con las mismas reglas que al cotizar: tipos del
+    # evento y activos, y el código válido para este carrito
+    promo_code = payload.get("promo_code")
+    cot = precios.cotizar(evento, payload.get("items", []) or [], promo_code)
+    if promo_code and cot["error_codigo"]:
+        raise ValueError(cot["error_codigo"])
+    items = [{"tipo_ticket": li["tipo"], "cantidad": li["cantidad"]} for li in cot["lineas"]]
 
     if not items:
         raise ValueError("No se encontraron ítems válidos en el payload para crear la orden.")
@@ -157,27 +143,18 @@ def finalizar_pago_y_generar_codigo(*, evento, payload, buyer, webpay_data=None)
     if not comprador_email:
         raise ValueError("No se encontró un email de comprador válido en 'buyer'.")
 
-    # 3) Crear la orden y los tickets (aplicando descuento si corresponde)
-    promo_code = payload.get("promo_code")
-    orden, tickets = crear_orden_y_tickets(
-        evento=evento,
-        comprador_email=comprador_email,
-        items=items,
-        promo_code=promo_code,
-    )
-
-    # 4) (Opcional) guardar datos de Webpay en la orden
-    #    Como tu modelo Orden actual no tiene campos para esto,
-    #    por ahora lo dejamos comentado. Si luego agregas campos, se puede usar.
-    #
-    # orden.webpay_token = webpay_data.get("token")
-    # orden.webpay_buy_order = webpay_data.get("buy_order")
-    # orden.webpay_amount = webpay_data.get("amount")
-    # orden.webpay_authorization_code = webpay_data.get("authorization_code")
-    # orden.save(update_fields=[
-    #     "webpay_token", "webpay_buy_order",
-    #     "webpay_amount", "webpay_authorization_code"
-    # ])
+    # 3) Crear la orden y los tickets (aplicando descuento si corresponde) y
+    # 4) registrar el pago en el libro, en la misma transacción
+    with transaction.atomic():
+        orden, tickets = crear_orden_y_tickets(
+            evento=evento,
+            comprador_email=comprador_email,
+            items=items,
+            promo_code=promo_code,
+            reserva=payload.get("reserva"),
+        )
+        if webpay_data:
+            registrar_pago(orden, webpay_data)
 
     # 5) Generar SharedPurchaseCode si corresponde (misma lógica que tenías antes)
     n_tickets = _count_non_parking_tickets(orden)
@@ -201,24 +178,7 @@ def aplicar_shared_code_en_carrito(carrito, shared_code):
     """
     if not shared_code or not shared_code.is_valid_now():
         return Decimal('0')
-
-    usos_disp = shared_code.remaining_uses
-    if usos_disp <= 0:
-        return Decimal('0')
-
-    entradas = [i for i in carrito if not i['tipo'].is_parking and i['cantidad'] > 0]
-    entradas.sort(key=lambda x: x['precio_unitario'], reverse=True)
-
-    descuento_total = Decimal('0')
-    usos_restantes = usos_disp
-
-    for item in entradas:
-        if usos_restantes <= 0:
-            break
-        aplicar_a = min(item['cantidad'], usos_restantes)
-        descuento_total += item['precio_unitario'] * aplicar_a
-        usos_restantes -= aplicar_a
-
+    descuento_total, _ = precios.descuento_cortesia(carrito, shared_code.remaining_uses)
     return descuento_total
 
 
@@ -230,25 +190,19 @@ def confirmar_compra_con_shared_code(orden, shared_code, carrito):
     if not shared_code or not shared_code.is_valid_now():
         return
 
-    usos_necesarios = 0
-    entradas = [i for i in carrito if not i['tipo'].is_parking and i['cantidad'] > 0]
-    entradas.sort(key=lambda x: x['precio_unitario'], reverse=True)
-
-    usos_disp = shared_code.remaining_uses
-    for item in entradas:
-        if usos_disp <= 0:
-            break
-        aplica = min(item['cantidad'], usos_disp)
-        usos_necesarios += aplica
-        usos_disp -= aplica
-
+    _, usos_necesarios = precios.descuento_cortesia(carrito, shared_code.remaining_uses)
     if usos_necesarios <= 0:
         return
 
-    with transaction.atomic():
-        sc = SharedPurchaseCode.objects.select_for_update().get(pk=shared_code.pk)
-        puede = max(0, sc.max_uses - sc.used_count)
-        aplica_final = min(puede, usos_necesarios)
-        if aplica_final > 0:
-            sc.used_count += aplica_final
-            sc.save(update_fields=['used_count'])
\ No newline at end of file
+    # UPDATE condicional en vez de select_for_update + save: si otro comprador
+    # usó el código entretanto, se reintenta con lo que quede.
+    qs = SharedPurchaseCode.objects.filter(pk=shared_code.pk)
+    while usos_necesarios > 0:
+        if qs.filter(max_uses__gte=F('used_count') + usos_necesarios).update(
+            used_count=F('used_count') + usos_necesarios
+        ):
+            return
+        usados = qs.values_list('used_count', 'max_uses').first()
+        if not usados:
+            return
+        usos_necesarios = min(usos_necesarios - 1, max(0, usados[1] - usados[0]))
\ No newline at end of file
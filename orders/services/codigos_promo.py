@@ -0,0 +1,161 @@
+# orders/services/codigos_promo.py
+"""
+Resolución de códigos promocionales.
+
+  modelo_descuento()  el modelo de descuentos del app tickets, resuelto una
+                      sola vez al arrancar (OrdersConfig.ready) en vez de
+                      recorrer apps.get_model en cada checkout.
+  buscar()            código -> ("descuento" | "promo" | "cortesia", id)
+                      con un mapa en memoria por evento de los códigos
+                      activos de la productora (DiscountCode, PromoCode).
+
+Los códigos de cortesía (SharedPurchaseCode) son uno por compra y crecen
+con las ventas: no van al mapa. Un código que no está en el mapa se busca
+en la base por índice (DiscountCode.codigo_norm, PromoCode.codigo_norm,
+SharedPurchaseCode.code), así un mapa desactualizado no rechaza un código
+recién creado.
+
+El mapa vive en el proceso. orders.signals lo invalida al confirmar la
+transacción que guarda o borra un código: borra la entrada local y sube una
+versión en el cache compartido, que los demás procesos comparan antes de
+usar su copia. La versión sólo se ve entre workers con CACHES compartido;
+además cada mapa se reconstruye tras PROMO_CODES_TTL_SECONDS.
+"""
+import threading
+import time
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+
+from orders.models import PromoCode, SharedPurchaseCode
+
+
+_modelo = None
+_mapas = {}  # evento_id -> (version, construido_en, {CODIGO: (tipo, id)})
+_lock = threading.Lock()
+
+
+def normalizar(code):
+    return (code or "").strip().upper()
+
+
+def resolver_modelo():
+    """
+    Devuelve el modelo de descuentos del app 'tickets'.
+    Primero intenta nombres comunes; si no, detecta por campos típicos.
+    """
+    # 1) nombres más comunes
+    for model_name in ('Discount', 'TicketDiscount', 'Descuento', 'DiscountCode', 'PromoCode', 'Promo'):
+        try:
+            return apps.get_model('tickets', model_name)
+        except LookupError:
+            pass
+
+    # 2) autodetección por campos
+    try:
+        app = apps.get_app_config('tickets')
+    except LookupError:
+        return None
+
+    required = {'codigo', 'evento', 'tipo_ticket', 'monto_descuento',
+                'usos_actuales', 'usos_maximos', 'vigente_desde', 'vigente_hasta', 'activo'}
+    for model in app.get_models():
+        field_names = {f.name for f in model._meta.get_fields()}
+        if required.issubset(field_names):
+            return model
+    return None
+
+
+def modelo_descuento():
+    global _modelo
+    if _modelo is None:
+        _modelo = resolver_modelo()
+    return _modelo
+
+
+def _version_key(evento_id):
+    return f"codigos:{evento_id}:v"
+
+
+def _version(evento_id):
+    v = cache.get(_version_key(evento_id))
+    if v is None:
+        # Sin versión (primera vez o el cache la descartó): una nueva que no
+        # coincida con la de ningún mapa ya construido
+        cache.add(_version_key(evento_id), time.time_ns(), None)
+        v = cache.get(_version_key(evento_id))
+    return v
+
+
+def _ttl():
+    return getattr(settings, "PROMO_CODES_TTL_SECONDS", 60)
+
+
+def _construir(evento_id):
+    mapa = {}
+    # Prioridad: DiscountCode > PromoCode (se escriben en orden inverso)
+    for code, pk in PromoCode.objects.filter(evento_id=evento_id, activo=True).values_list("codigo_norm", "id"):
+        mapa[code] = ("promo", pk)
+    Descuento = modelo_descuento()
+    if Descuento is not None:
+        for code, pk in Descuento.objects.filter(evento_id=evento_id, activo=True).values_list("codigo_norm", "id"):
+            mapa[code] = ("descuento", pk)
+    return mapa
+
+
+def _vigente(actual, version):
+    return actual is not None and actual[0] == version and time.monotonic() - actual[1] < _ttl()
+
+
+def mapa(evento_id):
+    version = _version(evento_id)
+    actual = _mapas.get(evento_id)
+    if not _vigente(actual, version):
+        with _lock:
+            actual = _mapas.get(evento_id)
+            if not _vigente(actual, version):
+                actual = (version, time.monotonic(), _construir(evento_id))
+                _mapas[evento_id] = actual
+    return actual[2]
+
+
+def _buscar_en_base(evento_id, code):
+    """Consultas por índice, en el mismo orden de prioridad que el mapa."""
+    norm = normalizar(code)
+    Descuento = modelo_descuento()
+    if Descuento is not None:
+        pk = (
+            Descuento.objects.filter(evento_id=evento_id, codigo_norm=norm, activo=True)
+            .values_list("id", flat=True).first()
+        )
+        if pk:
+            return "descuento", pk
+    pk = (
+        PromoCode.objects.filter(evento_id=evento_id, codigo_norm=norm, activo=True)
+        .values_list("id", flat=True).first()
+    )
+    if pk:
+        return "promo", pk
+    pk = (
+        SharedPurchaseCode.objects.filter(evento_id=evento_id, code=norm.lower(), active=True)
+        .values_list("id", flat=True).first()
+    )
+    if pk:
+        return "cortesia", pk
+    return None
+
+
+def buscar(evento_id, code):
+    """(tipo, id) del código activo en el evento, o None."""
+    if not normalizar(code):
+        return None
+    return mapa(evento_id).get(normalizar(code)) or _buscar_en_base(evento_id, code)
+
+
+def invalidar(evento_id):
+    _mapas.pop(evento_id, None)
+    try:
+        cache.incr(_version_key(evento_id))
+    except ValueError:
+        cache.add(_version_key(evento_id), time.time_ns(), None)
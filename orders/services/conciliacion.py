@@ -0,0 +1,171 @@
+# orders/services/conciliacion.py
+"""
+Conciliación del libro de pagos (Pago) contra el export de transacciones
+del portal de Transbank, sin llamadas al API por fila.
+
+El export (CSV, separado por ";" o ",") se lee en lotes de LOTE filas. Por
+lote hay una consulta por buy_order y un bulk_update. Cada Pago queda:
+
+  ok          monto, estado y código de autorización coinciden
+  diferencia  está en el export pero algo no coincide (detalle en
+              conciliacion_detalle)
+  faltante    no aparece en el export dentro del rango conciliado
+
+Las filas del export sin Pago (por ejemplo un pago autorizado cuya orden no
+se pudo crear) se informan en el resultado; no hay fila del libro que marcar.
+"""
+import csv
+import unicodedata
+
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from orders.models import Pago
+
+
+LOTE = 1000
+
+# Encabezados del portal -> campo
+COLUMNAS = {
+    "buy_order": "buy_order",
+    "orden de compra": "buy_order",
+    "amount": "amount",
+    "monto": "amount",
+    "status": "status",
+    "estado": "status",
+    "authorization_code": "authorization_code",
+    "codigo de autorizacion": "authorization_code",
+    "codigo autorizacion": "authorization_code",
+    "transaction_date": "transaction_date",
+    "fecha": "transaction_date",
+    "fecha transaccion": "transaction_date",
+}
+
+ESTADOS = {
+    "authorized": "AUTHORIZED",
+    "aprobada": "AUTHORIZED",
+    "autorizada": "AUTHORIZED",
+    "nullified": "NULLIFIED",
+    "anulada": "NULLIFIED",
+    "reversed": "REVERSED",
+    "reversada": "REVERSED",
+    "failed": "FAILED",
+    "rechazada": "FAILED",
+}
+
+
+def _clave(encabezado):
+    sin_tildes = unicodedata.normalize("NFKD", encabezado).encode("ascii", "ignore").decode()
+    return COLUMNAS.get(sin_tildes.strip().lower())
+
+
+def _monto(valor):
+    # "$12.500" o "12500"
+    digitos = "".join(ch for ch in (valor or "") if ch.isdigit())
+    return int(digitos) if digitos else None
+
+
+def _fecha(valor):
+    valor = (valor or "").strip()
+    if not valor:
+        return None
+    dt = parse_datetime(valor)
+    return dt.date() if dt else parse_date(valor[:10])
+
+
+def leer_export(archivo):
+    """Itera el export como dicts {buy_order, amount, status, authorization_code, fecha}."""
+    muestra = archivo.read(4096)
+    archivo.seek(0)
+    dialecto = csv.Sniffer().sniff(muestra, delimiters=";,") if muestra else csv.excel
+    lector = csv.reader(archivo, dialecto)
+    campos = [_clave(h) for h in next(lector, [])]
+    if "buy_order" not in campos or "amount" not in campos:
+        raise ValueError("El export debe traer al menos las columnas de orden de compra y monto.")
+    for fila in lector:
+        if not any(fila):
+            continue
+        d = {c: v.strip() for c, v in zip(campos, fila) if c}
+        yield {
+            "buy_order": d["buy_order"],
+            "amount": _monto(d.get("amount")),
+            "status": ESTADOS.get((d.get("status") or "").lower(), (d.get("status") or "").upper()),
+            "authorization_code": d.get("authorization_code", ""),
+            "fecha": _fecha(d.get("transaction_date")),
+        }
+
+
+def _comparar(pago, fila):
+    problemas = []
+    if fila["amount"] != pago.monto:
+        problemas.append(f"monto {pago.monto} vs {fila['amount']}")
+    if fila["status"] and fila["status"] != pago.status:
+        problemas.append(f"estado {pago.status} vs {fila['status']}")
+    if fila["authorization_code"] and fila["authorization_code"] != pago.authorization_code:
+        problemas.append(f"autorización {pago.authorization_code} vs {fila['authorization_code']}")
+    return "; ".join(problemas)
+
+
+def _lotes(filas, n):
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= n:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def conciliar(filas, lote=LOTE, evento_id=None, desde=None, hasta=None):
+    """
+    filas: iterable de leer_export. desde/hasta (date) acotan qué Pagos se
+    marcan "faltante"; por defecto, el rango de fechas del export.
+
+    Retorna {"ok", "diferencias", "faltantes", "sin_libro": [buy_order, ...],
+             "detalle": [(buy_order, motivo), ...]}.
+    """
+    ahora = timezone.now()
+    res = {"ok": 0, "diferencias": 0, "faltantes": 0, "sin_libro": [], "detalle": []}
+    fechas = []
+
+    base = Pago.objects.all()
+    if evento_id:
+        base = base.filter(evento_id=evento_id)
+
+    for grupo in _lotes(filas, lote):
+        fechas.extend(f["fecha"] for f in grupo if f["fecha"])
+        pagos = {p.buy_order: p for p in base.filter(buy_order__in=[f["buy_order"] for f in grupo])}
+        cambiados = []
+        for fila in grupo:
+            pago = pagos.get(fila["buy_order"])
+            if pago is None:
+                if evento_id is None and fila["status"] in ("AUTHORIZED", ""):
+                    res["sin_libro"].append(fila["buy_order"])
+                continue
+            detalle = _comparar(pago, fila)
+            pago.conciliacion = "diferencia" if detalle else "ok"
+            pago.conciliacion_detalle = detalle[:255]
+            pago.conciliado_at = ahora
+            cambiados.append(pago)
+            if detalle:
+                res["diferencias"] += 1
+                res["detalle"].append((pago.buy_order, detalle))
+            else:
+                res["ok"] += 1
+        Pago.objects.bulk_update(cambiados, ["conciliacion", "conciliacion_detalle", "conciliado_at"])
+
+    desde = desde or (min(fechas) if fechas else None)
+    hasta = hasta or (max(fechas) if fechas else None)
+    if desde and hasta:
+        # Lo del rango que este export no tocó
+        faltantes = (
+            base.filter(created_at__date__gte=desde, created_at__date__lte=hasta)
+            .exclude(conciliado_at=ahora)
+        )
+        for buy_order in faltantes.values_list("buy_order", flat=True).iterator():
+            res["detalle"].append((buy_order, "no está en el export"))
+        res["faltantes"] = faltantes.update(
+            conciliacion="faltante", conciliacion_detalle="No está en el export de Transbank.", conciliado_at=ahora
+        )
+    return res
@@ -0,0 +1,104 @@
+# orders/services/cupos_descuento.py
+"""
+Contadores de uso de DiscountCode repartidos en varias filas.
+
+Antes cada checkout con un código hacía select_for_update sobre la fila del
+DiscountCode y la dejaba bloqueada hasta el commit: todos los compradores de
+una campaña se serializaban en ese lock.
+
+Ahora el cupo restante (usos_maximos - usos_actuales) se reparte en
+DISCOUNT_COUNTER_SHARDS filas ContadorDescuento. Consumir es un UPDATE
+condicional sobre una parte elegida al azar:
+
+    UPDATE contador SET usados = usados + 1
+     WHERE codigo_id = ? AND shard = ? AND usados + 1 <= cupo
+
+Si esa parte está agotada se prueban las demás. La suma de los cupos es el
+cupo total, así que usos_maximos nunca se excede, y compradores
+concurrentes bloquean filas distintas.
+
+DiscountCode.usos_totales() suma usos_actuales y los contadores.
+"""
+import random
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+
+from tickets.models import ContadorDescuento
+
+
+def n_shards():
+    return max(1, getattr(settings, "DISCOUNT_COUNTER_SHARDS", 8))
+
+
+def _repartir(total, n):
+    return [total // n + (1 if i < total % n else 0) for i in range(n)]
+
+
+def _crear_contadores(codigo):
+    """Crea las partes si el código aún no las tiene. True si hubo que crearlas."""
+    if ContadorDescuento.objects.filter(codigo_id=codigo.id).exists():
+        return False
+    restante = max(0, codigo.usos_maximos - codigo.usos_actuales)
+    ContadorDescuento.objects.bulk_create(
+        [
+            ContadorDescuento(codigo_id=codigo.id, shard=i, cupo=cupo)
+            for i, cupo in enumerate(_repartir(restante, n_shards()))
+        ],
+        ignore_conflicts=True,
+    )
+    return True
+
+
+def _tomar(codigo_id, shard, n):
+    return (
+        ContadorDescuento.objects
+        .filter(codigo_id=codigo_id, shard=shard, cupo__gte=F("usados") + n)
+        .update(usados=F("usados") + n)
+    )
+
+
+def consumir(codigo, n=1):
+    """Toma n usos del código. False si no queda cupo."""
+    # Caso común: una parte al azar, sin leer nada antes
+    if _tomar(codigo.id, random.randrange(n_shards()), n):
+        return True
+
+    # Esa parte se agotó (o el código aún no tiene contadores): buscar las
+    # que tengan cupo. Acotado porque la lectura puede venir del snapshot
+    # de la transacción (REPEATABLE READ) y no ver lo que otros consumieron.
+    for _ in range(3):
+        con_cupo = list(
+            ContadorDescuento.objects
+            .filter(codigo_id=codigo.id, cupo__gte=F("usados") + n)
+            .values_list("shard", flat=True)
+        )
+        if not con_cupo:
+            if not _crear_contadores(codigo):
+                return False
+            continue
+        random.shuffle(con_cupo)
+        if any(_tomar(codigo.id, shard, n) for shard in con_cupo):
+            return True
+    return False
+
+
+def redimensionar(codigo):
+    """
+    Reparte de nuevo el cupo tras editar usos_maximos (también crea las
+    partes de un código nuevo). Bloquea las partes del código: es una acción
+    de administración, no del checkout.
+    """
+    with transaction.atomic():
+        partes = list(
+            ContadorDescuento.objects.select_for_update().filter(codigo_id=codigo.id).order_by("shard")
+        )
+        if not partes:
+            _crear_contadores(codigo)
+            return
+        usados = sum(p.usados for p in partes)
+        restante = max(0, codigo.usos_maximos - codigo.usos_actuales - usados)
+        for p, extra in zip(partes, _repartir(restante, len(partes))):
+            p.cupo = p.usados + extra
+        ContadorDescuento.objects.bulk_update(partes, ["cupo"])
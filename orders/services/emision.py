@@ -0,0 +1,57 @@
+# orders/services/emision.py
+"""
+Emisión de tickets de una orden con un solo INSERT por lote.
+
+Los códigos se generan acá (no en save), así los tickets quedan
+identificados antes de insertarlos. En backends que no retornan las pk
+desde bulk_create (MySQL) se recuperan con una consulta por código.
+"""
+import uuid
+
+from orders.models import Ticket
+from orders.services import filtro_codigos
+
+
+LOTE_INSERT = 500
+
+
+def emitir_tickets(orden, items, *, asistente_email=""):
+    """
+    Crea los tickets de la orden.
+
+    items: [(TipoTicket, cantidad), ...]
+    Retorna la lista de Ticket creados, con id, en el orden de items.
+    Debe llamarse dentro de la transacción que crea la orden.
+    """
+    nuevos = [
+        Ticket(
+            orden=orden,
+            evento_id=orden.evento_id,
+            tipo=tipo,
+            code=uuid.uuid4(),
+            asistente_email=asistente_email,
+            # Precio congelado; montos.congelar reparte el descuento
+            precio=tipo.precio,
+            descuento=0,
+            neto=tipo.precio,
+        )
+        for tipo, cantidad in items
+        for _ in range(cantidad)
+    ]
+    if not nuevos:
+        return []
+
+    creados = Ticket.objects.bulk_create(nuevos, batch_size=LOTE_INSERT)
+
+    if any(t.pk is None for t in creados):
+        ids = {}
+        codes = [t.code for t in creados]
+        for i in range(0, len(codes), LOTE_INSERT):
+            ids.update(
+                Ticket.objects.filter(code__in=codes[i:i + LOTE_INSERT]).values_list("code", "id")
+            )
+        for t in creados:
+            t.pk = ids[t.code]
+
+    filtro_codigos.registrar_codigos(orden.cuenta_id, orden.evento_id, [t.code for t in creados])
+    return creados
@@ -0,0 +1,120 @@
+# orders/services/feed_validaciones.py
+"""
+Difusión en proceso de las validaciones a los supervisores conectados (SSE).
+
+El camino de validación llama a publicar() con cada resultado; cada stream
+abierto tiene una asyncio.Queue registrada en su canal (cuenta, evento).
+publicar() es seguro desde cualquier hilo (las vistas síncronas corren en
+el executor del servidor ASGI) y sin suscriptores no hace nada.
+
+Por canal corre una sola tarea de snapshots que calcula los contadores por
+puerta cada FEED_SNAPSHOT_SECONDS y los reparte a todos: N supervisores
+cuestan una fuente, no N consultas.
+
+Es por proceso: cada worker ASGI difunde las lecturas que resuelve él. Con
+varios workers, cada supervisor ve las lecturas de su worker y los snapshots
+(que salen del cache compartido) completos.
+"""
+import asyncio
+import logging
+import threading
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from orders.models import AccessPoint
+from orders.services import metricas_puerta
+
+
+logger = logging.getLogger(__name__)
+
+COLA_MAX = 500
+
+
+class _Canal:
+    def __init__(self):
+        self.suscriptores = {}  # asyncio.Queue -> loop
+        self.snapshots = None   # asyncio.Task
+
+
+_canales = {}
+_lock = threading.Lock()
+
+
+def _entregar(q, msg):
+    try:
+        q.put_nowait(msg)
+    except asyncio.QueueFull:
+        # Cliente lento: se descartan eventos antes que frenar la puerta
+        pass
+
+
+def _difundir(clave, msg):
+    with _lock:
+        canal = _canales.get(clave)
+        destinos = list(canal.suscriptores.items()) if canal else []
+    for q, loop in destinos:
+        try:
+            loop.call_soon_threadsafe(_entregar, q, msg)
+        except RuntimeError:
+            pass  # loop cerrado; se desuscribe al terminar su stream
+
+
+def publicar(cuenta_id, evento_id, data):
+    """Publica una validación en el canal del evento y en el de la cuenta."""
+    msg = {"tipo": "validacion", "data": data}
+    _difundir((str(cuenta_id), evento_id), msg)
+    if evento_id is not None:
+        _difundir((str(cuenta_id), None), msg)
+
+
+async def _snapshot(cuenta_id):
+    aps = await sync_to_async(
+        lambda: {0: "Sin puerta", **dict(
+            AccessPoint.objects.filter(cuenta_id=cuenta_id, activo=True).values_list("id", "nombre")
+        )}
+    )()
+    datos = await sync_to_async(metricas_puerta.resumen)(cuenta_id, list(aps))
+    return {
+        "generado": timezone.now().isoformat(),
+        "puertas": [{"id": ap, "nombre": nombre, **datos[ap]} for ap, nombre in aps.items()],
+    }
+
+
+async def _loop_snapshots(clave):
+    segundos = getattr(settings, "FEED_SNAPSHOT_SECONDS", 5)
+    while True:
+        await asyncio.sleep(segundos)
+        try:
+            data = await _snapshot(clave[0])
+        except Exception:
+            logger.exception("No se pudo calcular el snapshot de %s", clave)
+            continue
+        _difundir(clave, {"tipo": "snapshot", "data": data})
+
+
+def suscribir(cuenta_id, evento_id):
+    """Registra una cola en el loop actual. Llamar desde código async."""
+    clave = (str(cuenta_id), evento_id)
+    loop = asyncio.get_running_loop()
+    q = asyncio.Queue(maxsize=COLA_MAX)
+    with _lock:
+        canal = _canales.setdefault(clave, _Canal())
+        canal.suscriptores[q] = loop
+        if canal.snapshots is None or canal.snapshots.done():
+            canal.snapshots = loop.create_task(_loop_snapshots(clave))
+    return q
+
+
+def desuscribir(cuenta_id, evento_id, q):
+    clave = (str(cuenta_id), evento_id)
+    with _lock:
+        canal = _canales.get(clave)
+        if canal is None:
+            return
+        canal.suscriptores.pop(q, None)
+        if not canal.suscriptores:
+            if canal.snapshots:
+                canal.snapshots.cancel()
+            del _canales[clave]
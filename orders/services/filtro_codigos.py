@@ -0,0 +1,259 @@
+# orders/services/filtro_codigos.py
+"""
+Filtro de Bloom por evento sobre los Ticket.code emitidos.
+
+Evita la quema condicional y el log por lectura para códigos falsos o mal
+leídos. Si el filtro dice "puede estar", se valida como siempre. Si dice
+"no está", se responde NOT_FOUND sin tocar la tabla de tickets.
+
+Cada proceso mantiene los filtros de las cuentas que valida. Un hilo de
+fondo (no el request) los mantiene:
+  - la primera vez que se valida una cuenta se construyen completos; hasta
+    entonces puede_existir() retorna True y se valida como siempre,
+  - cada CODE_FILTER_REFRESH_SECONDS se cargan los tickets con created_at
+    posterior a la marca menos CODE_FILTER_LAG_SECONDS (la ventana cubre
+    transacciones que confirman fuera de orden; agregar es idempotente).
+    Sólo entran códigos nuevos: quemar un ticket no lo vuelve a leer,
+  - los filtros que se llenan se reconstruyen con el doble de capacidad.
+Los tickets emitidos en este proceso se agregan al confirmar
+(registrar_codigos).
+
+Desfase: un ticket creado por otro worker puede dar NOT_FOUND en este
+durante a lo más CODE_FILTER_REFRESH_SECONDS (o hasta que su transacción
+confirme, si tarda menos que CODE_FILTER_LAG_SECONDS). Pasado eso el miss
+es definitivo. CODE_FILTER_ENABLED = False vuelve a la quema directa.
+
+Las consultas se hacen fuera de _lock: el lock sólo protege los filtros en
+memoria, no espera a la base.
+"""
+import hashlib
+import logging
+import math
+import threading
+import time
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from orders.models import Ticket
+
+
+logger = logging.getLogger(__name__)
+
+FP_RATE = 0.01
+INACTIVA = 15 * 60  # segundos sin validar tras los que se deja de refrescar una cuenta
+
+
+class BloomFilter:
+    def __init__(self, capacidad, fp_rate=FP_RATE):
+        capacidad = max(int(capacidad), 1000)
+        self.capacidad = capacidad
+        self.m = int(-capacidad * math.log(fp_rate) / (math.log(2) ** 2))
+        self.k = max(1, round(self.m / capacidad * math.log(2)))
+        self.bits = bytearray((self.m + 7) // 8)
+        self.n = 0
+
+    def _posiciones(self, code_bytes):
+        h = hashlib.blake2b(code_bytes, digest_size=16).digest()
+        h1 = int.from_bytes(h[:8], "little")
+        h2 = int.from_bytes(h[8:], "little") | 1
+        return ((h1 + i * h2) % self.m for i in range(self.k))
+
+    def add(self, code_bytes):
+        """Agrega el código. Sólo cuenta en n si no estaba (releer la ventana no llena el filtro)."""
+        nuevo = False
+        for p in self._posiciones(code_bytes):
+            bit = 1 << (p & 7)
+            if not self.bits[p >> 3] & bit:
+                self.bits[p >> 3] |= bit
+                nuevo = True
+        if nuevo:
+            self.n += 1
+        return nuevo
+
+    def __contains__(self, code_bytes):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._posiciones(code_bytes))
+
+    @property
+    def lleno(self):
+        return self.n > self.capacidad
+
+
+class _EstadoCuenta:
+    def __init__(self):
+        self.filtros = {}     # evento_id -> BloomFilter
+        self.marca = None     # mayor created_at cargado
+        self.listo = False    # ya se cargó completa una vez
+        self.llenos = set()   # eventos cuyo filtro hay que reconstruir
+        self.usada = time.monotonic()
+        self.misses = 0       # misses definitivos desde el último log
+
+
+_cuentas = {}
+_lock = threading.Lock()
+_despertar = threading.Event()
+_hilo = None
+
+
+def _habilitado():
+    return getattr(settings, "CODE_FILTER_ENABLED", True)
+
+
+def _as_bytes(code):
+    return code.bytes if isinstance(code, uuid.UUID) else uuid.UUID(str(code)).bytes
+
+
+def _agregar(estado, evento_id, code_bytes):
+    """Con _lock tomado."""
+    f = estado.filtros.get(evento_id)
+    if f is None:
+        f = estado.filtros[evento_id] = BloomFilter(capacidad=1000)
+    f.add(code_bytes)
+    if f.lleno:
+        estado.llenos.add(evento_id)
+
+
+def _reconstruir(evento_id):
+    """Filtro nuevo del evento con el doble de capacidad. Consulta la base: llamar sin _lock."""
+    codes = list(Ticket.objects.filter(evento_id=evento_id).values_list("code", flat=True))
+    f = BloomFilter(capacidad=len(codes) * 2)
+    for c in codes:
+        f.add(c.bytes)
+    return f
+
+
+def refrescar(cuenta_id):
+    """
+    Una pasada sobre la cuenta: carga los tickets creados desde la marca
+    menos el lag (todos la primera vez) y reconstruye los filtros llenos.
+    La llama el hilo de fondo; consulta la base, así que va sin _lock.
+    """
+    with _lock:
+        estado = _cuentas.setdefault(cuenta_id, _EstadoCuenta())
+        marca = estado.marca
+
+    filas = Ticket.objects.filter(evento__cuenta_id=cuenta_id)
+    if marca is not None:
+        lag = timedelta(seconds=getattr(settings, "CODE_FILTER_LAG_SECONDS", 60))
+        filas = filas.filter(created_at__gt=marca - lag)
+    filas = filas.values_list("evento_id", "code", "created_at")
+
+    nueva_marca = marca
+    bloque = []
+
+    def _aplicar():
+        with _lock:
+            for evento_id, code in bloque:
+                _agregar(estado, evento_id, code.bytes)
+        bloque.clear()
+
+    for evento_id, code, created_at in filas.iterator(chunk_size=5000):
+        bloque.append((evento_id, code))
+        if nueva_marca is None or created_at > nueva_marca:
+            nueva_marca = created_at
+        if len(bloque) >= 5000:
+            _aplicar()
+    _aplicar()
+
+    with _lock:
+        llenos, estado.llenos = estado.llenos, set()
+    for evento_id in llenos:
+        f = _reconstruir(evento_id)
+        with _lock:
+            estado.filtros[evento_id] = f
+
+    with _lock:
+        if nueva_marca is not None and (estado.marca is None or nueva_marca > estado.marca):
+            estado.marca = nueva_marca
+        estado.listo = True
+
+
+def _loop():
+    while True:
+        _despertar.wait(getattr(settings, "CODE_FILTER_REFRESH_SECONDS", 1))
+        _despertar.clear()
+        ahora = time.monotonic()
+        with _lock:
+            for cuenta_id in [c for c, e in _cuentas.items() if ahora - e.usada > INACTIVA]:
+                del _cuentas[cuenta_id]
+            cuentas = list(_cuentas)
+        try:
+            for cuenta_id in cuentas:
+                try:
+                    refrescar(cuenta_id)
+                except Exception:
+                    logger.exception("No se pudo refrescar el filtro de códigos de la cuenta %s", cuenta_id)
+        finally:
+            connection.close()
+
+
+def _arrancar():
+    """Con _lock tomado. Arranca el hilo de refresco de este proceso."""
+    global _hilo
+    if _hilo is None:
+        _hilo = threading.Thread(target=_loop, name="code-filter-refresh", daemon=True)
+        _hilo.start()
+
+
+def puede_existir(cuenta_id, code, evento_id=None):
+    """
+    False si el código no fue emitido por la cuenta (o por el evento
+    indicado), sin consultar la base. Mientras el filtro de la cuenta no
+    está cargado retorna True.
+    """
+    if not _habilitado():
+        return True
+    try:
+        code_bytes = _as_bytes(code)
+    except ValueError:
+        return False
+
+    with _lock:
+        estado = _cuentas.get(cuenta_id)
+        if estado is None:
+            estado = _cuentas[cuenta_id] = _EstadoCuenta()
+        estado.usada = time.monotonic()
+        if not estado.listo:
+            _arrancar()
+            _despertar.set()
+            return True
+        if evento_id is not None:
+            f = estado.filtros.get(evento_id)
+            return f is not None and code_bytes in f
+        return any(code_bytes in f for f in estado.filtros.values())
+
+
+def registrar_codigos(cuenta_id, evento_id, codes):
+    """
+    Agrega códigos recién emitidos a los filtros de este proceso cuando la
+    transacción confirma. Los demás procesos los ven en su próximo refresco.
+    """
+    codes = [_as_bytes(c) for c in codes]
+
+    def _aplicar():
+        with _lock:
+            estado = _cuentas.get(cuenta_id)
+            if estado is None:
+                return  # se construirá completo cuando se valide la cuenta
+            for c in codes:
+                _agregar(estado, evento_id, c)
+
+    transaction.on_commit(_aplicar)
+
+
+def contar_miss(cuenta_id):
+    """
+    Cuenta un NOT_FOUND descartado por el filtro. Los misses se registran
+    agrupados: retorna CODE_FILTER_MISS_SAMPLE cada vez que se completa un
+    grupo (hay que escribir un log que los resume) y 0 en otro caso.
+    """
+    muestra = getattr(settings, "CODE_FILTER_MISS_SAMPLE", 50)
+    with _lock:
+        estado = _cuentas.setdefault(cuenta_id, _EstadoCuenta())
+        estado.misses += 1
+        if estado.misses >= muestra:
+            estado.misses = 0
+            return muestra
+        return 0
@@ -0,0 +1,285 @@
+# orders/services/gate_file.py
+"""
+Validador local de puerta basado en un archivo binario mapeado en memoria.
+
+Archivo de evento (export_gate_file):
+    cabecera  "TFG2" | evento_id (q) | cantidad (q) | exportado_en epoch µs (q)
+              | fecha_inicio (I) | fecha_termino (I) del evento
+    registros ordenados por código, 25 bytes c/u:
+        code (16 bytes) | flags (B) | valid_day (I) | día del primer ingreso (I)
+
+Las fechas van como AAAAMMDD (0 = sin fecha). Con ellas el validador aplica
+las mismas reglas de día que reglas_acceso.verificar_dia: valid_day,
+fechas del evento (OUT_OF_EVENT_DATES) y, para reingreso ilimitado sin día
+fijo, el día del primer ingreso aunque haya sido antes de exportar.
+
+Journal de quemas (append-only, se concilia con merge_gate_journal):
+    cabecera  "TFJ1" | evento_id (q)
+    registros de 24 bytes: code (16 bytes) | scanned_at epoch µs (q)
+
+La búsqueda es binaria sobre el mmap; las quemas locales viven en memoria
+(reconstruidas desde el journal al partir) y nunca tocan la base.
+"""
+import mmap
+import os
+import struct
+import threading
+import uuid
+from datetime import date, datetime, timezone as dt_timezone
+
+from django.utils import timezone
+
+from events.models import Evento
+from orders.models import Ticket
+from orders.services import qr_firma
+from orders.services.validacion import MAX_LOTE, validar_lote
+
+
+CABECERA = struct.Struct("<4sqqqII")
+REGISTRO = struct.Struct("<16sBII")
+J_CABECERA = struct.Struct("<4sq")
+J_REGISTRO = struct.Struct("<16sq")
+
+ESTADOS = {"disponible": 0, "quemado": 1, "anulado": 2}
+F_ESTADO = 0b0011
+F_TODOS_LOS_DIAS = 0b0100
+F_ILIMITADO = 0b1000
+
+
+class GateFileError(ValueError):
+    pass
+
+
+def _flags(estado, access_policy, reentry_rule):
+    f = ESTADOS.get(estado, 2)
+    if access_policy == "todos_los_dias":
+        f |= F_TODOS_LOS_DIAS
+    if reentry_rule == "ilimitado":
+        f |= F_ILIMITADO
+    return f
+
+
+def _micros(ts):
+    return int(ts.timestamp() * 1_000_000)
+
+
+def _dia_int(d):
+    return int(d.strftime("%Y%m%d")) if d else 0
+
+
+def _dia(n):
+    return date(n // 10000, n // 100 % 100, n % 100) if n else None
+
+
+def exportar_evento(evento, path):
+    """Escribe el archivo de puerta del evento. Retorna la cantidad de tickets."""
+    filas = (
+        Ticket.objects
+        .filter(evento=evento)
+        .values_list("code", "estado", "tipo__access_policy", "tipo__reentry_rule", "tipo__valid_day", "used_at")
+    )
+    registros = []
+    for code, estado, policy, reentry, valid_day, used_at in filas.iterator(chunk_size=5000):
+        dia = _dia_int(valid_day) if policy == "un_dia" else 0
+        ingreso = _dia_int(timezone.localdate(used_at)) if used_at else 0
+        registros.append(REGISTRO.pack(code.bytes, _flags(estado, policy, reentry), dia, ingreso))
+    registros.sort()
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(CABECERA.pack(
+            b"TFG2", evento.id, len(registros), _micros(timezone.now()),
+            _dia_int(evento.fecha_inicio), _dia_int(evento.fecha_termino),
+        ))
+        for r in registros:
+            fh.write(r)
+        fh.flush()
+        os.fsync(fh.fileno())
+    os.replace(tmp, path)
+    return len(registros)
+
+
+class GateFile:
+    """Lectura del archivo de puerta vía mmap + búsqueda binaria."""
+
+    def __init__(self, path):
+        self._fh = open(path, "rb")
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._mm) < CABECERA.size:
+            raise GateFileError(f"Archivo de puerta inválido: {path}")
+        magic, self.evento_id, self.cantidad, _, inicio, termino = CABECERA.unpack_from(self._mm, 0)
+        if magic != b"TFG2" or len(self._mm) != CABECERA.size + self.cantidad * REGISTRO.size:
+            raise GateFileError(f"Archivo de puerta inválido (¿exportado con otra versión?): {path}")
+        self.fecha_inicio, self.fecha_termino = _dia(inicio), _dia(termino)
+
+    def buscar(self, code_bytes):
+        """Retorna (flags, valid_day | None, primer ingreso | None) o None si el código no está."""
+        lo, hi = 0, self.cantidad
+        size, base, mm = REGISTRO.size, CABECERA.size, self._mm
+        while lo < hi:
+            mid = (lo + hi) // 2
+            off = base + mid * size
+            actual = mm[off:off + 16]
+            if actual < code_bytes:
+                lo = mid + 1
+            elif actual > code_bytes:
+                hi = mid
+            else:
+                _, flags, dia, ingreso = REGISTRO.unpack_from(mm, off)
+                return flags, _dia(dia), _dia(ingreso)
+        return None
+
+    def close(self):
+        self._mm.close()
+        self._fh.close()
+
+
+class Journal:
+    """Journal append-only de quemas locales."""
+
+    def __init__(self, path, evento_id, fsync=True):
+        self.path = path
+        self.evento_id = evento_id
+        self.fsync = fsync
+        nuevo = not os.path.exists(path) or os.path.getsize(path) == 0
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        if nuevo:
+            os.write(self._fd, J_CABECERA.pack(b"TFJ1", evento_id))
+        elif leer_journal(path)[0] != evento_id:
+            raise GateFileError(f"El journal {path} pertenece a otro evento")
+
+    def agregar(self, code_bytes, scanned_at):
+        os.write(self._fd, J_REGISTRO.pack(code_bytes, _micros(scanned_at)))
+        if self.fsync:
+            os.fsync(self._fd)
+
+    def close(self):
+        os.close(self._fd)
+
+
+def leer_journal(path, desde=0):
+    """
+    Retorna (evento_id, [(UUID, datetime), ...]) desde el registro `desde`.
+    Ignora un registro final truncado.
+    """
+    with open(path, "rb") as fh:
+        data = fh.read()
+    if len(data) < J_CABECERA.size:
+        raise GateFileError(f"Journal inválido: {path}")
+    magic, evento_id = J_CABECERA.unpack_from(data, 0)
+    if magic != b"TFJ1":
+        raise GateFileError(f"Journal inválido: {path}")
+
+    quemas = []
+    n = (len(data) - J_CABECERA.size) // J_REGISTRO.size
+    for i in range(desde, n):
+        code, micros = J_REGISTRO.unpack_from(data, J_CABECERA.size + i * J_REGISTRO.size)
+        quemas.append((uuid.UUID(bytes=code), datetime.fromtimestamp(micros / 1_000_000, tz=dt_timezone.utc)))
+    return evento_id, quemas
+
+
+class GateValidator:
+    """
+    Decide OK / ALREADY_USED / NOT_FOUND / DENIED sólo con el archivo y el
+    journal locales. Misma semántica que validate_ticket.
+    """
+
+    def __init__(self, gate_path, journal_path, fsync=True):
+        self.archivo = GateFile(gate_path)
+        self.evento_id = self.archivo.evento_id
+        self._lock = threading.Lock()
+        self._ingresos = {}  # code_bytes -> set(días con ingreso)
+        if os.path.exists(journal_path) and os.path.getsize(journal_path):
+            _, quemas = leer_journal(journal_path)
+            for code, ts in quemas:
+                self._ingresos.setdefault(code.bytes, set()).add(timezone.localdate(ts))
+        self.journal = Journal(journal_path, self.evento_id, fsync=fsync)
+
+    def validar(self, raw, ahora=None):
+        ahora = ahora or timezone.now()
+        dia = timezone.localdate(ahora)
+
+        try:
+            code, datos = qr_firma.leer_qr(raw)
+        except qr_firma.QRInvalido as e:
+            if e.nota == "BAD_SIGNATURE":
+                return "DENIED", e.nota
+            return "NOT_FOUND", "TICKET_NOT_FOUND"
+        rechazo = qr_firma.verificar_en_memoria(datos, evento_id=self.evento_id)
+        if rechazo:
+            return "DENIED", rechazo
+
+        encontrado = self.archivo.buscar(code.bytes)
+        if not encontrado:
+            return "NOT_FOUND", "TICKET_NOT_FOUND"
+        flags, valid_day, ingreso = encontrado
+
+        if flags & F_ESTADO == ESTADOS["anulado"]:
+            return "DENIED", "TICKET_ANULADO"
+        # Mismo orden que reglas_acceso.verificar_dia
+        if flags & F_TODOS_LOS_DIAS:
+            inicio, termino = self.archivo.fecha_inicio, self.archivo.fecha_termino
+            if (inicio and dia < inicio) or (termino and dia > termino):
+                return "DENIED", "OUT_OF_EVENT_DATES"
+        elif valid_day and valid_day != dia:
+            return "DENIED", "WRONG_DAY"
+
+        with self._lock:
+            dias = self._ingresos.get(code.bytes, set())
+            exportado_quemado = flags & F_ESTADO == ESTADOS["quemado"]
+            if flags & F_ILIMITADO:
+                # Sin día fijo vale sólo el día del primer ingreso (en línea o local)
+                primer_dia = min(dias | ({ingreso} if ingreso else set()), default=None)
+                if not (flags & F_TODOS_LOS_DIAS) and not valid_day and primer_dia and primer_dia != dia:
+                    return "DENIED", "WRONG_DAY"
+            elif flags & F_TODOS_LOS_DIAS:
+                if dia in dias:
+                    return "ALREADY_USED", "REPEAT_TODAY"
+            elif dias or exportado_quemado:
+                return "ALREADY_USED", "REPEAT"
+
+            self.journal.agregar(code.bytes, ahora)
+            self._ingresos.setdefault(code.bytes, set()).add(dia)
+        return "OK", ""
+
+    def close(self):
+        self.journal.close()
+        self.archivo.close()
+
+
+def _marca_path(journal_path):
+    return f"{journal_path}.merged"
+
+
+def conciliar_journal(journal_path, access_point=None):
+    """
+    Lleva a Ticket y ValidationLog las quemas del journal aún no conciliadas,
+    en lotes de MAX_LOTE vía validar_lote. El avance se guarda en
+    <journal>.merged, así que se puede correr con el validador en marcha.
+    Retorna la cantidad de lecturas conciliadas.
+    """
+    marca = _marca_path(journal_path)
+    try:
+        with open(marca) as fh:
+            desde = int(fh.read().strip() or 0)
+    except FileNotFoundError:
+        desde = 0
+
+    evento_id, quemas = leer_journal(journal_path, desde=desde)
+    evento = Evento.objects.select_related("cuenta").get(id=evento_id)
+
+    total = 0
+    for i in range(0, len(quemas), MAX_LOTE):
+        lote = quemas[i:i + MAX_LOTE]
+        validar_lote(
+            cuenta=evento.cuenta,
+            scans=[{"code": str(code), "scanned_at": ts.isoformat()} for code, ts in lote],
+            user_agent="gate-validator",
+            access_point=access_point,
+            evento=evento,
+        )
+        total += len(lote)
+        with open(f"{marca}.tmp", "w") as fh:
+            fh.write(str(desde + total))
+        os.replace(f"{marca}.tmp", marca)
+    return total
@@ -0,0 +1,157 @@
+# orders/services/idempotencia.py
+"""
+Claves de idempotencia para el checkout.
+
+  1. El primer request inserta su ClaveIdempotencia "en curso" (status
+     NULL) en una transacción corta y la confirma.
+  2. Hace el trabajo fuera de esa transacción: puede incluir llamadas a
+     Transbank, y no debe retener una conexión ni el lock del índice único
+     mientras espera la red.
+  3. Guarda el resultado en la clave.
+
+Un duplicado concurrente choca con el índice único al insertar y espera,
+releyendo la clave, a que el primero guarde su resultado para repetirlo.
+Si no termina a tiempo recibe EnCurso (la API responde 409; el cliente
+reintenta). Una clave en curso más vieja que IDEMPOTENCY_LEASE_SECONDS es
+de un proceso que murió y se retoma.
+
+Los errores 5xx y las excepciones no se guardan: se borra la clave y el
+cliente puede reintentar.
+
+Como el trabajo y el resultado ya no se confirman juntos, el trabajo debe
+tolerar repetirse si el proceso muere entre ambos: el checkout Webpay se
+apoya en el token único de Pago.
+"""
+import hashlib
+import json
+import time
+from datetime import timedelta
+from functools import wraps
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.http import JsonResponse
+from django.utils import timezone
+
+from orders.models import ClaveIdempotencia
+
+
+HEADER = "Idempotency-Key"
+ESPERA = 0.1       # segundos entre relecturas de una clave en curso
+ESPERA_MAX = 5.0
+
+
+class ClaveReutilizada(ValueError):
+    """La misma clave llegó con otro contenido."""
+
+
+class EnCurso(Exception):
+    """Otro proceso está ejecutando la operación de esta clave."""
+
+
+def huella(contenido):
+    if isinstance(contenido, str):
+        contenido = contenido.encode("utf-8")
+    return hashlib.sha256(contenido or b"").hexdigest()
+
+
+def _lease():
+    return timedelta(seconds=getattr(settings, "IDEMPOTENCY_LEASE_SECONDS", 300))
+
+
+def _esperar(ambito, clave):
+    """
+    Relee la clave hasta que tenga resultado. Dentro de una transacción
+    externa (REPEATABLE READ) la lectura no avanza del snapshot: se lee una
+    vez y, si no se ve el resultado, el llamador recibe EnCurso en vez de un
+    error.
+    """
+    limite = time.monotonic() + ESPERA_MAX
+    while True:
+        previo = ClaveIdempotencia.objects.filter(ambito=ambito, clave=clave).first()
+        if previo is not None and previo.status is not None:
+            return previo
+        if connection.in_atomic_block or time.monotonic() >= limite:
+            return previo
+        time.sleep(ESPERA)
+
+
+def _reservar(ambito, clave, huella):
+    """(registro nuevo, None) o (None, clave previa con resultado)."""
+    for _ in range(2):
+        try:
+            with transaction.atomic():
+                return ClaveIdempotencia.objects.create(ambito=ambito, clave=clave, huella=huella), None
+        except IntegrityError:
+            previo = _esperar(ambito, clave)
+        if previo is None:
+            raise EnCurso(clave)
+        if huella and previo.huella and previo.huella != huella:
+            raise ClaveReutilizada(clave)
+        if previo.status is not None:
+            return None, previo
+        vencida = ClaveIdempotencia.objects.filter(
+            pk=previo.pk, status__isnull=True, created_at__lt=timezone.now() - _lease()
+        )
+        if not vencida.delete()[0]:
+            raise EnCurso(clave)
+    raise EnCurso(clave)
+
+
+def ejecutar(ambito, clave, fn, huella=""):
+    """
+    fn() -> (status, cuerpo JSON-serializable). Retorna (status, cuerpo, repetida).
+    Lanza ClaveReutilizada si la clave ya se usó con otra huella y EnCurso
+    si otro proceso la está ejecutando.
+    """
+    registro, previo = _reservar(ambito, clave, huella)
+    if previo is not None:
+        return previo.status, previo.respuesta, True
+
+    try:
+        status, cuerpo = fn()
+    except BaseException:
+        registro.delete()
+        raise
+    if status >= 500:
+        registro.delete()
+        return status, cuerpo, False
+    ClaveIdempotencia.objects.filter(pk=registro.pk).update(status=status, respuesta=cuerpo)
+    return status, cuerpo, False
+
+
+def idempotente_json(ambito):
+    """
+    Para vistas JSON: si el request trae Idempotency-Key, la primera respuesta
+    se guarda y los reintentos la reciben tal cual (con Idempotent-Replayed).
+    Sin header la vista se comporta como siempre.
+    """
+    def deco(viewfunc):
+        @wraps(viewfunc)
+        def _wrapped(request, *args, **kwargs):
+            clave = (request.headers.get(HEADER) or "").strip()
+            if not clave or request.method != "POST":
+                return viewfunc(request, *args, **kwargs)
+            if len(clave) > 128:
+                return JsonResponse({"detail": f"{HEADER} demasiado largo."}, status=400)
+
+            def trabajo():
+                resp = viewfunc(request, *args, **kwargs)
+                return resp.status_code, json.loads(resp.content or b"null")
+
+            try:
+                status, cuerpo, repetida = ejecutar(ambito, clave, trabajo, huella=huella(request.body))
+            except ClaveReutilizada:
+                return JsonResponse(
+                    {"detail": f"{HEADER} ya usado con otro contenido."}, status=422
+                )
+            except EnCurso:
+                return JsonResponse(
+                    {"detail": "La operación con esta clave sigue en curso; reintenta."}, status=409
+                )
+            resp = JsonResponse(cuerpo, status=status, safe=False)
+            if repetida:
+                resp["Idempotent-Replayed"] = "true"
+            return resp
+        return _wrapped
+    return deco
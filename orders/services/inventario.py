@@ -0,0 +1,63 @@
+# orders/services/inventario.py
+"""
+Stock por TipoTicket sin bloqueos de tabla.
+
+Cada movimiento es un único UPDATE condicional sobre la fila del tipo:
+
+    UPDATE tipoticket SET vendidos = vendidos + n
+     WHERE id = ? AND (capacidad IS NULL OR vendidos + reservados + n <= capacidad)
+
+Si no actualiza filas, no hay stock. Dos checkouts concurrentes por las
+últimas entradas se serializan en el lock de fila del UPDATE y sólo uno
+cumple la condición. Los tipos se toman en orden de id para que dos
+carritos con los mismos tipos no se bloqueen mutuamente.
+"""
+from django.db import transaction
+from django.db.models import F, Q
+
+from tickets.models import TipoTicket
+
+
+class StockInsuficiente(ValueError):
+    def __init__(self, tipo):
+        super().__init__(f"No quedan entradas suficientes de {tipo.nombre}.")
+        self.tipo = tipo
+
+
+def _hay_cupo(cantidad):
+    return Q(capacidad__isnull=True) | Q(capacidad__gte=F("vendidos") + F("reservados") + cantidad)
+
+
+def agrupar(items):
+    """[(tipo, cantidad)] -> [(tipo, total)] sumando repetidos, ordenado por id."""
+    por_tipo = {}
+    for tipo, cantidad in items:
+        if cantidad > 0:
+            t, n = por_tipo.get(tipo.id, (tipo, 0))
+            por_tipo[tipo.id] = (t, n + cantidad)
+    return [por_tipo[k] for k in sorted(por_tipo)]
+
+
+def tomar_stock(items, campo="vendidos"):
+    """
+    Descuenta stock para todos los items o para ninguno.
+    items: [(TipoTicket, cantidad), ...]. Lanza StockInsuficiente.
+    campo: "vendidos" (venta) o "reservados" (reserva durante el pago).
+    """
+    with transaction.atomic():
+        for tipo, cantidad in agrupar(items):
+            ok = (
+                TipoTicket.objects
+                .filter(_hay_cupo(cantidad), id=tipo.id)
+                .update(**{campo: F(campo) + cantidad})
+            )
+            if not ok:
+                raise StockInsuficiente(tipo)
+
+
+def liberar_stock(items):
+    """Devuelve stock vendido (p. ej. al anular tickets)."""
+    for tipo, cantidad in agrupar(items):
+        TipoTicket.objects.filter(id=tipo.id, vendidos__gte=cantidad).update(
+            vendidos=F("vendidos") - cantidad
+        )
@@ -0,0 +1,129 @@
+# orders/services/metricas_puerta.py
+"""
+Métricas en vivo por puerta (AccessPoint) sin consultar ValidationLog.
+
+Cada validación incrementa, en el cache, dos contadores del minuto actual:
+
+    gm:<cuenta>:<puerta>:<minuto>:<result>   lecturas por resultado
+    gm:<cuenta>:<puerta>:<minuto>:lat<i>     histograma de latencia
+
+Las lecturas sin puerta usan 0. El resumen lee la ventana con un solo
+get_many y calcula lecturas/min, tasa de rechazo y p95 (cota superior del
+bucket). Los contadores expiran solos.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+RESULTADOS = ("OK", "ALREADY_USED", "NOT_FOUND", "DENIED")
+BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)  # + uno abierto al final
+TTL = 2 * 60 * 60
+VENTANA_MAX = 60
+
+
+def _habilitado():
+    return getattr(settings, "GATE_METRICS_ENABLED", True)
+
+
+def _minuto(ahora=None):
+    return int((ahora if ahora is not None else time.time()) // 60)
+
+
+def _key(cuenta_id, ap_id, minuto, campo):
+    return f"gm:{cuenta_id}:{ap_id or 0}:{minuto}:{campo}"
+
+
+def _bucket(latencia_ms):
+    for i, limite in enumerate(BUCKETS_MS):
+        if latencia_ms <= limite:
+            return i
+    return len(BUCKETS_MS)
+
+
+def _incr(key, n=1):
+    if cache.add(key, n, TTL):
+        return
+    try:
+        cache.incr(key, n)
+    except ValueError:
+        # Expiró entre el add y el incr
+        cache.add(key, n, TTL)
+
+
+def registrar(cuenta_id, ap_id, result, latencia_ms=None, ahora=None):
+    if not _habilitado():
+        return
+    minuto = _minuto(ahora)
+    _incr(_key(cuenta_id, ap_id, minuto, result))
+    if latencia_ms is not None:
+        _incr(_key(cuenta_id, ap_id, minuto, f"lat{_bucket(latencia_ms)}"))
+
+
+def registrar_lote(cuenta_id, ap_id, lecturas):
+    """
+    Lecturas de un lote sin conexión: [(result, scanned_at datetime), ...].
+    Cada una cuenta en el minuto en que se escaneó, agrupadas en un incr por
+    (minuto, resultado). Sin latencia: el lote no mide la puerta en vivo.
+    """
+    if not _habilitado():
+        return
+    conteo = {}
+    for result, scanned_at in lecturas:
+        k = (_minuto(scanned_at.timestamp()), result)
+        conteo[k] = conteo.get(k, 0) + 1
+    for (minuto, result), n in conteo.items():
+        _incr(_key(cuenta_id, ap_id, minuto, result), n)
+
+
+def _p95(histograma):
+    total = sum(histograma)
+    if not total:
+        return None
+    objetivo, acumulado = total * 0.95, 0
+    for i, n in enumerate(histograma):
+        acumulado += n
+        if acumulado >= objetivo:
+            return BUCKETS_MS[i] if i < len(BUCKETS_MS) else None
+    return None
+
+
+def resumen(cuenta_id, ap_ids, minutos=None, ahora=None):
+    """
+    Retorna {ap_id: {...}} para las puertas indicadas (0 = sin puerta), con
+    la ventana de los últimos `minutos` (incluido el minuto en curso).
+    """
+    minutos = max(1, min(int(minutos or getattr(settings, "GATE_METRICS_WINDOW_MINUTES", 5)), VENTANA_MAX))
+    actual = _minuto(ahora)
+    rango = range(actual - minutos + 1, actual + 1)
+    campos = RESULTADOS + tuple(f"lat{i}" for i in range(len(BUCKETS_MS) + 1))
+
+    keys = [_key(cuenta_id, ap, m, c) for ap in ap_ids for m in rango for c in campos]
+    valores = cache.get_many(keys)
+
+    data = {}
+    for ap in ap_ids:
+        por_result = {r: 0 for r in RESULTADOS}
+        serie = []
+        histograma = [0] * (len(BUCKETS_MS) + 1)
+        for m in rango:
+            en_minuto = 0
+            for r in RESULTADOS:
+                n = valores.get(_key(cuenta_id, ap, m, r), 0)
+                por_result[r] += n
+                en_minuto += n
+            serie.append(en_minuto)
+            for i in range(len(histograma)):
+                histograma[i] += valores.get(_key(cuenta_id, ap, m, f"lat{i}"), 0)
+
+        total = sum(por_result.values())
+        data[ap] = {
+            "scans": total,
+            "scans_min": round(total / minutos, 1),
+            "por_resultado": por_result,
+            "reject_rate": round((total - por_result["OK"]) / total * 100, 1) if total else 0,
+            "p95_ms": _p95(histograma),
+            "serie": serie,
+        }
+    return data
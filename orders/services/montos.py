@@ -0,0 +1,114 @@
+# orders/services/montos.py
+"""
+Montos congelados de órdenes y tickets.
+
+emitir_tickets guarda en cada ticket el precio del tipo al momento de la
+compra. congelar() reparte el descuento de la orden entre sus tickets y
+guarda subtotal, descuento y total en la Orden, así los reportes suman
+columnas en vez de cruzar cada ticket con el precio actual del tipo:
+
+  cortesía (N-1)           entradas más caras (sin estacionamiento) gratis
+  código de un tipo        sólo entre los tickets de ese tipo
+  resto                    proporcional al precio, en pesos enteros
+
+backfill() completa las órdenes anteriores (total NULL) por lotes: precio
+actual del tipo, sin descuento salvo que el libro de pagos diga que se
+cobró menos.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+
+from orders.models import Orden, Pago, Ticket
+
+
+LOTE = 500
+CERO = Decimal("0")
+
+
+def repartir(tickets, monto, origen=None, tipo_ticket_id=None):
+    """Asigna descuento/neto a cada ticket (en memoria). `monto` se acota al subtotal elegible."""
+    for t in tickets:
+        t.descuento = CERO
+    elegibles = list(tickets)
+    if origen == "cortesia":
+        elegibles = sorted((t for t in tickets if not t.tipo.is_parking), key=lambda t: t.precio, reverse=True)
+    elif tipo_ticket_id:
+        elegibles = [t for t in tickets if t.tipo_id == tipo_ticket_id]
+
+    base = sum((t.precio for t in elegibles), CERO)
+    restante = min(Decimal(monto or 0), base)
+    if origen == "cortesia":
+        for t in elegibles:
+            t.descuento = min(t.precio, restante)
+            restante -= t.descuento
+    elif restante > 0:
+        # Proporcional al precio y redondeado a pesos; el resto de redondeo
+        # va a los tickets más caros, sin pasar su precio
+        total = restante
+        for t in elegibles:
+            t.descuento = (total * t.precio / base).quantize(Decimal("1"), rounding="ROUND_FLOOR")
+            restante -= t.descuento
+        for t in sorted(elegibles, key=lambda t: t.precio, reverse=True):
+            if restante <= 0:
+                break
+            extra = min(restante, t.precio - t.descuento)
+            t.descuento += extra
+            restante -= extra
+
+    for t in tickets:
+        t.neto = t.precio - t.descuento
+    return tickets
+
+
+def congelar(orden, tickets, descuento=0, origen=None, tipo_ticket_id=None):
+    """
+    Reparte el descuento y guarda los montos de la orden. Llamar dentro de la
+    transacción que crea la orden, con los tickets que retornó emitir_tickets.
+    """
+    repartir(tickets, descuento, origen=origen, tipo_ticket_id=tipo_ticket_id)
+    con_descuento = [t for t in tickets if t.descuento]
+    if con_descuento:
+        Ticket.objects.bulk_update(con_descuento, ["descuento", "neto"], batch_size=LOTE)
+
+    orden.subtotal = sum((t.precio for t in tickets), CERO)
+    orden.descuento = sum((t.descuento for t in tickets), CERO)
+    orden.total = orden.subtotal - orden.descuento
+    Orden.objects.filter(pk=orden.pk).update(subtotal=orden.subtotal, descuento=orden.descuento, total=orden.total)
+    return orden
+
+
+def backfill(lote=LOTE):
+    """Completa los montos de las órdenes sin total, lote a lote. Retorna cuántas completó."""
+    total = 0
+    ultimo = 0
+    while True:
+        ids = list(
+            Orden.objects.filter(total__isnull=True, pk__gt=ultimo).order_by("pk").values_list("pk", flat=True)[:lote]
+        )
+        if not ids:
+            return total
+        ultimo = ids[-1]
+        with transaction.atomic():
+            tickets = list(
+                Ticket.objects.filter(orden_id__in=ids).select_related("tipo").only(
+                    "id", "orden_id", "precio", "tipo__precio", "tipo__is_parking"
+                )
+            )
+            cobrado = dict(Pago.objects.filter(orden_id__in=ids).values_list("orden_id", "monto"))
+            por_orden = {pk: [] for pk in ids}
+            for t in tickets:
+                if t.precio is None:
+                    t.precio = t.tipo.precio
+                por_orden[t.orden_id].append(t)
+
+            ordenes = []
+            for pk, suyos in por_orden.items():
+                subtotal = sum((t.precio for t in suyos), CERO)
+                descuento = max(CERO, subtotal - cobrado[pk]) if pk in cobrado else CERO
+                repartir(suyos, descuento)
+                ordenes.append(Orden(pk=pk, subtotal=subtotal, descuento=descuento, total=subtotal - descuento))
+            Ticket.objects.bulk_update(tickets, ["precio", "descuento", "neto"], batch_size=LOTE)
+            Orden.objects.bulk_update(ordenes, ["subtotal", "descuento", "total"], batch_size=LOTE)
+        total += len(ids)
+
@@ -0,0 +1,112 @@
+# orders/services/paginacion.py
+"""
+Paginación por cursor (keyset) para listados de órdenes.
+
+Paginator hace COUNT(*) del filtro completo y después LIMIT/OFFSET: la
+página 5.000 lee y descarta 100.000 filas. Acá cada página continúa desde
+el último (created_at, id) visto:
+
+    WHERE created_at < t OR (created_at = t AND id < i)
+    ORDER BY created_at DESC, id DESC LIMIT n + 1
+
+con el índice (cuenta|evento, created_at, id), así cualquier página cuesta
+lo mismo que la primera. El cursor va firmado (opaco para el navegador y
+sin poder armar uno a mano).
+
+El total no se cuenta entero: contar_hasta() cuenta hasta un tope con un
+COUNT sobre un LIMIT, y sólo en la primera página.
+
+Los tickets por orden se cuentan después, sólo para las órdenes de la
+página (contar_tickets): anotar Count("tickets") en el queryset paginado
+agregaría el JOIN y el GROUP BY sobre todo el rango del cursor.
+"""
+from django.core import signing
+from django.db.models import Count, Q
+from django.utils.dateparse import parse_datetime
+
+from orders.models import Ticket
+
+
+SALT = "orders.paginacion"
+POR_PAGINA = 20
+TOPE_CONTEO = 1000
+
+
+class Pagina:
+    def __init__(self, items, siguiente=None, anterior=None):
+        self.items = items
+        self.siguiente = siguiente  # cursor a las más antiguas, o None
+        self.anterior = anterior    # cursor a las más recientes, o None
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def _cursor(obj, direccion):
+    return signing.dumps({"t": obj.created_at.isoformat(), "i": obj.pk, "d": direccion}, salt=SALT)
+
+
+def _leer(cursor):
+    try:
+        datos = signing.loads(cursor, salt=SALT)
+        return parse_datetime(datos["t"]), int(datos["i"]), datos["d"]
+    except (signing.BadSignature, KeyError, TypeError, ValueError):
+        return None
+
+
+def paginar(qs, cursor=None, por_pagina=POR_PAGINA):
+    """
+    Página de qs en orden (-created_at, -id) a partir de `cursor`. Un cursor
+    inválido o adulterado vuelve a la primera página.
+    """
+    pos = _leer(cursor) if cursor else None
+    if pos is None or pos[0] is None:
+        filas = list(qs.order_by("-created_at", "-pk")[:por_pagina + 1])
+        hay_mas = len(filas) > por_pagina
+        filas = filas[:por_pagina]
+        return Pagina(filas, siguiente=_cursor(filas[-1], "n") if hay_mas else None)
+
+    t, i, direccion = pos
+    if direccion == "p":
+        # Hacia las más recientes: se lee en orden ascendente y se invierte
+        filas = list(
+            qs.filter(Q(created_at__gt=t) | Q(created_at=t, pk__gt=i))
+            .order_by("created_at", "pk")[:por_pagina + 1]
+        )
+        hay_mas = len(filas) > por_pagina
+        filas = filas[:por_pagina][::-1]
+        return Pagina(
+            filas,
+            siguiente=_cursor(filas[-1], "n") if filas else None,
+            anterior=_cursor(filas[0], "p") if hay_mas else None,
+        )
+
+    filas = list(
+        qs.filter(Q(created_at__lt=t) | Q(created_at=t, pk__lt=i))
+        .order_by("-created_at", "-pk")[:por_pagina + 1]
+    )
+    hay_mas = len(filas) > por_pagina
+    filas = filas[:por_pagina]
+    return Pagina(
+        filas,
+        siguiente=_cursor(filas[-1], "n") if hay_mas else None,
+        anterior=_cursor(filas[0], "p") if filas else None,
+    )
+
+
+def contar_hasta(qs, tope=TOPE_CONTEO):
+    """(n, exacto): cuenta a lo más tope + 1 filas."""
+    n = qs.order_by().values("pk")[:tope + 1].count()
+    return min(n, tope), n <= tope
+
+
+def contar_tickets(pagina):
+    """Pone n_tickets en cada orden de la página con un GROUP BY sobre sus ids."""
+    ids = [o.pk for o in pagina.items]
+    conteo = dict(
+        Ticket.objects.filter(orden_id__in=ids).order_by()
+        .values("orden_id").annotate(n=Count("id")).values_list("orden_id", "n")
+    ) if ids else {}
+    for o in pagina.items:
+        o.n_tickets = conteo.get(o.pk, 0)
+    return pagina
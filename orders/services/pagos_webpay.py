@@ -0,0 +1,234 @@
+# orders/services/pagos_webpay.py
+"""
+Confirmación de pagos Webpay fuera del request del comprador.
+
+  registrar()   public_checkout_pay: guarda token, carrito y comprador en
+                una TransaccionWebpay ("creada").
+  recibir()     webpay_return: sólo marca la transacción "recibida" y el
+                navegador pasa a la página de estado. El worker de
+                gunicorn queda libre en milisegundos.
+  procesar_pendientes()  comando process_webpay_commits: toma las
+                recibidas con un UPDATE condicional (varios workers no
+                procesan la misma), hace el commit en Transbank y crea la
+                orden. Una "procesando" cuyo worker murió se retoma tras
+                WEBPAY_COMMIT_LEASE_SECONDS.
+  estado()      la página de estado consulta esto por JSON hasta que la
+                transacción queda pagada, rechazada o fallida.
+
+El commit y la orden pasan por idempotencia.ejecutar("webpay", token): si
+un worker muere después de crear la orden, el que retoma repite el
+resultado guardado en vez de crear otra. Si murió entre crear la orden y
+guardar ese resultado, la encuentra por el token único de su Pago. Un
+error técnico con Transbank deja la transacción "recibida" para el
+siguiente intento; al reintentar se consulta primero el estado, porque el
+commit anterior pudo haber llegado.
+
+Un pago autorizado cuya orden no se puede crear (agotado, carrito
+inválido) queda "rechazada" con el motivo y un log de reembolso pendiente.
+Tras MAX_INTENTOS (errores técnicos, excepciones o workers caídos) queda
+"fallida".
+
+Con WEBPAY_COMMIT_MODE = "sync" webpay_return procesa en el mismo request
+(desarrollo sin worker).
+"""
+import logging
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from transbank.error.transbank_error import TransbankError
+
+from core.webpay import wb
+from orders.models import Pago, TransaccionWebpay
+from orders.services import idempotencia, reservas
+from orders.services.checkout import finalizar_pago_y_generar_codigo
+from orders.services.inventario import StockInsuficiente
+
+
+logger = logging.getLogger(__name__)
+
+FINALES = ("pagada", "rechazada", "fallida")
+LOTE = 20
+MAX_INTENTOS = 5
+
+
+def modo():
+    return getattr(settings, "WEBPAY_COMMIT_MODE", "async")
+
+
+def _lease():
+    return timedelta(seconds=getattr(settings, "WEBPAY_COMMIT_LEASE_SECONDS", 120))
+
+
+def registrar(evento, token, buy_order, monto, payload, buyer):
+    return TransaccionWebpay.objects.create(
+        token=token, evento=evento, buy_order=buy_order, monto=monto, payload=payload, buyer=buyer,
+    )
+
+
+def recibir(token):
+    """
+    Marca la transacción para el worker. Retorna la fila, o None si el token
+    no es de un pago iniciado acá. Un segundo POST del mismo token (recarga,
+    reintento de Transbank) no la vuelve a encolar.
+    """
+    TransaccionWebpay.objects.filter(token=token, estado="creada").update(
+        estado="recibida", updated_at=timezone.now()
+    )
+    return TransaccionWebpay.objects.filter(token=token).first()
+
+
+def abortar(token):
+    """El comprador anuló en el formulario de Webpay (llega TBK_TOKEN)."""
+    TransaccionWebpay.objects.filter(token=token, estado="creada").update(
+        estado="rechazada", resultado={"reason": "missing-token"}, updated_at=timezone.now()
+    )
+
+
+def estado(token):
+    """{"estado", "listo"} con una consulta por índice único, o None."""
+    actual = TransaccionWebpay.objects.filter(token=token).values_list("estado", flat=True).first()
+    if actual is None:
+        return None
+    return {"estado": actual, "listo": actual in FINALES}
+
+
+def _commit(token, reintento):
+    if reintento:
+        # El commit anterior pudo llegar a Transbank aunque la respuesta se
+        # perdiera: repetirlo daría 422. Si ya no está INITIALIZED, vale el estado.
+        try:
+            tx = wb().status(token)
+            if tx.get("status") != "INITIALIZED":
+                return tx
+        except TransbankError:
+            pass
+    return wb().commit(token)
+
+
+def _confirmar(t):
+    """
+    Commit en Webpay + creación de la orden. Retorna (status, resultado) con
+    resultado {"orden_id"} o {"reason", "detail"}; lo guarda idempotencia.
+    """
+    # Orden ya creada por un intento que murió antes de guardar el resultado
+    orden_id = Pago.objects.filter(token=t.token).values_list("orden_id", flat=True).first()
+    if orden_id:
+        return 200, {"orden_id": orden_id}
+
+    try:
+        tx = _commit(t.token, t.intentos > 1)
+    except Exception as e:
+        # Error técnico con Webpay (no se guarda: el siguiente intento repite)
+        return 502, {"reason": "webpay-error", "detail": str(e)}
+
+    if tx.get("response_code") != 0 or tx.get("status") != "AUTHORIZED":
+        return 402, {"reason": "not-authorized", "detail": tx}
+
+    webpay_data = {
+        "token": t.token,
+        "authorization_code": tx.get("authorization_code"),
+        "amount": tx.get("amount"),
+        "buy_order": tx.get("buy_order"),
+        "session_id": tx.get("session_id"),
+        "card_last4": (tx.get("card_detail") or {}).get("card_number"),
+        "status": tx.get("status"),
+        "transaction_date": tx.get("transaction_date"),
+    }
+    try:
+        orden = finalizar_pago_y_generar_codigo(
+            evento=t.evento, payload=t.payload, buyer=t.buyer, webpay_data=webpay_data
+        )
+    except StockInsuficiente as e:
+        # La reserva venció y el tipo se agotó mientras el comprador pagaba
+        return 409, {"reason": "sold-out", "detail": str(e)}
+    except Exception as e:
+        # Carrito que ya no calza con el evento (tipo borrado, datos
+        # inválidos...): reintentar no lo arregla y el cobro ya se hizo
+        logger.exception("Pago %s autorizado sin orden", t.buy_order)
+        return 422, {"reason": "order-error", "detail": str(e)}
+    return 200, {"orden_id": orden.id}
+
+
+def procesar(t):
+    """Confirma una transacción ya tomada ("procesando") y guarda el resultado."""
+    try:
+        status, resultado, _ = idempotencia.ejecutar("webpay", t.token, lambda: _confirmar(t))
+    except idempotencia.EnCurso:
+        # Otro worker lo está confirmando (se le venció el lease): se reintenta después
+        TransaccionWebpay.objects.filter(pk=t.pk, estado="procesando").update(
+            estado="recibida", updated_at=timezone.now()
+        )
+        return "recibida"
+    campos = {"updated_at": timezone.now()}
+    if status == 200:
+        campos.update(estado="pagada", orden_id=resultado["orden_id"], resultado=None)
+    elif status >= 500:
+        final = t.intentos >= MAX_INTENTOS
+        campos.update(estado="fallida" if final else "recibida", resultado=resultado)
+        if final:
+            logger.error("Pago %s sin confirmar tras %s intentos: %s", t.buy_order, t.intentos, resultado)
+    else:
+        campos.update(estado="rechazada", resultado=resultado)
+        if resultado.get("reason") == "not-authorized" and t.payload.get("reserva"):
+            reservas.liberar(t.payload["reserva"])
+        elif resultado.get("reason") in ("sold-out", "order-error"):
+            logger.error("Pago %s autorizado sin orden, requiere reembolso: %s", t.buy_order, resultado)
+    TransaccionWebpay.objects.filter(pk=t.pk, estado="procesando").update(**campos)
+    return campos["estado"]
+
+
+def _fallar(filtro, buy_order, intentos, detalle):
+    """Marca "fallida" una transacción que agotó sus intentos."""
+    if TransaccionWebpay.objects.filter(**filtro).update(
+        estado="fallida", resultado={"reason": "worker-error", "detail": detalle}, updated_at=timezone.now()
+    ):
+        logger.error("Pago %s sin confirmar tras %s intentos: %s", buy_order, intentos, detalle)
+
+
+def _tomar(lote):
+    """Reclama hasta `lote` transacciones con UPDATE condicional por fila."""
+    ahora = timezone.now()
+    candidatas = list(
+        TransaccionWebpay.objects
+        .filter(Q(estado="recibida") | Q(estado="procesando", updated_at__lt=ahora - _lease()))
+        .order_by("updated_at")
+        .values_list("pk", "estado", "updated_at", "intentos", "buy_order")[:lote]
+    )
+    tomadas = []
+    for pk, est, updated_at, intentos, buy_order in candidatas:
+        filtro = {"pk": pk, "estado": est, "updated_at": updated_at}
+        if est == "procesando" and intentos >= MAX_INTENTOS:
+            # El worker murió con ella en cada intento: no se retoma más
+            _fallar(filtro, buy_order, intentos, "lease vencido")
+            continue
+        if TransaccionWebpay.objects.filter(**filtro).update(
+            estado="procesando", intentos=F("intentos") + 1, updated_at=ahora
+        ):
+            tomadas.append(pk)
+    return list(TransaccionWebpay.objects.select_related("evento").filter(pk__in=tomadas))
+
+
+def procesar_pendientes(lote=LOTE):
+    """Una pasada del worker. Retorna cuántas transacciones procesó."""
+    tomadas = _tomar(lote)
+    for t in tomadas:
+        try:
+            procesar(t)
+        except Exception as e:
+            logger.exception("Error procesando pago %s", t.buy_order)
+            filtro = {"pk": t.pk, "estado": "procesando"}
+            if t.intentos >= MAX_INTENTOS:
+                _fallar(filtro, t.buy_order, t.intentos, str(e))
+            else:
+                TransaccionWebpay.objects.filter(**filtro).update(estado="recibida", updated_at=timezone.now())
+    return len(tomadas)
+
+
+def procesar_ahora(token):
+    """Modo "sync": webpay_return confirma en el mismo request."""
+    if TransaccionWebpay.objects.filter(token=token, estado="recibida").update(
+        estado="procesando", intentos=F("intentos") + 1, updated_at=timezone.now()
+    ):
+        procesar(TransaccionWebpay.objects.select_related("evento").get(token=token))
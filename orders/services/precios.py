@@ -0,0 +1,231 @@
+# orders/services/precios.py
+"""
+Cotización única del carrito: la usan validar_promocode, checkout_crear_orden
+y public_checkout_pay.
+
+La tabla de precios del evento (tipos y códigos de descuento activos) se
+arma con dos consultas y se guarda en memoria del proceso, con una versión
+en el cache compartido como en codigos_promo: orders.signals sube la
+versión al guardar o borrar un TipoTicket o DiscountCode y cada proceso la
+compara antes de usar su copia. Sin CACHES compartido la versión no cruza
+workers; por eso la copia vence además tras PRICE_TABLE_TTL_SECONDS.
+vendidos/reservados de los tipos quedan desactualizados a propósito: el
+stock se controla en inventario con UPDATE condicionales, no con esta tabla.
+
+El código se resuelve con codigos_promo.buscar (mapa en memoria por evento).
+PromoCode y SharedPurchaseCode se leen por pk al cotizar: sus usos cambian
+con cada compra.
+"""
+import threading
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from orders.models import PromoCode, SharedPurchaseCode
+from orders.services import codigos_promo
+from tickets.models import DiscountCode, TipoTicket
+
+
+CODIGO_INEXISTENTE = "El código ingresado no es válido."
+
+_tablas = {}  # evento_id -> (version, construida_en, tabla)
+_lock = threading.Lock()
+
+
+class ItemInvalido(ValueError):
+    pass
+
+
+def _version_key(evento_id):
+    return f"precios:{evento_id}:v"
+
+
+def _version(evento_id):
+    v = cache.get(_version_key(evento_id))
+    if v is None:
+        cache.add(_version_key(evento_id), time.time_ns(), None)
+        v = cache.get(_version_key(evento_id))
+    return v
+
+
+def invalidar(evento_id):
+    _tablas.pop(evento_id, None)
+    try:
+        cache.incr(_version_key(evento_id))
+    except ValueError:
+        cache.add(_version_key(evento_id), time.time_ns(), None)
+
+
+def _vigente(actual, version):
+    ttl = getattr(settings, "PRICE_TABLE_TTL_SECONDS", 30)
+    return actual is not None and actual[0] == version and time.monotonic() - actual[1] < ttl
+
+
+def tabla(evento_id):
+    """{"tipos": {id: TipoTicket}, "descuentos": {id: DiscountCode}} del evento."""
+    version = _version(evento_id)
+    actual = _tablas.get(evento_id)
+    if not _vigente(actual, version):
+        with _lock:
+            actual = _tablas.get(evento_id)
+            if not _vigente(actual, version):
+                t = {
+                    "tipos": {tt.id: tt for tt in TipoTicket.objects.filter(evento_id=evento_id)},
+                    "descuentos": {
+                        d.id: d for d in DiscountCode.objects.filter(evento_id=evento_id, activo=True)
+                    },
+                }
+                actual = (version, time.monotonic(), t)
+                _tablas[evento_id] = actual
+    return actual[2]
+
+
+def tipos_activos(evento_id):
+    return sorted(
+        (t for t in tabla(evento_id)["tipos"].values() if t.activo),
+        key=lambda t: (t.precio, t.nombre),
+    )
+
+
+def _lineas(evento_id, items):
+    """items: [{"tipo_ticket_id", "cantidad"}] del front -> líneas de carrito."""
+    tipos = tabla(evento_id)["tipos"]
+    por_tipo = {}
+    for it in items:
+        try:
+            tt_id = int(it.get("tipo_ticket_id"))
+            cantidad = int(it.get("cantidad") or 0)
+        except (TypeError, ValueError, AttributeError):
+            raise ItemInvalido("Ítems inválidos.")
+        if cantidad <= 0:
+            continue
+        tipo = tipos.get(tt_id)
+        if tipo is None or not tipo.activo:
+            raise ItemInvalido("Ítems inválidos.")
+        por_tipo[tt_id] = por_tipo.get(tt_id, 0) + cantidad
+
+    return [
+        {"tipo": tipos[tt_id], "cantidad": cantidad, "precio_unitario": Decimal(tipos[tt_id].precio)}
+        for tt_id, cantidad in por_tipo.items()
+    ]
+
+
+def descuento_cortesia(lineas, usos_disp):
+    """
+    N-1: las entradas más caras (sin estacionamiento) quedan gratis hasta
+    agotar los usos. Retorna (monto, usos que consume).
+    """
+    entradas = [i for i in lineas if not i["tipo"].is_parking and i["cantidad"] > 0]
+    entradas.sort(key=lambda x: x["precio_unitario"], reverse=True)
+
+    monto = Decimal("0")
+    usos = 0
+    for item in entradas:
+        if usos >= usos_disp:
+            break
+        aplica = min(item["cantidad"], usos_disp - usos)
+        monto += item["precio_unitario"] * aplica
+        usos += aplica
+    return monto, usos
+
+
+def _evaluar_descuento(d, lineas, subtotal):
+    """(monto, mensaje de error) para un DiscountCode."""
+    hoy = timezone.now().date()
+    if d.vigente_desde and hoy < d.vigente_desde:
+        return 0, "El código aún no está vigente."
+    if d.vigente_hasta and hoy > d.vigente_hasta:
+        return 0, "El código ya no está vigente."
+    if d.tipo_ticket_id and not any(li["tipo"].id == d.tipo_ticket_id for li in lineas):
+        return 0, "Este código requiere un tipo de ticket específico en el carrito."
+    # Los usos se consultan en vivo (no se cachean): una suma de los
+    # contadores por cotización, no disponible() + usos_totales()
+    if d.usos_maximos is not None and d.usos_totales() >= d.usos_maximos:
+        return 0, "Este código alcanzó su límite de usos."
+    monto = min(Decimal(d.monto_descuento), subtotal)
+    if monto <= 0:
+        return 0, "El código no genera descuento con este carrito."
+    return monto, None
+
+
+def _evaluar_promo(p, subtotal):
+    """(monto, mensaje de error) para un PromoCode (porcentaje o monto fijo)."""
+    if not p.disponible:
+        return 0, "Este código no está disponible."
+    if p.tipo == "percent":
+        monto = (subtotal * Decimal(p.valor) / 100).quantize(Decimal("1"))
+    else:
+        monto = Decimal(p.valor)
+    monto = min(monto, subtotal)
+    if monto <= 0:
+        return 0, "El código no genera descuento con este carrito."
+    return monto, None
+
+
+def cotizar(evento, items, code=None):
+    """
+    Cotiza el carrito. Lanza ItemInvalido si un ítem no corresponde al evento.
+
+    Retorna:
+      {
+        "lineas": [{"tipo", "cantidad", "precio_unitario"}, ...],
+        "subtotal": Decimal,
+        "descuentos": [{"origen": "descuento"|"promo"|"cortesia", "codigo", "monto", "usos"}],
+        "descuento": Decimal,
+        "total": Decimal,
+        "codigo": DiscountCode | PromoCode | SharedPurchaseCode | None,   # el que aplicó
+        "error_codigo": str | None,
+      }
+    """
+    lineas = _lineas(evento.id, items)
+    subtotal = sum((li["precio_unitario"] * li["cantidad"] for li in lineas), Decimal("0"))
+    cot = {
+        "lineas": lineas,
+        "subtotal": subtotal,
+        "descuentos": [],
+        "descuento": Decimal("0"),
+        "total": subtotal,
+        "codigo": None,
+        "error_codigo": None,
+    }
+
+    code = (code or "").strip()
+    if not code or not lineas:
+        return cot
+
+    encontrado = codigos_promo.buscar(evento.id, code)
+    origen, pk = encontrado or (None, None)
+    d = None
+    if origen == "descuento":
+        # Código creado después de armar la copia de este proceso (sin CACHES
+        # compartido la versión no cruza workers): se lee por pk
+        d = tabla(evento.id)["descuentos"].get(pk) or DiscountCode.objects.filter(pk=pk, activo=True).first()
+    elif origen == "promo":
+        d = PromoCode.objects.filter(pk=pk, activo=True).first()
+    elif origen == "cortesia":
+        d = SharedPurchaseCode.objects.filter(pk=pk, active=True).first()
+    if d is None:
+        cot["error_codigo"] = CODIGO_INEXISTENTE
+        return cot
+
+    usos = 1
+    if origen == "descuento":
+        monto, error = _evaluar_descuento(d, lineas, subtotal)
+    elif origen == "promo":
+        monto, error = _evaluar_promo(d, subtotal)
+    else:
+        monto, usos = descuento_cortesia(lineas, d.remaining_uses) if d.is_valid_now() else (0, 0)
+        error = None if monto > 0 else "El código de cortesía no se puede aplicar a este carrito."
+
+    if error:
+        cot["error_codigo"] = error
+        return cot
+
+    cot["descuentos"].append({"origen": origen, "codigo": code, "monto": monto, "usos": usos})
+    cot["descuento"] = monto
+    cot["total"] = subtotal - monto
+    cot["codigo"] = d
+    return cot
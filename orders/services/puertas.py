@@ -0,0 +1,43 @@
+# orders/services/puertas.py
+"""Autorización de usuarios sobre puertas (AccessPoint)."""
+from django.core.cache import cache
+
+from accounts.models import UsuarioRol
+from orders.models import AccessPoint, AccessRole
+
+
+ROLES_ADMIN = ("superadmin", "admin", "staff")
+TTL_PERMISO = 60
+
+
+def puede_operar(usuario, cuenta, ap):
+    """True si el usuario tiene AccessRole en la puerta o es admin/staff de la cuenta."""
+    return (
+        AccessRole.objects.filter(usuario=usuario, access_point=ap, activo=True).exists()
+        or UsuarioRol.objects.filter(
+            usuario=usuario, cuenta=cuenta, rol__in=ROLES_ADMIN, activo=True
+        ).exists()
+    )
+
+
+def puerta_autorizada(usuario, cuenta, ap_id):
+    """
+    Retorna el id de la puerta si está activa, es de la cuenta y el usuario
+    puede operarla; None en otro caso. La decisión se cachea TTL_PERMISO
+    segundos para no sumar consultas a cada lectura.
+    """
+    key = f"ap-perm:{cuenta.id}:{usuario.id}:{ap_id}"
+    ok = cache.get(key)
+    if ok is None:
+        ap = AccessPoint.objects.filter(pk=ap_id, cuenta=cuenta, activo=True).first()
+        ok = bool(ap) and puede_operar(usuario, cuenta, ap)
+        cache.set(key, ok, TTL_PERMISO)
+    return int(ap_id) if ok else None
+
+
+def puertas_de(usuario, cuenta):
+    """Puertas activas de la cuenta que el usuario puede operar."""
+    aps = AccessPoint.objects.filter(cuenta=cuenta, activo=True)
+    if UsuarioRol.objects.filter(usuario=usuario, cuenta=cuenta, rol__in=ROLES_ADMIN, activo=True).exists():
+        return aps
+    return aps.filter(roles__usuario=usuario, roles__activo=True)
@@ -0,0 +1,101 @@
+# orders/services/qr_firma.py
+"""
+Contenido firmado de los QR de tickets.
+
+Formato (separado por puntos, apto para URL):
+
+    TF2.<code hex>.<evento_id b36>.<mac>
+
+mac = HMAC-SHA256 truncado (16 caracteres base64url, 96 bits) sobre todo lo
+anterior. Con esto la puerta descarta falsificaciones y tickets de otro
+evento sin consultar la base. El QR sólo lleva lo que no cambia después de
+emitir: el tipo y su día se leen de la base (reglas_acceso.verificar_dia) o
+del archivo de puerta, porque el productor puede cambiarlos.
+
+Siguen funcionando los QR ya emitidos:
+  - TF1.<code>.<evento>.<tipo>.<día AAAAMMDD | ->.<mac>: se verifica la
+    firma y se ignoran tipo y día (podían quedar desactualizados),
+  - el UUID pelado: leer_qr lo acepta sin datos adicionales.
+"""
+import base64
+import uuid
+
+from django.conf import settings
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+
+PREFIJO = "TF2"
+PREFIJO_V1 = "TF1"
+MAC_LEN = 16
+
+
+class QRInvalido(ValueError):
+    def __init__(self, nota):
+        super().__init__(nota)
+        self.nota = nota
+
+
+def _b36(n):
+    chars = "0123456789abcdefghijklmnopqrstuvwxyz"
+    s = ""
+    while True:
+        n, r = divmod(n, 36)
+        s = chars[r] + s
+        if not n:
+            return s
+
+
+def _mac(cuerpo):
+    secret = getattr(settings, "QR_SIGNING_KEY", None) or settings.SECRET_KEY
+    digest = salted_hmac("orders.qr_firma", cuerpo, secret=secret, algorithm="sha256").digest()
+    return base64.urlsafe_b64encode(digest).decode("ascii")[:MAC_LEN]
+
+
+def payload_qr(ticket):
+    """Texto a codificar en el QR del ticket."""
+    code = uuid.UUID(str(ticket.code)).hex
+    cuerpo = f"{PREFIJO}.{code}.{_b36(ticket.evento_id)}"
+    return f"{cuerpo}.{_mac(cuerpo)}"
+
+
+def leer_qr(raw):
+    """
+    Interpreta el contenido leído en puerta.
+
+    Retorna (code, datos):
+      - UUID pelado (tickets antiguos): (UUID, None)
+      - Firmado (TF2 o TF1): (UUID, {"evento_id"})
+    Lanza QRInvalido("MALFORMED" | "BAD_SIGNATURE").
+    """
+    raw = (raw or "").strip()
+    partes = raw.split(".")
+    if partes[0] not in (PREFIJO, PREFIJO_V1):
+        try:
+            return uuid.UUID(raw), None
+        except ValueError:
+            raise QRInvalido("MALFORMED")
+
+    if len(partes) != (4 if partes[0] == PREFIJO else 6):
+        raise QRInvalido("MALFORMED")
+
+    cuerpo, mac = ".".join(partes[:-1]), partes[-1]
+    if not constant_time_compare(mac, _mac(cuerpo)):
+        raise QRInvalido("BAD_SIGNATURE")
+
+    try:
+        code = uuid.UUID(hex=partes[1])
+        datos = {"evento_id": int(partes[2], 36)}
+    except ValueError:
+        raise QRInvalido("MALFORMED")
+    return code, datos
+
+
+def verificar_en_memoria(datos, *, evento_id=None):
+    """
+    Chequeos que no requieren la base. Retorna None o la nota del rechazo.
+    """
+    if not datos:
+        return None
+    if evento_id is not None and datos["evento_id"] != int(evento_id):
+        return "WRONG_EVENT"
+    return None
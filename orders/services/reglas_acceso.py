@@ -0,0 +1,92 @@
+# orders/services/reglas_acceso.py
+"""
+Reglas de acceso en puerta según TipoTicket:
+
+  access_policy
+    - un_dia: sólo el valid_day (si está definido) o, si no, el día del
+      primer ingreso.
+    - todos_los_dias: cualquier día entre fecha_inicio y fecha_termino
+      del evento (si están definidas).
+
+  reentry_rule
+    - una_vez_por_dia: un ingreso por día.
+    - ilimitado: entra y sale las veces que quiera en los días permitidos.
+
+El caso más común (un_dia + una_vez_por_dia) se resuelve sólo con
+Ticket.estado. El resto usa TicketEntrada, con unique (ticket, dia), de
+modo que "¿ya entró hoy?" es una búsqueda por índice.
+"""
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from orders.models import Ticket, TicketEntrada
+from tickets.models import TipoTicket
+
+
+def es_regla_simple(tipo):
+    return tipo.access_policy == "un_dia" and tipo.reentry_rule == "una_vez_por_dia"
+
+
+def tipos_simples_del_dia(dia):
+    """Subconsulta de tipos que se pueden quemar directo el día indicado."""
+    return (
+        TipoTicket.objects
+        .filter(access_policy="un_dia", reentry_rule="una_vez_por_dia")
+        .filter(Q(valid_day__isnull=True) | Q(valid_day=dia))
+        .values("id")
+    )
+
+
+def verificar_dia(t, dia):
+    """Retorna None si el ticket puede entrar ese día, o la nota del rechazo."""
+    tipo = t.tipo
+    if tipo.access_policy == "un_dia":
+        if tipo.valid_day:
+            return None if dia == tipo.valid_day else "WRONG_DAY"
+        # Sin día fijo, el reingreso ilimitado vale sólo el día del primer ingreso
+        if tipo.reentry_rule == "ilimitado" and t.used_at and timezone.localdate(t.used_at) != dia:
+            return "WRONG_DAY"
+        return None
+
+    ev = t.evento
+    if (ev.fecha_inicio and dia < ev.fecha_inicio) or (ev.fecha_termino and dia > ev.fecha_termino):
+        return "OUT_OF_EVENT_DATES"
+    return None
+
+
+def registrar_entrada(t, ahora):
+    """
+    Registra un ingreso para tickets con reingreso o multi-día.
+    Retorna (result, note). Marca el ticket como quemado en el primer ingreso.
+    """
+    dia = timezone.localdate(ahora)
+
+    if t.tipo.reentry_rule == "una_vez_por_dia":
+        try:
+            with transaction.atomic():
+                TicketEntrada.objects.create(ticket=t, dia=dia, primera_at=ahora, ultima_at=ahora)
+        except IntegrityError:
+            return "ALREADY_USED", "REPEAT_TODAY"
+    else:
+        actualizadas = (
+            TicketEntrada.objects
+            .filter(ticket=t, dia=dia)
+            .update(entradas=F("entradas") + 1, ultima_at=ahora)
+        )
+        if not actualizadas:
+            try:
+                with transaction.atomic():
+                    TicketEntrada.objects.create(ticket=t, dia=dia, primera_at=ahora, ultima_at=ahora)
+            except IntegrityError:
+                TicketEntrada.objects.filter(ticket=t, dia=dia).update(
+                    entradas=F("entradas") + 1, ultima_at=ahora
+                )
+
+    if t.estado == "disponible":
+        Ticket.objects.filter(id=t.id, estado="disponible").update(
+            estado="quemado", used_at=ahora, updated_at=ahora
+        )
+        t.estado = "quemado"
+        t.used_at = ahora
+    return "OK", ""
@@ -0,0 +1,132 @@
+# orders/services/reservas.py
+"""
+Reservas de stock durante el viaje a Webpay.
+
+  reservar()   public_checkout_pay: mueve cupo a TipoTicket.reservados con
+               el mismo UPDATE condicional de inventario y crea las filas
+               Reserva con vencimiento.
+  convertir()  al confirmar el pago: pasa lo reservado a vendidos y borra
+               la reserva. Si el barredor ya la venció, intenta tomar stock
+               de nuevo (puede no quedar).
+  liberar()    pago rechazado: devuelve el cupo de inmediato.
+  barrer_vencidas()  comando expire_checkout_holds.
+
+Quien borra la fila Reserva es quien mueve el contador, así conversión y
+barredor nunca descuentan dos veces la misma reserva.
+"""
+import uuid
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from orders.models import Reserva
+from orders.services.inventario import agrupar, tomar_stock
+from tickets.models import TipoTicket
+
+
+LOTE_BARRIDO = 1000
+
+
+def _ttl():
+    return timedelta(minutes=getattr(settings, "CHECKOUT_HOLD_MINUTES", 15))
+
+
+def reservar(evento, items, ahora=None):
+    """
+    Reserva todos los items o ninguno. items: [(TipoTicket, cantidad), ...].
+    Retorna (grupo, expires_at). Lanza inventario.StockInsuficiente.
+    """
+    ahora = ahora or timezone.now()
+    grupo = uuid.uuid4()
+    expires_at = ahora + _ttl()
+    lineas = agrupar(items)
+
+    with transaction.atomic():
+        tomar_stock(lineas, campo="reservados")
+        Reserva.objects.bulk_create([
+            Reserva(grupo=grupo, evento=evento, tipo=tipo, cantidad=cantidad, expires_at=expires_at)
+            for tipo, cantidad in lineas
+        ])
+    return grupo, expires_at
+
+
+def _soltar(filas):
+    """Borra las filas indicadas y descuenta reservados de lo efectivamente borrado."""
+    por_tipo = defaultdict(int)
+    for f in filas:
+        por_tipo[f.tipo_id] += f.cantidad
+    Reserva.objects.filter(id__in=[f.id for f in filas]).delete()
+    for tipo_id, cantidad in sorted(por_tipo.items()):
+        TipoTicket.objects.filter(id=tipo_id, reservados__gte=cantidad).update(
+            reservados=F("reservados") - cantidad
+        )
+    return por_tipo
+
+
+def convertir(grupo, items):
+    """
+    Pasa la reserva a vendidos. Lo que ya no esté reservado (vencido) se
+    toma del stock libre. Llamar dentro de la transacción que emite los tickets.
+    """
+    with transaction.atomic():
+        filas = list(Reserva.objects.select_for_update().filter(grupo=grupo).order_by("tipo_id"))
+        retenido = defaultdict(int)
+        for f in filas:
+            retenido[f.tipo_id] += f.cantidad
+        Reserva.objects.filter(id__in=[f.id for f in filas]).delete()
+
+        faltantes = []
+        for tipo, cantidad in agrupar(items):
+            desde_reserva = min(retenido.pop(tipo.id, 0), cantidad)
+            if desde_reserva:
+                TipoTicket.objects.filter(id=tipo.id).update(
+                    reservados=F("reservados") - desde_reserva,
+                    vendidos=F("vendidos") + desde_reserva,
+                )
+            if cantidad > desde_reserva:
+                faltantes.append((tipo, cantidad - desde_reserva))
+
+        # Reservado de más (no debería pasar): se devuelve
+        for tipo_id, cantidad in retenido.items():
+            TipoTicket.objects.filter(id=tipo_id, reservados__gte=cantidad).update(
+                reservados=F("reservados") - cantidad
+            )
+
+        if faltantes:
+            tomar_stock(faltantes)
+
+
+def liberar(grupo):
+    with transaction.atomic():
+        filas = list(Reserva.objects.select_for_update().filter(grupo=grupo))
+        _soltar(filas)
+
+
+def barrer_vencidas(ahora=None, lote=LOTE_BARRIDO):
+    """
+    Libera las reservas vencidas en lotes (índice en expires_at). Las filas
+    que otra transacción tiene bloqueadas (una conversión en curso) se saltan.
+    Retorna la cantidad de filas borradas.
+    """
+    ahora = ahora or timezone.now()
+    skip_locked = connection.features.has_select_for_update_skip_locked
+    total = 0
+    while True:
+        with transaction.atomic():
+            filas = list(
+                Reserva.objects
+                .select_for_update(skip_locked=skip_locked)
+                .filter(expires_at__lt=ahora)
+                .order_by("expires_at")
+                .only("id", "tipo_id", "cantidad")[:lote]
+            )
+            if not filas:
+                return total
+            _soltar(filas)
+        total += len(filas)
+        if len(filas) < lote:
+            return total
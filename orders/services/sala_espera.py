@@ -0,0 +1,114 @@
+# orders/services/sala_espera.py
+"""
+Sala de espera virtual para ventas de alta demanda.
+
+Con Evento.sala_espera activa, cada comprador que llega al checkout recibe
+un turno firmado (cookie) con el segundo en que será admitido. Los turnos
+se reparten en cubetas de un segundo con cache.incr:
+
+    sala:<evento>:s:<segundo>   -> compradores asignados a ese segundo
+
+Si la cubeta ya tiene admisiones_por_segundo, se prueba la siguiente. La
+pista sala:<evento>:cola guarda el primer segundo con cupo para no recorrer
+la cola entera. Así el checkout recibe a lo más admisiones_por_segundo
+compradores nuevos por segundo, sin tocar la base.
+
+Verificar un turno no consulta nada: la firma garantiza que el segundo de
+admisión lo asignó el servidor. El turno vale TTL_ADMISION después de su
+segundo de admisión.
+
+Con LocMemCache los contadores son por proceso (el ritmo efectivo se
+multiplica por la cantidad de workers); en producción usar un cache
+compartido (Redis/Memcached) en CACHES.
+"""
+import time
+
+from django.conf import settings
+from django.core import signing
+from django.core.cache import cache
+
+from events.models import Evento
+
+
+SALT = "orders.sala_espera"
+TTL_CONFIG = 30  # segundos que se cachea la configuración del evento
+
+
+def ttl_admision():
+    return getattr(settings, "WAITING_ROOM_ADMISSION_SECONDS", 30 * 60)
+
+
+def nombre_cookie(evento_id):
+    return f"sala_{evento_id}"
+
+
+def config(slug):
+    """
+    {"id", "rate"} si el evento tiene la sala activa, None si no (o no existe).
+    Cacheado TTL_CONFIG para que la cola no consulte Evento en cada recarga.
+    """
+    key = f"sala:cfg:{slug}"
+    cfg = cache.get(key)
+    if cfg is None:
+        ev = (
+            Evento.objects.filter(slug=slug)
+            .values("id", "sala_espera", "admisiones_por_segundo")
+            .first()
+        )
+        cfg = {"id": ev["id"], "rate": ev["admisiones_por_segundo"]} if ev and ev["sala_espera"] else {}
+        cache.set(key, cfg, TTL_CONFIG)
+    return cfg or None
+
+
+def _tomar_lugar(evento_id, rate, ahora):
+    """Asigna (segundo, puesto dentro del segundo) al próximo comprador."""
+    pista_key = f"sala:{evento_id}:cola"
+    segundo = max(int(ahora), cache.get(pista_key) or 0)
+    while True:
+        key = f"sala:{evento_id}:s:{segundo}"
+        cache.add(key, 0, timeout=ttl_admision() + 3600)
+        puesto = cache.incr(key)
+        if puesto <= rate:
+            return segundo, puesto
+        # Cubeta llena: los siguientes parten desde el segundo que viene
+        segundo += 1
+        cache.set(pista_key, segundo, timeout=ttl_admision() + 3600)
+
+
+def emitir(evento_id, rate, ahora=None):
+    """Token firmado con el turno del comprador."""
+    ahora = time.time() if ahora is None else ahora
+    segundo, puesto = _tomar_lugar(evento_id, max(1, rate), ahora)
+    return signing.dumps({"e": evento_id, "s": segundo, "p": puesto}, salt=SALT, compress=True)
+
+
+def leer(token, evento_id, ahora=None):
+    """Datos del turno si la firma es válida, es de este evento y no venció; None si no."""
+    if not token:
+        return None
+    try:
+        datos = signing.loads(token, salt=SALT)
+    except signing.BadSignature:
+        return None
+    if datos.get("e") != evento_id:
+        return None
+    ahora = time.time() if ahora is None else ahora
+    if ahora > datos["s"] + ttl_admision():
+        return None
+    return datos
+
+
+def admitido(datos, ahora=None):
+    ahora = time.time() if ahora is None else ahora
+    return ahora >= datos["s"]
+
+
+def estado(datos, rate, ahora=None):
+    """Posición estimada en la cola y segundos de espera."""
+    ahora = time.time() if ahora is None else ahora
+    espera = max(0, int(datos["s"] - ahora))
+    return {
+        "admitido": admitido(datos, ahora),
+        "espera_segundos": espera,
+        "posicion": espera * max(1, rate) + datos["p"] if espera else 0,
+    }
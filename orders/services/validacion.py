@@ -0,0 +1,272 @@
+# orders/services/validacion.py
+import json
+import uuid
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Case, When, Value, DateTimeField
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from events.models import Evento
+from orders.models import Ticket
+from orders.services import feed_validaciones, qr_firma, reglas_acceso
+from orders.services.bitacora import registrar_validaciones
+
+
+MAX_LOTE = 500
+
+
+def quemar_ticket(*, cuenta, code, ahora=None, evento_id=None):
+    """
+    Quema el ticket con un único UPDATE condicional:
+
+        UPDATE ticket SET estado='quemado', used_at=...
+         WHERE code=... AND estado='disponible' AND evento_id IN (eventos de la cuenta)
+           AND tipo_id IN (tipos de un día / un ingreso válidos hoy)
+
+    Si dos puertas escanean el mismo QR al mismo tiempo, sólo una de ellas
+    afecta la fila; la otra recibe 0 filas y se informa como ALREADY_USED.
+    Los tipos con reingreso o multi-día pasan por reglas_acceso.
+    Con evento_id (puerta de un evento) los tickets de otros eventos se
+    rechazan como WRONG_EVENT.
+
+    Retorna (result, note, ticket):
+      - ("OK", "", ticket)
+      - ("ALREADY_USED", "REPEAT" | "REPEAT_TODAY", ticket)
+      - ("DENIED", "ACCOUNT_MISMATCH" | "WRONG_EVENT" | "TICKET_ANULADO" | "WRONG_DAY" | "OUT_OF_EVENT_DATES", ticket)
+      - ("NOT_FOUND", "TICKET_NOT_FOUND", None)
+    """
+    ahora = ahora or timezone.now()
+    dia = timezone.localdate(ahora)
+
+    try:
+        code = uuid.UUID(str(code))
+    except ValueError:
+        return "NOT_FOUND", "TICKET_NOT_FOUND", None
+
+    # Subconsultas (no JOIN) para que MySQL ejecute un solo UPDATE sin
+    # pre-seleccionar ids, manteniendo la condición sobre 'estado'.
+    eventos_cuenta = Evento.objects.filter(cuenta=cuenta).values("id")
+    if evento_id is not None:
+        eventos_cuenta = eventos_cuenta.filter(id=evento_id)
+    quemados = (
+        Ticket.objects
+        .filter(
+            code=code,
+            estado="disponible",
+            evento_id__in=eventos_cuenta,
+            tipo_id__in=reglas_acceso.tipos_simples_del_dia(dia),
+        )
+        .update(estado="quemado", used_at=ahora, updated_at=ahora)
+    )
+
+    t = Ticket.objects.select_related("evento", "tipo").filter(code=code).first()
+
+    if quemados == 1:
+        return "OK", "", t
+    result, note = _resolver(t, cuenta=cuenta, ahora=ahora, evento_id=evento_id)
+    if result is None:
+        # Caso borde (p.ej. cambio de día entre el UPDATE y la lectura): se
+        # vuelve a intentar la quema condicional, ahora por id.
+        quemados = (
+            Ticket.objects
+            .filter(id=t.id, estado="disponible")
+            .update(estado="quemado", used_at=ahora, updated_at=ahora)
+        )
+        if quemados:
+            t.estado, t.used_at = "quemado", ahora
+            return "OK", "", t
+        t.refresh_from_db(fields=["estado", "used_at"])
+        result, note = "ALREADY_USED", "REPEAT"
+    return result, note, t
+
+
+def _resolver(t, *, cuenta, ahora, evento_id=None):
+    """
+    Decide el resultado de una lectura que no se resolvió con el UPDATE directo.
+    Para tipos con reingreso o multi-día registra el ingreso (TicketEntrada).
+    """
+    if not t:
+        return "NOT_FOUND", "TICKET_NOT_FOUND"
+    if t.evento.cuenta_id != cuenta.id:
+        return "DENIED", "ACCOUNT_MISMATCH"
+    if evento_id is not None and t.evento_id != int(evento_id):
+        return "DENIED", "WRONG_EVENT"
+    if t.estado == "anulado":
+        return "DENIED", "TICKET_ANULADO"
+
+    nota_dia = reglas_acceso.verificar_dia(t, timezone.localdate(ahora))
+    if nota_dia:
+        return "DENIED", nota_dia
+
+    if reglas_acceso.es_regla_simple(t.tipo):
+        if t.estado == "quemado":
+            return "ALREADY_USED", "REPEAT"
+        return None, ""  # disponible: lo quema quien llama
+
+    return reglas_acceso.registrar_entrada(t, ahora)
+
+
+def leer_lote(body):
+    """
+    Lee {"scans": [...], ...} desde el body JSON.
+    Retorna (data, error) donde error es None o un código para el front.
+    """
+    try:
+        data = json.loads(body.decode("utf-8"))
+    except Exception:
+        return None, "INVALID_PAYLOAD"
+
+    scans = data.get("scans") if isinstance(data, dict) else None
+    if not isinstance(scans, list) or not all(isinstance(s, dict) for s in scans):
+        return None, "INVALID_PAYLOAD"
+    if len(scans) > MAX_LOTE:
+        return None, "BATCH_TOO_LARGE"
+    return data, None
+
+
+def leer_scans(body):
+    """Como leer_lote, pero retorna sólo (scans, error)."""
+    data, error = leer_lote(body)
+    return (data["scans"] if data else None), error
+
+
+def _parse_scanned_at(valor, ahora):
+    """
+    Acepta ISO 8601 o epoch en milisegundos (Date.now() del escáner).
+    Sin valor, o con hora futura, se usa la hora del servidor.
+    """
+    ts = None
+    if isinstance(valor, (int, float)):
+        ts = datetime.fromtimestamp(valor / 1000, tz=dt_timezone.utc)
+    elif isinstance(valor, str) and valor:
+        ts = parse_datetime(valor)
+        if ts and timezone.is_naive(ts):
+            ts = timezone.make_aware(ts)
+    if not ts or ts > ahora:
+        return ahora
+    return ts
+
+
+def validar_lote(*, cuenta, scans, usuario=None, ip=None, user_agent="", access_point=None, evento=None):
+    """
+    Valida una cola de lecturas hechas sin conexión.
+
+    - scans: [{"code": "...", "scanned_at": "<ISO>" | <epoch ms>}, ...]
+    - evento: si viene, los tickets de otros eventos se rechazan (WRONG_EVENT)
+    - Resuelve todos los códigos en una sola consulta (bloqueando las filas),
+      quema los disponibles con un único UPDATE y escribe todos los
+      ValidationLog con un solo bulk_create (o al buffer, ver bitacora).
+
+    Retorna una lista con un resultado por lectura, en el mismo orden:
+      {"code", "result", "note", "ticket", "scanned_at"}
+    """
+    ahora = timezone.now()
+
+    evento_id = evento.id if evento else None
+
+    lecturas = []
+    for sc in scans:
+        raw = str(sc.get("code") or "").strip()
+        scanned_at = _parse_scanned_at(sc.get("scanned_at"), ahora)
+        code, rechazo = None, None
+        try:
+            code, datos = qr_firma.leer_qr(raw)
+            rechazo = qr_firma.verificar_en_memoria(datos, evento_id=evento_id)
+        except qr_firma.QRInvalido as e:
+            if e.nota == "BAD_SIGNATURE":
+                rechazo = e.nota
+        lecturas.append({
+            "raw": raw,
+            "code": None if rechazo else code,
+            "rechazo": rechazo,
+            "scanned_at": scanned_at,
+        })
+
+    codes = {l["code"] for l in lecturas if l["code"]}
+
+    with transaction.atomic():
+        tickets = {
+            t.code: t
+            for t in (
+                Ticket.objects
+                .select_for_update(of=("self",))
+                .select_related("evento", "tipo")
+                .filter(code__in=codes)
+            )
+        } if codes else {}
+
+        resultados = []
+        a_quemar = {}  # ticket_id -> scanned_at
+
+        for l in lecturas:
+            t = tickets.get(l["code"])
+            if l["rechazo"]:
+                result, note = "DENIED", l["rechazo"]
+            else:
+                result, note = _resolver(t, cuenta=cuenta, ahora=l["scanned_at"], evento_id=evento_id)
+            if result is None:
+                # Primera lectura válida del lote: la quemamos en memoria para
+                # que una repetición dentro del mismo lote sea ALREADY_USED.
+                result = "OK"
+                t.estado = "quemado"
+                t.used_at = l["scanned_at"]
+                a_quemar[t.id] = l["scanned_at"]
+
+            resultados.append({
+                "code": l["raw"],
+                "result": result,
+                "note": note,
+                "ticket": t,
+                "scanned_at": l["scanned_at"],
+            })
+
+        if a_quemar:
+            Ticket.objects.filter(id__in=a_quemar.keys(), estado="disponible").update(
+                estado="quemado",
+                updated_at=ahora,
+                used_at=Case(
+                    *[When(id=tid, then=Value(ts)) for tid, ts in a_quemar.items()],
+                    output_field=DateTimeField(),
+                ),
+            )
+
+    # Fuera de la transacción: las filas de Ticket ya no quedan bloqueadas
+    registrar_validaciones([
+        {
+            "cuenta_id": cuenta.id,
+            "ticket_id": r["ticket"].id if r["ticket"] else None,
+            "evento_id": r["ticket"].evento_id if r["ticket"] else None,
+            "result": r["result"],
+            "note": r["note"],
+            "ip": ip,
+            "user_agent": user_agent,
+            "usuario_id": usuario.id if usuario else None,
+            "access_point_id": access_point.id if access_point else None,
+            "scanned_at": r["scanned_at"],
+        }
+        for r in resultados
+    ])
+
+    for r in resultados:
+        t = r["ticket"]
+        feed_validaciones.publicar(cuenta.id, t.evento_id if t else evento_id, {
+            "result": r["result"], "note": r["note"], "code": str(t.code) if t else None,
+            "tipo": t.tipo.nombre if t else None,
+            "access_point_id": access_point.id if access_point else None,
+            "at": r["scanned_at"].isoformat(), "offline": True,
+        })
+
+    return resultados
+
+
+def resultado_a_dict(r):
+    """Serializa un resultado de validar_lote con la forma de validate_ticket."""
+    t = r["ticket"]
+    item = {"code": r["code"], "ok": r["result"] == "OK", "result": r["result"]}
+    if r["result"] != "OK":
+        item["error"] = "ALREADY_USED" if r["result"] == "ALREADY_USED" else r["note"]
+    if t and r["result"] in ("OK", "ALREADY_USED"):
+        item.update({"tipo": t.tipo.nombre, "evento": t.evento.nombre, "used_at": t.used_at})
+    return item
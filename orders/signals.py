@@ -0,0 +1,34 @@
+# orders/signals.py
+"""
+Invalidación de cachés de checkout y del índice de búsqueda de órdenes. Se
+hace al confirmar la transacción: si se invalidara antes, otro proceso
+podría reconstruir la caché sin ver todavía el cambio.
+"""
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from events.models import Evento
+from orders.models import PromoCode, SharedPurchaseCode
+from orders.services import busqueda_ordenes, codigos_promo, precios
+from tickets.models import DiscountCode, TipoTicket
+
+
+@receiver([post_save, post_delete], sender=TipoTicket)
+@receiver([post_save, post_delete], sender=DiscountCode)
+def invalidar_tabla_precios(sender, instance, **kwargs):
+    transaction.on_commit(partial(precios.invalidar, instance.evento_id))
+
+
+@receiver([post_save, post_delete], sender=DiscountCode)
+@receiver([post_save, post_delete], sender=PromoCode)
+@receiver([post_save, post_delete], sender=SharedPurchaseCode)
+def invalidar_mapa_codigos(sender, instance, **kwargs):
+    transaction.on_commit(partial(codigos_promo.invalidar, instance.evento_id))
+
+
+@receiver([post_save, post_delete], sender=Evento)
+def invalidar_indice_eventos(sender, instance, **kwargs):
+    transaction.on_commit(partial(busqueda_ordenes.invalidar, instance.cuenta_id))
@@ -1,3 +1,1267 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from transbank.error.transbank_error import TransbankError
+
+from accounts.models import Cuenta, User, UsuarioRol
+from core import webpay
+from core.webpay_stub import StubWebpay
+from events.models import Evento
+from tickets.models import DiscountCode, TipoTicket
+from orders.services import (
+    bench_descuentos, bench_puertas, bitacora, busqueda_ordenes, codigos_promo, conciliacion, cupos_descuento, feed_validaciones,
+    filtro_codigos, gate_file, idempotencia, metricas_puerta, montos, pagos_webpay, paginacion, precios, qr_firma, reservas,
+    sala_espera,
+)
+from orders.services.checkout import crear_orden_y_tickets, finalizar_pago_y_generar_codigo
+from orders.services.emision import emitir_tickets
+from orders.services.inventario import StockInsuficiente, tomar_stock
+from orders.services.validacion import quemar_ticket
+from .models import (
+    AccessPoint, AccessRole, ClaveIdempotencia, Orden, Pago, PromoCode, Reserva, SharedPurchaseCode, Ticket,
+    TicketEntrada, TransaccionWebpay, ValidationLog,
+)
+
+
+def crear_evento_con_tickets(cuenta, n=1, **tipo_kwargs):
+    evento = Evento.objects.create(cuenta=cuenta, nombre="Evento Test", estado="activo")
+    tipo = TipoTicket.objects.create(evento=evento, nombre="General", precio=1000, **tipo_kwargs)
+    orden = Orden.objects.create(cuenta=cuenta, evento=evento, comprador_email="a@test.cl")
+    tickets = [Ticket.objects.create(orden=orden, evento=evento, tipo=tipo) for _ in range(n)]
+    return evento, tipo, tickets
+
+
+def cliente_validador(user, cuenta):
+    c = Client()
+    c.force_login(user)
+    session = c.session
+    session["cuenta_id"] = str(cuenta.id)
+    session.save()
+    return c
+
+
+class ValidateTicketConcurrencyTests(TransactionTestCase):
+    def setUp(self):
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.user = User.objects.create_user(email="guardia@test.cl", password="x")
+        self.evento, _, (self.ticket,) = crear_evento_con_tickets(self.cuenta)
+
+    def test_validacion_simple(self):
+        c = cliente_validador(self.user, self.cuenta)
+        url = reverse("orders:validate", args=[self.ticket.code])
+
+        r1 = c.post(url)
+        r2 = c.post(url)
+
+        self.assertEqual(r1.status_code, 200)
+        self.assertEqual(r2.status_code, 409)
+        self.assertEqual(r2.json()["error"], "ALREADY_USED")
+
+    def test_codigo_inexistente(self):
+        c = cliente_validador(self.user, self.cuenta)
+        r = c.post(reverse("orders:validate", args=["no-es-un-codigo"]))
+        self.assertEqual(r.status_code, 404)
+
+        with self.settings(CODE_FILTER_ENABLED=False):
+            r = c.post(reverse("orders:validate", args=[uuid.uuid4()]))
+        self.assertEqual(r.status_code, 404)
+        self.assertEqual(ValidationLog.objects.filter(result="NOT_FOUND").count(), 1)
+
+    def test_escaneos_simultaneos_un_solo_ok(self):
+        n_puertas = 12
+        url = reverse("orders:validate", args=[self.ticket.code])
+        clientes = [cliente_validador(self.user, self.cuenta) for _ in range(n_puertas)]
+        barrera = threading.Barrier(n_puertas)
+        codigos = []
+        lock = threading.Lock()
+
+        def escanear(c):
+            try:
+                barrera.wait()
+                r = c.post(url)
+                with lock:
+                    codigos.append(r.status_code)
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=escanear, args=(c,)) for c in clientes]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+
+        self.assertEqual(len(codigos), n_puertas)
+        self.assertEqual(codigos.count(200), 1)
+        self.assertEqual(codigos.count(409), n_puertas - 1)
+        self.assertEqual(ValidationLog.objects.filter(result="OK").count(), 1)
+
+
+class ValidateBatchTests(TransactionTestCase):
+    def setUp(self):
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.user = User.objects.create_user(email="guardia@test.cl", password="x")
+        self.evento, _, self.tickets = crear_evento_con_tickets(self.cuenta, n=3)
+
+    def test_lote_resultados_por_codigo(self):
+        otra = Cuenta.objects.create(nombre="Otra")
+        _, _, (ajeno,) = crear_evento_con_tickets(otra)
+        t1, t2, t3 = self.tickets
+        t3.estado = "quemado"
+        t3.save(update_fields=["estado"])
+
+        c = cliente_validador(self.user, self.cuenta)
+        scans = [
+            {"code": str(t1.code), "scanned_at": "2025-01-10T20:00:00-03:00"},
+            {"code": str(t2.code), "scanned_at": 1736550000000},
+            {"code": str(t1.code)},
+            {"code": str(t3.code)},
+            {"code": str(ajeno.code)},
+            {"code": "basura"},
+        ]
+        r = c.post(reverse("orders:validate-batch"), data={"scans": scans}, content_type="application/json")
+
+        self.assertEqual(r.status_code, 200)
+        results = [x["result"] for x in r.json()["results"]]
+        self.assertEqual(results, ["OK", "OK", "ALREADY_USED", "ALREADY_USED", "DENIED", "NOT_FOUND"])
+        self.assertEqual(Ticket.objects.filter(estado="quemado").count(), 3)
+        self.assertEqual(ValidationLog.objects.count(), len(scans))
+        t1.refresh_from_db()
+        self.assertEqual(t1.used_at.isoformat(), "2025-01-10T23:00:00+00:00")
+
+
+class GateSyncTests(TransactionTestCase):
+    def setUp(self):
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.user = User.objects.create_user(email="guardia@test.cl", password="x")
+        self.evento, self.tipo, self.tickets = crear_evento_con_tickets(self.cuenta, n=2)
+        self.ap = AccessPoint.objects.create(cuenta=self.cuenta, nombre="Puerta 1")
+        AccessRole.objects.create(usuario=self.user, access_point=self.ap)
+        self.c = cliente_validador(self.user, self.cuenta)
+
+    def _url(self, name):
+        return reverse(f"orders:{name}", args=[self.ap.id, self.evento.id])
+
+    def test_manifest_delta_y_upload(self):
+        with mock.patch("orders.views_gate.SYNC_LAG", timedelta(0)):
+            manifest = self.c.get(self._url("gate-manifest")).json()
+            self.assertEqual(len(manifest["tickets"]), 2)
+
+            t1, t2 = self.tickets
+            t2.estado = "anulado"
+            t2.save(update_fields=["estado", "updated_at"])
+
+            delta = self.c.get(self._url("gate-delta"), {"cursor": manifest["cursor"]}).json()
+            self.assertEqual([row[0] for row in delta["tickets"]], [str(t2.code)])
+            self.assertEqual(delta["tickets"][0][2], "anulado")
+
+            r = self.c.post(
+                self._url("gate-upload"),
+                data={"scans": [{"code": str(t1.code), "scanned_at": "2025-01-10T20:00:00-03:00"}]},
+                content_type="application/json",
+            )
+            self.assertEqual(r.json()["results"][0]["result"], "OK")
+            self.assertEqual(ValidationLog.objects.get().access_point, self.ap)
+
+            delta2 = self.c.get(self._url("gate-delta"), {"cursor": delta["cursor"]}).json()
+            self.assertEqual(delta2["tickets"], [[str(t1.code), self.tipo.id, "quemado", None]])
+
+
+class BitacoraBufferedTests(TestCase):
+    def setUp(self):
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        bitacora._sink = None
+        self.addCleanup(setattr, bitacora, "_sink", None)
+
+    def test_buffer_se_vacia_por_tamano(self):
+        with self.settings(VALIDATION_LOG_MODE="buffered", VALIDATION_LOG_BUFFER_SIZE=3,
+                           VALIDATION_LOG_FLUSH_SECONDS=3600, VALIDATION_LOG_SPOOL_DIR=self.tmp):
+            for _ in range(2):
+                bitacora.registrar_validacion(cuenta_id=self.cuenta.id, result="NOT_FOUND", user_agent="x" * 1000)
+            self.assertEqual(ValidationLog.objects.count(), 0)
+
+            bitacora.registrar_validacion(cuenta_id=self.cuenta.id, result="NOT_FOUND")
+            self.assertEqual(ValidationLog.objects.count(), 3)
+            self.assertEqual(max(len(v.user_agent) for v in ValidationLog.objects.all()), 255)
+            self.assertEqual([p.read_text() for p in Path(self.tmp).iterdir()], [""])
+
+    def test_recupera_spool_de_worker_caido(self):
+        data = {"cuenta_id": str(self.cuenta.id), "result": "OK", "scanned_at": "2025-01-10T23:00:00+00:00"}
+        spool = Path(self.tmp) / "999999999-0.jsonl"
+        spool.write_text(json.dumps(data) + "\n" + '{"cuenta_id": "trunc')
+
+        self.assertEqual(bitacora.recuperar_spool(self.tmp), 0)  # recién escrito
+        viejo = time.time() - 600
+        os.utime(spool, (viejo, viejo))
+        self.assertEqual(bitacora.recuperar_spool(self.tmp), 1)
+        self.assertEqual(ValidationLog.objects.get().result, "OK")
+        self.assertFalse(spool.exists())
+
+    def test_worker_nuevo_no_toca_el_spool_del_muerto(self):
+        muerto = bitacora.BufferedLogSink(size=100, flush_seconds=3600, spool_dir=self.tmp)
+        muerto._arrancar_timer = lambda: None
+        muerto.agregar([bitacora._normalizar({"cuenta_id": self.cuenta.id, "result": "OK"})])
+        muerto._spool.close()  # el proceso muere: se libera el flock
+        # Reinicio con el mismo PID
+        vivo = bitacora.BufferedLogSink(size=100, flush_seconds=3600, spool_dir=self.tmp)
+        vivo._arrancar_timer = lambda: None
+        vivo.agregar([bitacora._normalizar({"cuenta_id": self.cuenta.id, "result": "NOT_FOUND"})])
+        self.assertEqual(vivo.flush(), 1)
+        self.assertEqual(len(list(Path(self.tmp).iterdir())), 2)
+
+        viejo = time.time() - 600
+        for path in Path(self.tmp).iterdir():
+            os.utime(path, (viejo, viejo))
+        # El spool activo (vacío) del vivo conserva su flock y no se toca
+        self.assertEqual(bitacora.recuperar_spool(self.tmp), 1)
+        self.assertEqual(sorted(ValidationLog.objects.values_list("result", flat=True)), ["NOT_FOUND", "OK"])
+        self.assertEqual([p.name for p in Path(self.tmp).iterdir()], [vivo._spool_path().name])
+
+
+class FiltroCodigosTests(TestCase):
+    def setUp(self):
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.evento, self.tipo, (self.ticket,) = crear_evento_con_tickets(self.cuenta)
+        # Sin hilo de fondo: las pruebas refrescan a mano
+        arrancar = mock.patch.object(filtro_codigos, "_arrancar")
+        arrancar.start()
+        self.addCleanup(arrancar.stop)
+
+    def test_miss_sin_consultas(self):
+        # Antes de la primera carga se valida como siempre
+        self.assertTrue(filtro_codigos.puede_existir(self.cuenta.id, uuid.uuid4()))
+        filtro_codigos.refrescar(self.cuenta.id)
+        with self.assertNumQueries(0):
+            self.assertTrue(filtro_codigos.puede_existir(self.cuenta.id, self.ticket.code))
+            self.assertFalse(filtro_codigos.puede_existir(self.cuenta.id, "basura"))
+            self.assertFalse(filtro_codigos.puede_existir(self.cuenta.id, uuid.uuid4()))
+
+    def test_refresco_carga_tickets_confirmados_tarde(self):
+        filtro_codigos.refrescar(self.cuenta.id)
+        marca = filtro_codigos._cuentas[self.cuenta.id].marca
+        # Creado por otro worker; su transacción confirmó tarde, dentro del lag
+        atrasado = Ticket.objects.create(orden=self.ticket.orden, evento=self.evento, tipo=self.tipo)
+        Ticket.objects.filter(pk=atrasado.pk).update(created_at=marca - timedelta(seconds=30))
+        self.assertFalse(filtro_codigos.puede_existir(self.cuenta.id, atrasado.code))
+
+        with self.assertNumQueries(1):
+            filtro_codigos.refrescar(self.cuenta.id)
+        with self.assertNumQueries(0):
+            self.assertTrue(filtro_codigos.puede_existir(self.cuenta.id, atrasado.code, evento_id=self.evento.id))
+
+    def test_releer_la_ventana_no_llena_el_filtro(self):
+        f = filtro_codigos.BloomFilter(capacidad=1000)
+        code = uuid.uuid4().bytes
+        self.assertTrue(f.add(code))
+        self.assertFalse(f.add(code))
+        self.assertEqual(f.n, 1)
+
+    def test_registrar_codigos_al_confirmar(self):
+        filtro_codigos.refrescar(self.cuenta.id)
+        nuevo = uuid.uuid4()
+        with self.captureOnCommitCallbacks(execute=True):
+            filtro_codigos.registrar_codigos(self.cuenta.id, self.evento.id, [nuevo])
+        with self.assertNumQueries(0):
+            self.assertTrue(filtro_codigos.puede_existir(self.cuenta.id, nuevo, evento_id=self.evento.id))
+
+    def test_misses_agrupados(self):
+        with self.settings(CODE_FILTER_MISS_SAMPLE=3):
+            self.assertEqual([filtro_codigos.contar_miss(self.cuenta.id) for _ in range(6)], [0, 0, 3, 0, 0, 3])
+
+
+class ReglasAccesoTests(TransactionTestCase):
+    def setUp(self):
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.dia1 = timezone.make_aware(datetime(2025, 3, 1, 18, 0))
+        self.dia2 = self.dia1 + timedelta(days=1)
+
+    def _validar(self, t, ahora):
+        return quemar_ticket(cuenta=self.cuenta, code=t.code, ahora=ahora)[0]
+
+    def test_un_dia_valid_day(self):
+        _, _, (t,) = crear_evento_con_tickets(self.cuenta, valid_day=self.dia2.date())
+        self.assertEqual(self._validar(t, self.dia1), "DENIED")
+        self.assertEqual(self._validar(t, self.dia2), "OK")
+        self.assertEqual(self._validar(t, self.dia2), "ALREADY_USED")
+
+    def test_todos_los_dias_una_vez_por_dia(self):
+        _, _, (t,) = crear_evento_con_tickets(self.cuenta, access_policy="todos_los_dias")
+        self.assertEqual(self._validar(t, self.dia1), "OK")
+        self.assertEqual(self._validar(t, self.dia1 + timedelta(hours=2)), "ALREADY_USED")
+        self.assertEqual(self._validar(t, self.dia2), "OK")
+        self.assertEqual(TicketEntrada.objects.filter(ticket=t).count(), 2)
+
+    def test_todos_los_dias_fuera_de_fechas(self):
+        evento, _, (t,) = crear_evento_con_tickets(self.cuenta, access_policy="todos_los_dias")
+        evento.fecha_inicio = evento.fecha_termino = self.dia1.date()
+        evento.save()
+        self.assertEqual(self._validar(t, self.dia2), "DENIED")
+
+    def test_reingreso_ilimitado_solo_el_dia_del_primer_ingreso(self):
+        _, _, (t,) = crear_evento_con_tickets(self.cuenta, reentry_rule="ilimitado")
+        for h in range(3):
+            self.assertEqual(self._validar(t, self.dia1 + timedelta(hours=h)), "OK")
+        self.assertEqual(TicketEntrada.objects.get(ticket=t).entradas, 3)
+        self.assertEqual(self._validar(t, self.dia2), "DENIED")
+
+
+class QRFirmadoTests(TransactionTestCase):
+    def setUp(self):
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.user = User.objects.create_user(email="guardia@test.cl", password="x")
+        self.evento, self.tipo, (self.ticket,) = crear_evento_con_tickets(self.cuenta)
+        self.c = cliente_validador(self.user, self.cuenta)
+
+    def test_payload_firmado_valida(self):
+        payload = qr_firma.payload_qr(self.ticket)
+        code, datos = qr_firma.leer_qr(payload)
+        self.assertEqual(code, self.ticket.code)
+        self.assertEqual(datos["evento_id"], self.evento.id)
+
+        r = self.c.post(reverse("orders:validate", args=[payload]), {"evento_id": self.evento.id})
+        self.assertEqual(r.status_code, 200)
+
+    def test_falsificacion_y_otro_evento_sin_consultar_tickets(self):
+        payload = qr_firma.payload_qr(self.ticket)
+        falso = payload[:-1] + ("A" if payload[-1] != "A" else "B")
+        self.assertRaises(qr_firma.QRInvalido, qr_firma.leer_qr, falso)
+
+        r = self.c.post(reverse("orders:validate", args=[falso]))
+        self.assertEqual(r.json()["error"], "BAD_SIGNATURE")
+
+        r = self.c.post(reverse("orders:validate", args=[payload]), {"evento_id": self.evento.id + 1})
+        self.assertEqual(r.json()["error"], "WRONG_EVENT")
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.estado, "disponible")
+
+    def test_dia_del_qr_desactualizado_lo_decide_la_base(self):
+        hoy = timezone.localdate()
+        TipoTicket.objects.filter(pk=self.tipo.pk).update(access_policy="un_dia", valid_day=hoy - timedelta(days=1))
+        self.ticket.tipo.refresh_from_db()
+        payload = qr_firma.payload_qr(self.ticket)  # impreso con el día anterior
+
+        # El productor movió la función a hoy
+        TipoTicket.objects.filter(pk=self.tipo.pk).update(valid_day=hoy)
+        r = self.c.post(reverse("orders:validate", args=[payload]), {"evento_id": self.evento.id})
+        self.assertEqual(r.status_code, 200)
+
+    def test_qr_tf1_ya_impreso_sigue_valiendo(self):
+        cuerpo = f"TF1.{self.ticket.code.hex}.{qr_firma._b36(self.evento.id)}.{qr_firma._b36(self.tipo.id)}.20240101"
+        payload = f"{cuerpo}.{qr_firma._mac(cuerpo)}"
+        self.assertEqual(qr_firma.leer_qr(payload), (self.ticket.code, {"evento_id": self.evento.id}))
+        r = self.c.post(reverse("orders:validate", args=[payload]), {"evento_id": self.evento.id})
+        self.assertEqual(r.status_code, 200)
+
+
+class ValidadorLocalTests(TestCase):
+    def setUp(self):
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.evento, _, self.tickets = crear_evento_con_tickets(self.cuenta, n=5)
+        self.tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.archivo = str(Path(self.tmp) / "evento.gate")
+        self.journal = str(Path(self.tmp) / "evento.journal")
+        self.assertEqual(gate_file.exportar_evento(self.evento, self.archivo), 5)
+
+    def test_busqueda_journal_y_conciliacion(self):
+        v = gate_file.GateValidator(self.archivo, self.journal, fsync=False)
+        self.addCleanup(v.close)
+        t = self.tickets[2]
+
+        self.assertEqual(v.validar(str(t.code)), ("OK", ""))
+        self.assertEqual(v.validar(qr_firma.payload_qr(t)), ("ALREADY_USED", "REPEAT"))
+        self.assertEqual(v.validar(str(uuid.uuid4()))[0], "NOT_FOUND")
+        for otro in self.tickets:
+            self.assertIsNotNone(v.archivo.buscar(otro.code.bytes))
+
+        # Un validador reiniciado recuerda las quemas del journal
+        v2 = gate_file.GateValidator(self.archivo, self.journal, fsync=False)
+        self.addCleanup(v2.close)
+        self.assertEqual(v2.validar(str(t.code))[0], "ALREADY_USED")
+
+        self.assertEqual(gate_file.conciliar_journal(self.journal), 1)
+        self.assertEqual(gate_file.conciliar_journal(self.journal), 0)
+        t.refresh_from_db()
+        self.assertEqual(t.estado, "quemado")
+        self.assertEqual(ValidationLog.objects.get().result, "OK")
+
+    def test_reglas_de_dia_como_en_linea(self):
+        dia1 = timezone.make_aware(datetime(2025, 3, 1, 18, 0))
+        dia2 = dia1 + timedelta(days=1)
+        Evento.objects.filter(pk=self.evento.pk).update(fecha_inicio=dia1.date(), fecha_termino=dia1.date())
+        abono = TipoTicket.objects.create(evento=self.evento, nombre="Abono", precio=1,
+                                          access_policy="todos_los_dias", reentry_rule="ilimitado")
+        pulsera = TipoTicket.objects.create(evento=self.evento, nombre="Pulsera", precio=1,
+                                            access_policy="un_dia", reentry_rule="ilimitado")
+        orden = self.tickets[0].orden
+        t_abono = Ticket.objects.create(orden=orden, evento=self.evento, tipo=abono)
+        # Entró en línea el día 1, antes de exportar
+        t_pulsera = Ticket.objects.create(orden=orden, evento=self.evento, tipo=pulsera,
+                                          estado="quemado", used_at=dia1)
+        self.evento.refresh_from_db()
+        gate_file.exportar_evento(self.evento, self.archivo)
+
+        v = gate_file.GateValidator(self.archivo, self.journal, fsync=False)
+        self.addCleanup(v.close)
+        self.assertEqual(v.validar(str(t_abono.code), ahora=dia1), ("OK", ""))
+        self.assertEqual(v.validar(str(t_abono.code), ahora=dia2), ("DENIED", "OUT_OF_EVENT_DATES"))
+        self.assertEqual(v.validar(str(t_pulsera.code), ahora=dia1), ("OK", ""))
+        self.assertEqual(v.validar(str(t_pulsera.code), ahora=dia2), ("DENIED", "WRONG_DAY"))
+
+
+class GateMetricsTests(TransactionTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.user = User.objects.create_user(email="guardia@test.cl", password="x")
+        self.evento, _, (self.ticket,) = crear_evento_con_tickets(self.cuenta)
+        self.ap = AccessPoint.objects.create(cuenta=self.cuenta, nombre="Norte")
+        self.otra = AccessPoint.objects.create(cuenta=self.cuenta, nombre="Sur")
+        AccessRole.objects.create(usuario=self.user, access_point=self.ap)
+        self.c = cliente_validador(self.user, self.cuenta)
+
+    def test_lecturas_etiquetadas_y_metricas_por_puerta(self):
+        url = reverse("orders:validate", args=[self.ticket.code])
+        self.assertEqual(self.c.post(url, {"access_point_id": self.ap.id}).status_code, 200)
+        self.assertEqual(self.c.post(url, {"access_point_id": self.ap.id}).status_code, 409)
+        self.assertEqual(self.c.post(url, {"access_point_id": self.otra.id}).status_code, 403)
+        self.assertEqual(
+            list(ValidationLog.objects.values_list("access_point_id", flat=True)), [self.ap.id] * 2
+        )
+
+        UsuarioRol.objects.create(usuario=self.user, cuenta=self.cuenta, rol="staff")
+        data = self.c.get(reverse("orders:gate-metrics")).json()
+        norte = next(p for p in data["puertas"] if p["id"] == self.ap.id)
+        self.assertEqual(norte["scans"], 2)
+        self.assertEqual(norte["por_resultado"]["ALREADY_USED"], 1)
+        self.assertEqual(norte["reject_rate"], 50.0)
+        self.assertIsNotNone(norte["p95_ms"])
+
+    def test_lote_con_puerta(self):
+        url = reverse("orders:validate-batch")
+        scans = {"scans": [{"code": str(self.ticket.code)}, {"code": str(self.ticket.code)}]}
+        r = self.c.post(url, data={**scans, "access_point_id": self.otra.id}, content_type="application/json")
+        self.assertEqual(r.status_code, 403)
+
+        r = self.c.post(url, data={**scans, "access_point_id": self.ap.id}, content_type="application/json")
+        self.assertEqual([x["result"] for x in r.json()["results"]], ["OK", "ALREADY_USED"])
+        self.assertEqual(
+            list(ValidationLog.objects.values_list("access_point_id", flat=True)), [self.ap.id] * 2
+        )
+        norte = metricas_puerta.resumen(self.cuenta.id, [self.ap.id])[self.ap.id]
+        self.assertEqual((norte["scans"], norte["por_resultado"]["ALREADY_USED"]), (2, 1))
+
+    def test_upload_sin_conexion_cuenta_en_metricas(self):
+        url = reverse("orders:gate-upload", args=[self.ap.id, self.evento.id])
+        scans = {"scans": [{"code": str(self.ticket.code), "scanned_at": timezone.now().isoformat()}]}
+        r = self.c.post(url, data=scans, content_type="application/json")
+        self.assertEqual([x["result"] for x in r.json()["results"]], ["OK"])
+
+        UsuarioRol.objects.create(usuario=self.user, cuenta=self.cuenta, rol="staff")
+        r = self.c.get(reverse("orders:gate-metrics"), {"minutos": "abc"})
+        self.assertEqual(r.status_code, 200)
+        norte = next(p for p in r.json()["puertas"] if p["id"] == self.ap.id)
+        self.assertEqual(norte["scans"], 1)
+
+
+class FeedValidacionesTests(TestCase):
+    def test_una_publicacion_llega_a_todos_los_suscriptores(self):
+        cuenta_id = uuid.uuid4()
+
+        async def escenario():
+            colas = [feed_validaciones.suscribir(cuenta_id, 7) for _ in range(3)]
+            # Las vistas síncronas publican desde otro hilo
+            hilo = threading.Thread(target=feed_validaciones.publicar, args=(cuenta_id, 7, {"result": "OK"}))
+            hilo.start()
+            hilo.join()
+            recibidos = [await asyncio.wait_for(q.get(), 1) for q in colas]
+            for q in colas:
+                feed_validaciones.desuscribir(cuenta_id, 7, q)
+            return recibidos
+
+        recibidos = asyncio.run(escenario())
+        self.assertEqual([m["data"]["result"] for m in recibidos], ["OK"] * 3)
+        self.assertNotIn((str(cuenta_id), 7), feed_validaciones._canales)
+
+    def test_bajo_wsgi_no_abre_el_stream(self):
+        cuenta = Cuenta.objects.create(nombre="Productora")
+        evento, _, _ = crear_evento_con_tickets(cuenta, n=0)
+        user = User.objects.create_user(email="staff@test.cl", password="x")
+        UsuarioRol.objects.create(usuario=user, cuenta=cuenta, rol="staff")
+        c = cliente_validador(user, cuenta)
+
+        r = c.get(reverse("orders:event-validation-stream", args=[evento.id]))
+        self.assertEqual(r.status_code, 501)
+        r = c.get(reverse("orders:event-analytics", args=[evento.id]))
+        self.assertNotContains(r, reverse("orders:event-validation-stream", args=[evento.id]))
+        self.assertContains(r, reverse("orders:event-summary-data", args=[evento.id]))
+
+
+class BenchPuertasTests(TransactionTestCase):
+    def test_simulacion_pequena(self):
+        datos = bench_puertas.sembrar(n_tickets=30, n_puertas=3)
+        lecturas = bench_puertas.armar_lecturas(datos, 40, semilla=1)
+        mediciones, segundos = bench_puertas.simular(datos, lecturas, n_puertas=3)
+        data = bench_puertas.reporte(mediciones, segundos)
+
+        self.assertEqual(data["lecturas"], 40)
+        valido = data["por_tipo"]["valido"]
+        repetido = data["por_tipo"].get("repetido", {"status": {}})
+        # Un repetido puede ganarle a la primera lectura en otra puerta: cada
+        # ticket leído se acepta exactamente una vez entre ambos tipos.
+        aceptados = valido["status"].get(200, 0) + repetido["status"].get(200, 0)
+        self.assertEqual(aceptados, valido["lecturas"])
+        self.assertEqual(set(data["por_tipo"]["falsificado"]["status"]), {403})
+        self.assertEqual(Ticket.objects.filter(estado="quemado").count(), valido["lecturas"])
+
+        bench_puertas.limpiar(datos)
+        self.assertFalse(Ticket.objects.exists())
+
+
+class EmisionTicketsTests(TestCase):
+    def setUp(self):
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.evento, self.tipo, _ = crear_evento_con_tickets(self.cuenta, n=0)
+        self.vip = TipoTicket.objects.create(evento=self.evento, nombre="VIP", precio=5000)
+        self.orden = Orden.objects.create(cuenta=self.cuenta, evento=self.evento, comprador_email="b@test.cl")
+
+    def test_un_insert_por_lote(self):
+        with self.assertNumQueries(1):
+            creados = emitir_tickets(self.orden, [(self.tipo, 60), (self.vip, 3)], asistente_email="b@test.cl")
+        self.assertEqual(len(creados), 63)
+        self.assertEqual(self.orden.tickets.filter(tipo=self.vip).count(), 3)
+        self.assertEqual({t.pk for t in creados}, set(self.orden.tickets.values_list("id", flat=True)))
+
+    def test_recupera_ids_si_el_backend_no_los_retorna(self):
+        original = Ticket.objects.bulk_create
+
+        def sin_pk(objs, **kwargs):
+            creados = original(objs, **kwargs)
+            for t in creados:
+                t.pk = None
+            return creados
+
+        with mock.patch.object(Ticket.objects, "bulk_create", side_effect=sin_pk):
+            creados = emitir_tickets(self.orden, [(self.tipo, 5)])
+        self.assertEqual(
+            {t.pk: t.code for t in creados}, dict(self.orden.tickets.values_list("id", "code"))
+        )
+
+
+class InventarioTests(TransactionTestCase):
+    def setUp(self):
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.evento, self.tipo, _ = crear_evento_con_tickets(self.cuenta, n=0, capacidad=10)
+
+    def test_muchos_checkouts_no_sobrevenden(self):
+        n_compradores = 25
+        barrera = threading.Barrier(n_compradores)
+        resultados = []
+        lock = threading.Lock()
+
+        def comprar(i):
+            try:
+                barrera.wait()
+                crear_orden_y_tickets(
+                    evento=self.evento, comprador_email=f"c{i}@test.cl",
+                    items=[{"tipo_ticket": self.tipo, "cantidad": 1}],
+                )
+                ok = True
+            except StockInsuficiente:
+                ok = False
+            finally:
+                connection.close()
+            with lock:
+                resultados.append(ok)
+
+        hilos = [threading.Thread(target=comprar, args=(i,)) for i in range(n_compradores)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+
+        self.tipo.refresh_from_db()
+        self.assertEqual(resultados.count(True), 10)
+        self.assertEqual(self.tipo.vendidos, 10)
+        self.assertEqual(Ticket.objects.filter(tipo=self.tipo).count(), 10)
+        # Las compras rechazadas no dejan órdenes (+1 por la del helper)
+        self.assertEqual(Orden.objects.filter(evento=self.evento).count(), 11)
+
+    def test_carrito_sin_stock_no_descuenta_nada(self):
+        otro = TipoTicket.objects.create(evento=self.evento, nombre="VIP", precio=1, capacidad=1)
+        with self.assertRaises(StockInsuficiente):
+            tomar_stock([(self.tipo, 3), (otro, 2)])
+        self.tipo.refresh_from_db()
+        self.assertEqual(self.tipo.vendidos, 0)
+
+    def test_anular_y_reemitir_cuadran_el_stock(self):
+        user = User.objects.create_user(email="admin@test.cl", password="x")
+        UsuarioRol.objects.create(usuario=user, cuenta=self.cuenta, rol="admin")
+        c = cliente_validador(user, self.cuenta)
+        orden, (t,) = crear_orden_y_tickets(
+            evento=self.evento, comprador_email="c@test.cl", items=[{"tipo_ticket": self.tipo, "cantidad": 1}],
+        )
+
+        # Dos anulaciones (doble click): la entrada vuelve a la venta una vez
+        c.post(reverse("orders:ticket-cancel", args=[t.id]))
+        c.post(reverse("orders:ticket-cancel", args=[t.id]))
+        self.tipo.refresh_from_db()
+        self.assertEqual(self.tipo.vendidos, 0)
+
+        # Reemitir un anulado vuelve a tomar la entrada
+        c.post(reverse("orders:ticket-reissue", args=[t.id]))
+        self.tipo.refresh_from_db()
+        self.assertEqual(self.tipo.vendidos, 1)
+
+        # Reemitir uno vigente la traspasa sin tomar otra
+        nuevo = Ticket.objects.get(replaced_by__isnull=True, orden=orden)
+        c.post(reverse("orders:ticket-reissue", args=[nuevo.id]))
+        self.tipo.refresh_from_db()
+        self.assertEqual(self.tipo.vendidos, 1)
+        self.assertEqual(orden.tickets.exclude(estado="anulado").count(), 1)
+
+        # Sin cupo el anulado no se reemite
+        TipoTicket.objects.filter(pk=self.tipo.pk).update(vendidos=10)
+        r = c.post(reverse("orders:ticket-reissue", args=[t.id]))
+        self.assertEqual(r.status_code, 302)
+        self.assertEqual(orden.tickets.count(), 3)
+
+
+class ReservasTests(TestCase):
+    def setUp(self):
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.evento, self.tipo, _ = crear_evento_con_tickets(self.cuenta, n=0, capacidad=2)
+
+    def test_reserva_ocupa_cupo_y_se_convierte(self):
+        grupo, _ = reservas.reservar(self.evento, [(self.tipo, 2)])
+        with self.assertRaises(StockInsuficiente):
+            reservas.reservar(self.evento, [(self.tipo, 1)])
+
+        crear_orden_y_tickets(
+            evento=self.evento, comprador_email="c@test.cl",
+            items=[{"tipo_ticket": self.tipo, "cantidad": 2}], reserva=str(grupo),
+        )
+        self.tipo.refresh_from_db()
+        self.assertEqual((self.tipo.vendidos, self.tipo.reservados), (2, 0))
+        self.assertFalse(Reserva.objects.exists())
+
+    def test_barredor_libera_vencidas(self):
+        reservas.reservar(self.evento, [(self.tipo, 1)], ahora=timezone.now() - timedelta(hours=1))
+        reservas.reservar(self.evento, [(self.tipo, 1)])
+
+        self.assertEqual(reservas.barrer_vencidas(), 1)
+        self.tipo.refresh_from_db()
+        self.assertEqual(self.tipo.reservados, 1)
+        self.assertEqual(Reserva.objects.count(), 1)
+
+
+class SalaEsperaTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.evento, _, _ = crear_evento_con_tickets(self.cuenta, n=0)
+        Evento.objects.filter(id=self.evento.id).update(sala_espera=True, admisiones_por_segundo=2)
+
+    def test_turnos_se_reparten_por_segundo(self):
+        t0 = 1_000_000.2
+        turnos = [sala_espera.leer(sala_espera.emitir(self.evento.id, 2, ahora=t0), self.evento.id, ahora=t0)
+                  for _ in range(5)]
+        self.assertEqual([(t["s"] - 1_000_000, t["p"]) for t in turnos],
+                         [(0, 1), (0, 2), (1, 1), (1, 2), (2, 1)])
+        self.assertFalse(sala_espera.admitido(turnos[4], ahora=t0 + 1))
+        self.assertTrue(sala_espera.admitido(turnos[4], ahora=t0 + 2))
+        self.assertIsNone(sala_espera.leer("x" + sala_espera.emitir(self.evento.id, 2), self.evento.id))
+
+    def test_checkout_pasa_por_la_cola(self):
+        step1 = reverse("orders:public-checkout-step1", args=[self.evento.slug])
+        cola = reverse("orders:public-waiting-room", args=[self.evento.slug])
+        # Otros compradores llenan los próximos segundos
+        for _ in range(20):
+            sala_espera.emitir(self.evento.id, 2)
+
+        c = Client()
+        self.assertRedirects(c.get(step1), cola, fetch_redirect_response=False)
+        with self.assertNumQueries(0):
+            r = c.get(cola)
+        self.assertContains(r, "Estás en la fila")
+        self.assertIn(sala_espera.nombre_cookie(self.evento.id), r.cookies)
+        self.assertRedirects(c.get(step1), cola, fetch_redirect_response=False)
+
+        with mock.patch("orders.services.sala_espera.time.time", return_value=time.time() + 60):
+            self.assertEqual(c.get(step1).status_code, 200)
+
+
+class IdempotenciaTests(TransactionTestCase):
+    def setUp(self):
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.evento, self.tipo, _ = crear_evento_con_tickets(self.cuenta, n=0)
+
+    def test_api_repite_la_primera_respuesta(self):
+        url = reverse("orders:public-checkout-create")
+        body = json.dumps({"evento_slug": self.evento.slug, "buyer": {"email": "c@test.cl"},
+                           "items": [{"tipo_ticket_id": self.tipo.id, "cantidad": 2}]})
+        c = Client()
+        r1 = c.post(url, body, content_type="application/json", headers={"Idempotency-Key": "k1"})
+        r2 = c.post(url, body, content_type="application/json", headers={"Idempotency-Key": "k1"})
+
+        self.assertEqual(r1.json(), r2.json())
+        self.assertEqual(r2["Idempotent-Replayed"], "true")
+        self.assertEqual(Ticket.objects.filter(tipo=self.tipo).count(), 2)
+        otro = c.post(url, body.replace('"cantidad": 2', '"cantidad": 3'),
+                      content_type="application/json", headers={"Idempotency-Key": "k1"})
+        self.assertEqual(otro.status_code, 422)
+
+    def test_duplicados_concurrentes_esperan_al_primero(self):
+        llamadas = []
+        barrera = threading.Barrier(4)
+        resultados = []
+
+        def trabajo():
+            llamadas.append(1)
+            time.sleep(0.2)
+            orden = Orden.objects.create(cuenta=self.cuenta, evento=self.evento, comprador_email="c@test.cl")
+            return 200, {"orden_id": orden.id}
+
+        def reintento():
+            try:
+                barrera.wait()
+                resultados.append(idempotencia.ejecutar("webpay", "tok-1", trabajo)[1])
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=reintento) for _ in range(4)]
+        for h in hilos:
+            h.start()
+        for h in hilos:
+            h.join()
+
+        self.assertEqual(len(llamadas), 1)
+        self.assertEqual(len({r["orden_id"] for r in resultados}), 1)
+        self.assertEqual(len(resultados), 4)
+
+    def test_trabajo_fuera_de_la_transaccion_de_la_clave(self):
+        def trabajo():
+            # La clave ya está confirmada "en curso" y no hay transacción abierta
+            self.assertFalse(connection.in_atomic_block)
+            self.assertIsNone(ClaveIdempotencia.objects.get(clave="tok-2").status)
+            return 200, {"ok": True}
+
+        self.assertEqual(idempotencia.ejecutar("webpay", "tok-2", trabajo), (200, {"ok": True}, False))
+        self.assertEqual(idempotencia.ejecutar("webpay", "tok-2", trabajo), (200, {"ok": True}, True))
+
+    def test_clave_en_curso_y_vencida(self):
+        ClaveIdempotencia.objects.create(ambito="webpay", clave="tok-3")
+        with mock.patch.object(idempotencia, "ESPERA_MAX", 0.2):
+            with self.assertRaises(idempotencia.EnCurso):
+                idempotencia.ejecutar("webpay", "tok-3", lambda: (200, {}))
+
+        ClaveIdempotencia.objects.filter(clave="tok-3").update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(idempotencia.ejecutar("webpay", "tok-3", lambda: (200, {"n": 1})), (200, {"n": 1}, False))
+
+
+class CuposDescuentoTests(TransactionTestCase):
+    def setUp(self):
+        self.datos = bench_descuentos.sembrar(usos_maximos=7)
+        self.codigo = self.datos["codigo"]
+
+    def test_workers_concurrentes_no_exceden_usos_maximos(self):
+        for workers in (1, 4):
+            bench_descuentos.reiniciar(self.datos)
+            r = bench_descuentos.medir(self.datos, "repartido", workers, checkouts=20, retencion_ms=0)
+            self.assertEqual((r["consumidos"], r["errores"]), (7, 0))
+            self.assertEqual(self.codigo.usos_totales(), 7)
+
+    @skipIf(connection.vendor == "sqlite", "SQLite serializa toda escritura: no hay escalamiento que medir")
+    def test_repartido_escala_con_workers(self):
+        datos = bench_descuentos.sembrar(usos_maximos=10_000)
+        uno = bench_descuentos.medir(datos, "repartido", 1, checkouts=200, retencion_ms=5)
+        cuatro = bench_descuentos.medir(datos, "repartido", 4, checkouts=200, retencion_ms=5)
+        self.assertEqual(cuatro["errores"], 0)
+        self.assertGreater(cuatro["checkouts_por_segundo"], 2 * uno["checkouts_por_segundo"])
+
+    def test_editar_usos_maximos_reparte_el_nuevo_cupo(self):
+        for _ in range(7):
+            self.assertTrue(cupos_descuento.consumir(self.codigo))
+        self.assertFalse(cupos_descuento.consumir(self.codigo))
+
+        self.codigo.usos_maximos = 9
+        self.codigo.save()
+        cupos_descuento.redimensionar(self.codigo)
+        self.assertTrue(cupos_descuento.consumir(self.codigo))
+        self.assertTrue(cupos_descuento.consumir(self.codigo))
+        self.assertFalse(cupos_descuento.consumir(self.codigo))
+        self.assertEqual(self.codigo.usos_totales(), 9)
+
+
+class PreciosTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.evento, self.tipo, _ = crear_evento_con_tickets(self.cuenta, n=0)
+        self.vip = TipoTicket.objects.create(evento=self.evento, nombre="VIP", precio=5000)
+        DiscountCode.objects.create(cuenta=self.cuenta, evento=self.evento, nombre="Promo",
+                                    codigo="PROMO", monto_descuento=1500, usos_maximos=5)
+        self.items = [{"tipo_ticket_id": self.tipo.id, "cantidad": 2},
+                      {"tipo_ticket_id": self.vip.id, "cantidad": 1}]
+
+    def test_tabla_cacheada_e_invalidada_al_guardar(self):
+        precios.cotizar(self.evento, self.items)
+        with self.assertNumQueries(0):
+            cot = precios.cotizar(self.evento, self.items)
+        self.assertEqual(cot["total"], 7000)
+
+        self.vip.precio = 6000
+        with self.captureOnCommitCallbacks(execute=True):
+            self.vip.save()
+        self.assertEqual(precios.cotizar(self.evento, self.items)["total"], 8000)
+
+        with self.assertRaises(precios.ItemInvalido):
+            precios.cotizar(self.evento, [{"tipo_ticket_id": 999999, "cantidad": 1}])
+
+    def test_validacion_y_checkout_usan_la_misma_cotizacion(self):
+        c = Client()
+        body = {"evento_slug": self.evento.slug, "items": self.items}
+        r = c.post(reverse("orders:api-promo-validar"), json.dumps({**body, "code": "promo"}),
+                   content_type="application/json")
+        self.assertEqual(r.json()["discount_amount"], 1500)
+        self.assertEqual(r.json()["total"], 5500)
+
+        r = c.post(reverse("orders:public-checkout-create"),
+                   json.dumps({**body, "promo_code": "promo", "buyer": {"email": "c@test.cl"}}),
+                   content_type="application/json")
+        self.assertEqual((r.json()["subtotal"], r.json()["discount"], r.json()["total"]), (7000, 1500, 5500))
+        self.assertEqual(DiscountCode.objects.get(codigo="PROMO").usos_totales(), 1)
+
+    def test_version_compartida_y_ttl(self):
+        precios.tabla(self.evento.id)
+        # Cambio avisado por otro worker: sólo sube la versión en el cache
+        TipoTicket.objects.filter(pk=self.vip.pk).update(precio=6000)
+        cache.incr(precios._version_key(self.evento.id))
+        self.assertEqual(precios.tabla(self.evento.id)["tipos"][self.vip.id].precio, 6000)
+
+        # Sin aviso (cache no compartido): vence con el TTL
+        TipoTicket.objects.filter(pk=self.vip.pk).update(precio=7000)
+        self.assertEqual(precios.tabla(self.evento.id)["tipos"][self.vip.id].precio, 6000)
+        with self.settings(PRICE_TABLE_TTL_SECONDS=0):
+            self.assertEqual(precios.tabla(self.evento.id)["tipos"][self.vip.id].precio, 7000)
+
+    def test_pago_confirmado_exige_el_tipo_del_codigo(self):
+        DiscountCode.objects.create(cuenta=self.cuenta, evento=self.evento, nombre="VIP", codigo="SOLOVIP",
+                                    monto_descuento=500, tipo_ticket=self.vip)
+        payload = {"items": [{"tipo_ticket_id": self.tipo.id, "cantidad": 1}], "promo_code": "solovip"}
+        with self.assertRaisesMessage(ValueError, "requiere un tipo de ticket"):
+            finalizar_pago_y_generar_codigo(evento=self.evento, payload=payload, buyer={"email": "c@test.cl"})
+
+        payload["items"] = [{"tipo_ticket_id": 999999, "cantidad": 1}]
+        with self.assertRaises(precios.ItemInvalido):
+            finalizar_pago_y_generar_codigo(evento=self.evento, payload=payload, buyer={"email": "c@test.cl"})
+        self.assertFalse(Orden.objects.filter(comprador_email="c@test.cl").exists())
+
+    def test_codigo_nuevo_sin_aviso_se_lee_por_pk(self):
+        precios.tabla(self.evento.id)
+        # Creado en otro worker: la versión no llegó a este proceso
+        DiscountCode.objects.create(cuenta=self.cuenta, evento=self.evento, nombre="Nuevo",
+                                    codigo="NUEVO", monto_descuento=700)
+        cot = precios.cotizar(self.evento, self.items, "nuevo")
+        self.assertIsNone(cot["error_codigo"])
+        self.assertEqual(cot["descuento"], 700)
+
+    def test_promo_no_pasa_de_usos_maximos(self):
+        promo = PromoCode.objects.create(cuenta=self.cuenta, evento=self.evento, codigo="VERANO",
+                                         tipo="fixed", valor=1000, usos_maximos=1)
+        self.assertTrue(promo.registrar_uso())
+        # Otro comprador que cotizó antes del primer uso
+        self.assertFalse(promo.registrar_uso())
+        promo.refresh_from_db()
+        self.assertEqual(promo.usos_actuales, 1)
+
+
+class CodigosPromoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.evento, _, _ = crear_evento_con_tickets(self.cuenta, n=0)
+
+    def test_mapa_en_memoria_se_invalida_con_senales(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            d = DiscountCode.objects.create(cuenta=self.cuenta, evento=self.evento, nombre="Promo",
+                                            codigo=" verano ", monto_descuento=100)
+        self.assertEqual(d.codigo_norm, "VERANO")
+        self.assertEqual(codigos_promo.buscar(self.evento.id, "Verano"), ("descuento", d.id))
+        with self.assertNumQueries(0):
+            self.assertEqual(codigos_promo.buscar(self.evento.id, "verano"), ("descuento", d.id))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            d.activo = False
+            d.save()
+        self.assertIsNone(codigos_promo.buscar(self.evento.id, "VERANO"))
+
+    def test_miss_del_mapa_se_busca_por_indice(self):
+        self.assertIsNone(codigos_promo.buscar(self.evento.id, "otono"))
+        # Creado sin que este proceso reciba la señal (otro worker, cache no compartido)
+        d = DiscountCode.objects.create(cuenta=self.cuenta, evento=self.evento, nombre="Promo",
+                                        codigo="OTONO", monto_descuento=100)
+        self.assertEqual(codigos_promo.buscar(self.evento.id, "otono"), ("descuento", d.id))
+        p = PromoCode.objects.create(cuenta=self.cuenta, evento=self.evento, codigo="VeranoVIP",
+                                     tipo="percent", valor=10)
+        self.assertEqual(codigos_promo.buscar(self.evento.id, "veranovip"), ("promo", p.id))
+
+        # Las cortesías no entran al mapa
+        orden = Orden.objects.filter(evento=self.evento).first()
+        sc = SharedPurchaseCode.objects.create(orden=orden, evento=self.evento, max_uses=1)
+        self.assertNotIn(sc.code.upper(), codigos_promo.mapa(self.evento.id))
+        self.assertEqual(codigos_promo.buscar(self.evento.id, sc.code.upper()), ("cortesia", sc.id))
+
+    def test_modelo_resuelto_al_arrancar(self):
+        self.assertIs(codigos_promo._modelo, DiscountCode)
+
+
+class WebpayClienteTests(TestCase):
+    def setUp(self):
+        self.stub = StubWebpay(("127.0.0.1", 0))
+        threading.Thread(target=self.stub.serve_forever, daemon=True).start()
+        self.addCleanup(self.stub.server_close)
+        self.addCleanup(self.stub.shutdown)
+        ajustes = override_settings(WEBPAY_HOST=self.stub.url)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def test_create_commit_contra_stub(self):
+        antes = webpay.metricas().get("commit", {}).get("llamadas", 0)
+        cliente = webpay.wb()
+        resp = cliente.create("o-1", "s-1", 5000, "http://testserver/volver/")
+        self.assertTrue(resp["url"].startswith(self.stub.url))
+
+        tx = cliente.commit(resp["token"])
+        self.assertEqual(tx["status"], "AUTHORIZED")
+        self.assertEqual(tx["amount"], 5000)
+        self.assertEqual(cliente.status(resp["token"])["status"], "AUTHORIZED")
+
+        # Un segundo commit del mismo token lo rechaza Transbank
+        with self.assertRaises(TransbankError):
+            cliente.commit(resp["token"])
+
+        m = webpay.metricas()["commit"]
+        self.assertEqual(m["llamadas"] - antes, 2)
+        self.assertGreaterEqual(m["errores"], 1)
+        self.assertIs(webpay.session(), webpay.session())
+
+    def test_rechazo_del_stub(self):
+        self.stub.tasa_rechazo = 1.0
+        resp = webpay.wb().create("o-2", "s-2", 1000, "http://testserver/volver/")
+        tx = webpay.wb().commit(resp["token"])
+        self.assertEqual(tx["status"], "FAILED")
+        self.assertNotEqual(tx["response_code"], 0)
+
+    def test_metricas_solo_para_superusuarios(self):
+        webpay.wb().create("o-3", "s-3", 1000, "http://testserver/volver/")
+        url = reverse("orders:webpay-metrics")
+        c = Client()
+        c.force_login(User.objects.create_user(email="admin@test.cl", password="x", is_staff=True))
+        self.assertEqual(c.get(url).status_code, 302)
+
+        c.force_login(User.objects.create_superuser(email="root@test.cl", password="x"))
+        data = c.get(url).json()
+        self.assertGreaterEqual(data["operaciones"]["create"]["llamadas"], 1)
+
+
+class PagoAsincronoTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.evento, self.tipo, _ = crear_evento_con_tickets(self.cuenta, n=0)
+        self.stub = StubWebpay(("127.0.0.1", 0))
+        threading.Thread(target=self.stub.serve_forever, daemon=True).start()
+        self.addCleanup(self.stub.server_close)
+        self.addCleanup(self.stub.shutdown)
+        ajustes = override_settings(WEBPAY_HOST=self.stub.url, WEBPAY_COMMIT_MODE="async")
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def _pagar(self, c):
+        r = c.post(reverse("orders:public-checkout-pay", args=[self.evento.slug]), {"email": "c@test.cl"})
+        self.assertTrue(r["Location"].startswith(self.stub.url))
+        return r["Location"].split("token_ws=")[1]
+
+    def test_retorno_encola_y_worker_confirma(self):
+        c = Client()
+        token = self._pagar(c)
+        retorno = reverse("orders:webpay-return", args=[self.evento.slug])
+        r = c.post(retorno, {"token_ws": token})
+        estado_url = reverse("orders:public-checkout-status", args=[token])
+        self.assertRedirects(r, estado_url, fetch_redirect_response=False)
+        self.assertEqual(Orden.objects.filter(evento=self.evento).count(), 1)  # la del helper
+
+        # Recarga del retorno: no vuelve a encolar
+        c.post(retorno, {"token_ws": token})
+        datos = reverse("orders:public-checkout-status-data", args=[token])
+        self.assertEqual(c.get(datos).json(), {"estado": "recibida", "listo": False})
+        self.assertEqual(c.get(estado_url).status_code, 200)
+
+        self.assertEqual(pagos_webpay.procesar_pendientes(), 1)
+        self.assertEqual(pagos_webpay.procesar_pendientes(), 0)
+        self.assertEqual(c.get(datos).json(), {"estado": "pagada", "listo": True})
+        tx = TransaccionWebpay.objects.get(token=token)
+        self.assertRedirects(c.get(estado_url), reverse("orders:public-checkout-success", args=[tx.orden_id]),
+                             fetch_redirect_response=False)
+        self.assertEqual(Ticket.objects.filter(orden_id=tx.orden_id).count(), 1)
+        self.assertFalse(Reserva.objects.exists())
+        pago = Pago.objects.get(orden_id=tx.orden_id)
+        self.assertEqual((pago.token, pago.buy_order, pago.status), (token, tx.buy_order, "AUTHORIZED"))
+
+    def test_rechazo_libera_la_reserva(self):
+        self.stub.tasa_rechazo = 1.0
+        c = Client()
+        token = self._pagar(c)
+        c.post(reverse("orders:webpay-return", args=[self.evento.slug]), {"token_ws": token})
+        pagos_webpay.procesar_pendientes()
+
+        tx = TransaccionWebpay.objects.get(token=token)
+        self.assertEqual((tx.estado, tx.resultado["reason"]), ("rechazada", "not-authorized"))
+        self.assertFalse(Reserva.objects.exists())
+        self.tipo.refresh_from_db()
+        self.assertEqual(self.tipo.reservados, 0)
+
+    def test_error_tecnico_reintenta_consultando_estado(self):
+        c = Client()
+        token = self._pagar(c)
+        c.post(reverse("orders:webpay-return", args=[self.evento.slug]), {"token_ws": token})
+        # El commit llega a Transbank pero la respuesta se pierde
+        commit = webpay.wb().commit
+
+        def commit_sin_respuesta(t):
+            commit(t)
+            raise TransbankError("timeout")
+
+        with mock.patch.object(webpay.wb(), "commit", side_effect=commit_sin_respuesta):
+            pagos_webpay.procesar_pendientes()
+        self.assertEqual(TransaccionWebpay.objects.get(token=token).estado, "recibida")
+
+        pagos_webpay.procesar_pendientes()
+        tx = TransaccionWebpay.objects.get(token=token)
+        self.assertEqual((tx.estado, tx.intentos), ("pagada", 2))
+
+    def test_orden_imposible_tras_autorizar_es_terminal(self):
+        c = Client()
+        token = self._pagar(c)
+        c.post(reverse("orders:webpay-return", args=[self.evento.slug]), {"token_ws": token})
+        with mock.patch.object(pagos_webpay, "finalizar_pago_y_generar_codigo", side_effect=ValueError("tipo")):
+            pagos_webpay.procesar_pendientes()
+        tx = TransaccionWebpay.objects.get(token=token)
+        self.assertEqual((tx.estado, tx.resultado["reason"]), ("rechazada", "order-error"))
+        self.assertEqual(pagos_webpay.procesar_pendientes(), 0)
+
+    def test_excepciones_repetidas_agotan_los_intentos(self):
+        c = Client()
+        token = self._pagar(c)
+        c.post(reverse("orders:webpay-return", args=[self.evento.slug]), {"token_ws": token})
+        with mock.patch.object(pagos_webpay, "procesar", side_effect=RuntimeError("bug")):
+            for _ in range(pagos_webpay.MAX_INTENTOS):
+                self.assertEqual(pagos_webpay.procesar_pendientes(), 1)
+        tx = TransaccionWebpay.objects.get(token=token)
+        self.assertEqual((tx.estado, tx.resultado["reason"]), ("fallida", "worker-error"))
+
+        # Un "procesando" con el lease vencido y sin intentos no se retoma
+        TransaccionWebpay.objects.filter(pk=tx.pk).update(
+            estado="procesando", updated_at=timezone.now() - timedelta(hours=1)
+        )
+        self.assertEqual(pagos_webpay.procesar_pendientes(), 0)
+        self.assertEqual(TransaccionWebpay.objects.get(pk=tx.pk).estado, "fallida")
+
+
+class ConciliacionTests(TestCase):
+    def setUp(self):
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.evento, self.tipo, _ = crear_evento_con_tickets(self.cuenta, n=0)
+        self.pagos = [self._pagar(i) for i in range(3)]
+
+    def _pagar(self, i):
+        payload = {"items": [{"tipo_ticket_id": self.tipo.id, "cantidad": 1}]}
+        webpay_data = {"token": f"tok-{i}", "buy_order": f"EVT-{i}", "amount": 1000, "authorization_code": f"00{i}",
+                       "status": "AUTHORIZED", "transaction_date": "2026-03-01T20:00:00Z"}
+        orden = finalizar_pago_y_generar_codigo(evento=self.evento, payload=payload,
+                                                buyer={"email": "c@test.cl"}, webpay_data=webpay_data)
+        return orden.pago
+
+    def test_libro_contra_export(self):
+        self.assertEqual(self.pagos[0].monto, 1000)
+        export = io.StringIO(
+            "Orden de compra;Monto;Estado;Código de autorización;Fecha\n"
+            f"EVT-0;$1.000;Aprobada;000;{timezone.now().date().isoformat()}\n"
+            f"EVT-1;$1.500;Aprobada;001;{timezone.now().date().isoformat()}\n"
+            f"EVT-9;$2.000;Aprobada;009;{timezone.now().date().isoformat()}\n"
+            f"EVT-8;$2.000;Rechazada;;{timezone.now().date().isoformat()}\n"
+        )
+        with self.assertNumQueries(4):  # lote + bulk_update + faltantes (lista y update)
+            res = conciliacion.conciliar(conciliacion.leer_export(export), lote=10)
+
+        self.assertEqual((res["ok"], res["diferencias"], res["faltantes"]), (1, 1, 1))
+        self.assertEqual(res["sin_libro"], ["EVT-9"])
+        estados = dict(Pago.objects.values_list("buy_order", "conciliacion"))
+        self.assertEqual(estados, {"EVT-0": "ok", "EVT-1": "diferencia", "EVT-2": "faltante"})
+        self.assertIn("monto 1000 vs 1500", Pago.objects.get(buy_order="EVT-1").conciliacion_detalle)
+
+
+class MontosCongeladosTests(TestCase):
+    def setUp(self):
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.evento, self.tipo, _ = crear_evento_con_tickets(self.cuenta, n=0)
+        self.parking = TipoTicket.objects.create(evento=self.evento, nombre="Parking", precio=500, is_parking=True)
+
+    def test_checkout_congela_y_reparte_el_descuento(self):
+        DiscountCode.objects.create(cuenta=self.cuenta, evento=self.evento, nombre="Promo",
+                                    codigo="MITAD", monto_descuento=301)
+        orden, tickets = crear_orden_y_tickets(
+            evento=self.evento, comprador_email="c@test.cl", promo_code="mitad",
+            items=[{"tipo_ticket": self.tipo, "cantidad": 2}, {"tipo_ticket": self.parking, "cantidad": 1}],
+        )
+        orden.refresh_from_db()
+        self.assertEqual((orden.subtotal, orden.descuento, orden.total), (2500, 301, 2199))
+        netos = sorted(Ticket.objects.filter(orden=orden).values_list("descuento", "neto"))
+        self.assertEqual(netos, [(60, 440), (120, 880), (121, 879)])
+
+        # El reporte suma lo congelado aunque cambie el precio de lista
+        TipoTicket.objects.filter(pk=self.tipo.pk).update(precio=5000)
+        user = User.objects.create_user(email="finanzas@test.cl", password="x")
+        r = cliente_validador(user, self.cuenta).get(reverse("orders:event-financial-report", args=[self.evento.id]))
+        self.assertEqual((r.context["total_bruto"], r.context["descuentos_totales"], r.context["total_neto"]),
+                         (2500, 301, 2199))
+
+    def test_cortesia_regala_las_entradas_mas_caras(self):
+        vip = TipoTicket.objects.create(evento=self.evento, nombre="VIP", precio=3000)
+        orden = Orden.objects.create(cuenta=self.cuenta, evento=self.evento, comprador_email="c@test.cl")
+        tickets = emitir_tickets(orden, [(self.tipo, 1), (vip, 1), (self.parking, 1)])
+        montos.congelar(orden, tickets, descuento=3000, origen="cortesia")
+        self.assertEqual({t.tipo.nombre: t.neto for t in tickets}, {"General": 1000, "VIP": 0, "Parking": 500})
+        self.assertEqual(orden.total, 1500)
+
+    def test_backfill_por_lotes(self):
+        # Órdenes anteriores: tickets sin precio, orden sin total
+        Ticket.objects.create(orden=Orden.objects.create(cuenta=self.cuenta, evento=self.evento,
+                                                         comprador_email="a@test.cl"),
+                              evento=self.evento, tipo=self.parking)
+        legado = Orden.objects.filter(total__isnull=True)
+        self.assertEqual(legado.count(), 2)
+        Pago.objects.create(orden=legado.first(), evento=self.evento, token="t", buy_order="b", monto=0,
+                            status="AUTHORIZED")
+
+        self.assertEqual(montos.backfill(lote=1), 2)
+        self.assertFalse(Orden.objects.filter(total__isnull=True).exists())
+        self.assertFalse(Ticket.objects.filter(neto__isnull=True).exists())
+        self.assertEqual(montos.backfill(), 0)
+
+
+class PaginacionCursorTests(TestCase):
+    def setUp(self):
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.evento, _, _ = crear_evento_con_tickets(self.cuenta, n=0)
+        Orden.objects.bulk_create([
+            Orden(cuenta=self.cuenta, evento=self.evento, comprador_email=f"c{i}@test.cl") for i in range(44)
+        ])
+        # Empates de created_at: el id desempata
+        ahora = timezone.now()
+        for i, pk in enumerate(Orden.objects.order_by("pk").values_list("pk", flat=True)):
+            Orden.objects.filter(pk=pk).update(created_at=ahora - timedelta(minutes=i // 3))
+        self.esperado = list(Orden.objects.order_by("-created_at", "-pk").values_list("pk", flat=True))
+
+    def test_recorre_hacia_atras_y_adelante_sin_saltos(self):
+        qs = Orden.objects.filter(cuenta=self.cuenta)
+        vistas, paginas, cursor = [], [], None
+        while True:
+            with self.assertNumQueries(1):
+                pagina = paginacion.paginar(qs, cursor, por_pagina=10)
+            paginas.append([o.pk for o in pagina])
+            vistas += paginas[-1]
+            if not pagina.siguiente:
+                break
+            cursor = pagina.siguiente
+        self.assertEqual(vistas, self.esperado)
+        self.assertEqual([len(p) for p in paginas], [10, 10, 10, 10, 5])
+
+        # De la última página hacia las más recientes
+        anterior = paginacion.paginar(qs, pagina.anterior, por_pagina=10)
+        self.assertEqual([o.pk for o in anterior], paginas[-2])
+        primera = paginacion.paginar(qs, paginacion.paginar(qs, anterior.anterior, por_pagina=10).anterior, por_pagina=10)
+        self.assertEqual([o.pk for o in primera], paginas[1])
+
+        # Un cursor adulterado vuelve a la primera página
+        self.assertEqual([o.pk for o in paginacion.paginar(qs, cursor + "x", por_pagina=10)], paginas[0])
+        self.assertEqual(paginacion.contar_hasta(qs, tope=20), (20, False))
+
+    def test_listado_con_cursor(self):
+        user = User.objects.create_user(email="staff@test.cl", password="x")
+        UsuarioRol.objects.create(usuario=user, cuenta=self.cuenta, rol="staff")
+        c = cliente_validador(user, self.cuenta)
+        url = reverse("orders:orders-by-event", args=[self.evento.id])
+
+        r = c.get(url)
+        self.assertEqual((r.context["total"], r.context["total_exacto"]), (45, True))
+        siguiente = r.context["pagina"].siguiente
+        r2 = c.get(url, {"cursor": siguiente})
+        self.assertIsNone(r2.context["total"])
+        self.assertEqual([o.pk for o in r2.context["ordenes"]], self.esperado[20:40])
+        self.assertContains(r2, "Más recientes")
+
+    def test_tickets_contados_solo_para_la_pagina(self):
+        orden = Orden.objects.get(pk=self.esperado[0])
+        tipo = TipoTicket.objects.get(evento=self.evento)
+        Ticket.objects.bulk_create([Ticket(orden=orden, evento=self.evento, tipo=tipo) for _ in range(3)])
+        pagina = paginacion.paginar(Orden.objects.filter(cuenta=self.cuenta), por_pagina=10)
+        with self.assertNumQueries(1):
+            paginacion.contar_tickets(pagina)
+        self.assertEqual([o.n_tickets for o in pagina][:2], [3, 0])
+
+
+class BusquedaOrdenesTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.cuenta = Cuenta.objects.create(nombre="Productora")
+        self.evento, _, _ = crear_evento_con_tickets(self.cuenta, n=0)  # "Evento Test", a@test.cl
+        self.rock = Evento.objects.create(cuenta=self.cuenta, nombre="Festival Rock Ñuñoa", slug="rock")
+        self.orden = Orden.objects.create(cuenta=self.cuenta, evento=self.rock, comprador_email=" Juan.Perez@Mail.CL ")
+        self.qs = Orden.objects.filter(cuenta=self.cuenta)
+
+    def _ids(self, q):
+        return set(busqueda_ordenes.filtrar(self.qs, self.cuenta.id, q).values_list("pk", flat=True))
+
+    def test_enruta_por_tipo_de_texto(self):
+        self.assertEqual(self.orden.comprador_email_norm, "juan.perez@mail.cl")
+        self.assertEqual(self._ids(f"#{self.orden.pk}"), {self.orden.pk})
+        self.assertEqual(self._ids("JUAN.PEREZ@m"), {self.orden.pk})
+        self.assertEqual(self._ids("juan"), {self.orden.pk})
+        self.assertEqual(self._ids("fest nunoa"), {self.orden.pk})
+        self.assertEqual(self._ids("rock test"), set())
+        self.assertEqual(self._ids("perez"), set())  # sólo prefijo
+
+        # Sin consultar eventos: el índice de nombres viene del cache
+        with self.assertNumQueries(1):
+            list(busqueda_ordenes.filtrar(self.qs, self.cuenta.id, "festival"))
+
+    def test_renombrar_evento_invalida_el_indice(self):
+        self.assertEqual(self._ids("metal"), set())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.rock.nombre = "Metal Fest"
+            self.rock.save()
+        self.assertEqual(self._ids("metal"), {self.orden.pk})
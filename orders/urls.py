@@ -8,6 +8,7 @@ from . import views_reports
 from . import views_operational
 from . import views_public
 from . import views_public_api
+from . import views_gate
 
 
 
@@ -20,14 +21,22 @@ urlpatterns = [
     path("crear/", views.order_create, name="create"),
     path("<int:pk>/", views.order_detail, name="detail"),
     path("ticket/<str:code>/qr.png", views.ticket_qr, name="ticket_qr"),
+    path("validate/batch/", views.validate_batch, name="validate-batch"),
     path("validate/<str:code>/", views.validate_ticket, name="validate"),
     path("validar/", views.validator_page, name="validator"),
+    path("gate/<int:ap_id>/events/<int:event_id>/manifest/", views_gate.gate_manifest, name="gate-manifest"),
+    path("gate/<int:ap_id>/events/<int:event_id>/delta/", views_gate.gate_delta, name="gate-delta"),
+    path("gate/<int:ap_id>/events/<int:event_id>/upload/", views_gate.gate_upload, name="gate-upload"),
+    path("gate/metrics/", views_gate.gate_metrics, name="gate-metrics"),
+    path("gate/metrics/panel/", views_gate.gate_metrics_panel, name="gate-metrics-panel"),
+    path("webpay/metrics/", views_operational.webpay_metrics, name="webpay-metrics"),
     path("tickets/<uuid:code>/pdf/", views_pdf.ticket_pdf_by_code, name="ticket-pdf"),
     path("tickets/<uuid:code>/email/", views_email.ticket_email_by_code, name="ticket-email"),
     path("orders/<int:order_id>/email-all/", views_email.order_email_all, name="order-email-all"),
     path("analytics/<int:event_id>/", views_analytics.event_summary, name="event-analytics"),
     path("analytics/<int:event_id>/export/", views_export.export_event_tickets_csv, name="event-export-csv"),
     path("analytics/<int:event_id>/summary-data/", views_analytics.event_summary_data, name="event-summary-data"),
+    path("analytics/<int:event_id>/live/", views_analytics.event_validation_stream, name="event-validation-stream"),
     path("analytics/<int:event_id>/report.pdf", views_reports.event_report_pdf, name="event-report-pdf"),
     path("tickets/<int:ticket_id>/cancel/", views_operational.ticket_cancel, name="ticket-cancel"),
     path("tickets/<int:ticket_id>/reissue/", views_operational.ticket_reissue, name="ticket-reissue"),
@@ -35,6 +44,7 @@ urlpatterns = [
     # Público (evento + compra)
     path("public/event/<slug:slug>/", views_public.event_public_detail, name="public-event"),
     path("public/event/<slug:slug>/comprar/", views_public.checkout_step1, name="public-checkout-step1"),
+    path("public/event/<slug:slug>/cola/", views_public.waiting_room, name="public-waiting-room"),
     path("api/checkout/", views_public_api.checkout_crear_orden, name="public-checkout-create"),
     path("public/checkout/success/<int:order_id>/", views_public.public_checkout_success, name="public-checkout-success"),
     path("public/checkout/<int:order_id>/pdf/", views_pdf.order_tickets_pdf, name="public-order-pdf"),
@@ -62,5 +72,7 @@ urlpatterns = [
 
 
     path( "public/<slug:slug>/checkout/webpay-return/", views_public.webpay_return, name="webpay-return",),
+    path("public/checkout/pago/<str:token>/", views_public.public_checkout_status, name="public-checkout-status"),
+    path("public/checkout/pago/<str:token>/estado/", views_public.public_checkout_status_data, name="public-checkout-status-data"),
     
 ]
\ No newline at end of file
@@ -1,4 +1,5 @@
 # Python estándar
+import time
 from io import BytesIO
 import qrcode
 
@@ -11,20 +12,30 @@ from django.utils.timezone import now
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
+from django.contrib import messages
 
 # Apps del proyecto
 from accounts.utils import get_current_cuenta, require_role
 from events.models import Evento
 from tickets.models import TipoTicket
-from .models import Orden, Ticket, ValidationLog
+from .models import AccessPoint, Orden, Ticket
+from orders.services import (
+    busqueda_ordenes, feed_validaciones, filtro_codigos, metricas_puerta, montos, paginacion, qr_firma,
+)
+from orders.services.bitacora import registrar_validacion
+from orders.services.emision import emitir_tickets
+from orders.services.inventario import StockInsuficiente, tomar_stock
+from orders.services.puertas import puerta_autorizada, puertas_de
+from orders.services.validacion import (
+    quemar_ticket, validar_lote, leer_lote, resultado_a_dict, MAX_LOTE,
+)
 from django.http import HttpResponse, Http404
 from django.template.loader import render_to_string
 from xhtml2pdf import pisa
 import io, base64, qrcode
 from django.db import transaction
 
-from django.core.paginator import Paginator
-from django.db.models import Q
+from django.core.exceptions import ValidationError
 
 
 
@@ -85,25 +96,24 @@ def order_list(request):
     hasta = request.GET.get("hasta") or ""
 
     if q:
-        qs = qs.filter(
-            Q(id__icontains=q) |
-            Q(evento__nombre__icontains=q) |
-            Q(comprador_email__icontains=q)
-        )
+        # id exacto, prefijo de email o nombre de evento (sin LIKE '%q%')
+        qs = busqueda_ordenes.filtrar(qs, cuenta.id, q)
 
     if desde:
         qs = qs.filter(created_at__date__gte=desde)
     if hasta:
         qs = qs.filter(created_at__date__lte=hasta)
 
-    # -------- Paginación --------
-    paginator = Paginator(qs, 20)  # 20 órdenes por página
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # -------- Paginación por cursor (sin COUNT ni OFFSET) --------
+    cursor = request.GET.get("cursor")
+    pagina = paginacion.contar_tickets(paginacion.paginar(qs, cursor))
+    total, total_exacto = paginacion.contar_hasta(qs) if not cursor else (None, False)
 
     contexto = {
-        "ordenes": page_obj.object_list,
-        "page_obj": page_obj,
+        "ordenes": pagina.items,
+        "pagina": pagina,
+        "total": total,
+        "total_exacto": total_exacto,
         "q": q,
         "desde": desde,
         "hasta": hasta,
@@ -128,17 +138,21 @@ def order_create(request):
         with transaction.atomic():
             orden = Orden.objects.create(cuenta=cuenta, evento=evento, comprador_email=email)
 
-            total_tickets = 0
+            lineas = []
             for tipo in tipos:
                 cantidad = int(request.POST.get(f"cantidad_{tipo.id}", 0))
-                for _ in range(cantidad):
-                    Ticket.objects.create(
-                        orden=orden,
-                        evento=evento,
-                        tipo=tipo,
-                        asistente_email=email,
-                    )
-                    total_tickets += 1
+                if cantidad > 0:
+                    lineas.append((tipo, cantidad))
+
+            try:
+                tomar_stock(lineas)
+            except StockInsuficiente as e:
+                transaction.set_rollback(True)
+                messages.error(request, str(e))
+                return redirect("orders:create")
+            tickets = emitir_tickets(orden, lineas, asistente_email=email)
+            montos.congelar(orden, tickets)
+            total_tickets = len(tickets)
 
         msg = f"{total_tickets} tickets generados para la orden #{orden.id}"
         return redirect("orders:detail", pk=orden.id)
@@ -171,10 +185,13 @@ def order_detail(request, pk):
 
 # ---------- QR ----------
 def ticket_qr(request, code):
-    ticket = Ticket.objects.filter(code=code).first()
+    try:
+        ticket = Ticket.objects.select_related("tipo").filter(code=code).first()
+    except ValidationError:
+        ticket = None
     if not ticket:
         return HttpResponse(status=404)
-    img = qrcode.make(code)
+    img = qrcode.make(qr_firma.payload_qr(ticket))
     buf = BytesIO()
     img.save(buf, format="PNG")
     return HttpResponse(buf.getvalue(), content_type="image/png")
@@ -185,48 +202,127 @@ def ticket_qr(request, code):
 @login_required
 def validate_ticket(request, code):
     cuenta = get_current_cuenta(request)
-    t = Ticket.objects.select_related("evento", "tipo").filter(code=code).first()
+    if not cuenta:
+        return JsonResponse({"ok": False, "error": "NO_ACCOUNT"}, status=403)
+
+    evento_id = request.POST.get("evento_id") or None
+    if evento_id is not None and not str(evento_id).isdigit():
+        return JsonResponse({"ok": False, "error": "INVALID_EVENT"}, status=400)
+
+    # Puerta desde la que se escanea (opcional): debe ser de la cuenta y el
+    # usuario debe poder operarla.
+    ap_id = request.POST.get("access_point_id") or None
+    if ap_id is not None:
+        if not str(ap_id).isdigit() or not puerta_autorizada(request.user, cuenta, ap_id):
+            return JsonResponse({"ok": False, "error": "INVALID_ACCESS_POINT"}, status=403)
+        ap_id = int(ap_id)
+
+    inicio = time.perf_counter()
+    result, note, t, respuesta = _validar_codigo(request, cuenta, code, evento_id, ap_id)
+    metricas_puerta.registrar(cuenta.id, ap_id, result, latencia_ms=(time.perf_counter() - inicio) * 1000)
+    feed_validaciones.publicar(cuenta.id, t.evento_id if t else (int(evento_id) if evento_id else None), {
+        "result": result, "note": note, "code": str(t.code) if t else None,
+        "tipo": t.tipo.nombre if t else None, "access_point_id": ap_id, "at": now().isoformat(),
+    })
+    return respuesta
 
-    if not t:
-        ValidationLog.objects.create(
-            cuenta=cuenta, result='NOT_FOUND', note='TICKET_NOT_FOUND',
-            ip=request.META.get('REMOTE_ADDR'), user_agent=request.META.get('HTTP_USER_AGENT',''),
-            usuario=request.user
-        )
-        return JsonResponse({"ok": False, "error": "TICKET_NOT_FOUND"}, status=404)
-
-    # (opcional) asegurar misma cuenta
-    if t.evento.cuenta_id != cuenta.id:
-        ValidationLog.objects.create(
-            cuenta=cuenta, ticket=t, evento=t.evento, result='DENIED', note='ACCOUNT_MISMATCH',
-            ip=request.META.get('REMOTE_ADDR'), user_agent=request.META.get('HTTP_USER_AGENT',''),
-            usuario=request.user
-        )
-        return JsonResponse({"ok": False, "error": "ACCOUNT_MISMATCH"}, status=403)
 
-    if t.estado == "quemado":
-        ValidationLog.objects.create(
-            cuenta=cuenta, ticket=t, evento=t.evento, result='ALREADY_USED', note='REPEAT',
-            ip=request.META.get('REMOTE_ADDR'), user_agent=request.META.get('HTTP_USER_AGENT',''),
-            usuario=request.user
-        )
-        return JsonResponse(
+def _validar_codigo(request, cuenta, code, evento_id, ap_id):
+    """Resuelve una lectura. Retorna (result, note, ticket | None, JsonResponse)."""
+    log = dict(
+        cuenta_id=cuenta.id, access_point_id=ap_id,
+        ip=request.META.get('REMOTE_ADDR'), user_agent=request.META.get('HTTP_USER_AGENT',''),
+        usuario_id=request.user.id,
+    )
+
+    # QR firmado: falsificaciones y otro evento se rechazan en memoria (el día
+    # lo decide quemar_ticket con la regla vigente del tipo)
+    datos = None
+    try:
+        code, datos = qr_firma.leer_qr(code)
+        rechazo = qr_firma.verificar_en_memoria(datos, evento_id=evento_id)
+    except qr_firma.QRInvalido as e:
+        rechazo = e.nota if e.nota == "BAD_SIGNATURE" else None
+        code = None
+    if rechazo:
+        registrar_validacion(result="DENIED", note=rechazo, **log)
+        return "DENIED", rechazo, None, JsonResponse({"ok": False, "error": rechazo}, status=403)
+
+    # Código que la cuenta nunca emitió: se responde sin la quema condicional
+    # ni consultas y el log se escribe agrupado (1 registro cada N misses).
+    filtro_evento = datos["evento_id"] if datos else None
+    if code is None or not filtro_codigos.puede_existir(cuenta.id, code, evento_id=filtro_evento):
+        n = filtro_codigos.contar_miss(cuenta.id)
+        if n:
+            registrar_validacion(result="NOT_FOUND", note=f"FILTERED_NOT_FOUND x{n}", **log)
+        return "NOT_FOUND", "", None, JsonResponse({"ok": False, "error": "TICKET_NOT_FOUND"}, status=404)
+
+    # El UPDATE condicional decide OK vs ALREADY_USED (sin carrera entre puertas)
+    result, note, t = quemar_ticket(cuenta=cuenta, code=code, evento_id=evento_id)
+
+    registrar_validacion(
+        ticket_id=t.id if t else None, evento_id=t.evento_id if t else None,
+        result=result, note=note, **log
+    )
+
+    if result == "NOT_FOUND":
+        return result, note, t, JsonResponse({"ok": False, "error": "TICKET_NOT_FOUND"}, status=404)
+
+    if result == "DENIED":
+        return result, note, t, JsonResponse({"ok": False, "error": note}, status=403)
+
+    if result == "ALREADY_USED":
+        return result, note, t, JsonResponse(
             {"ok": False, "error": "ALREADY_USED", "used_at": t.used_at, "tipo": t.tipo.nombre, "evento": t.evento.nombre},
             status=409
         )
 
-    # OK: marcar usado
-    t.estado = "quemado"
-    t.used_at = now()
-    t.save(update_fields=["estado", "used_at"])
+    return result, note, t, JsonResponse({"ok": True, "code": str(t.code), "evento": t.evento.nombre, "tipo": t.tipo.nombre})
 
-    ValidationLog.objects.create(
-        cuenta=cuenta, ticket=t, evento=t.evento, result='OK',
-        ip=request.META.get('REMOTE_ADDR'), user_agent=request.META.get('HTTP_USER_AGENT',''),
-        usuario=request.user
+
+@require_http_methods(["POST"])
+@login_required
+def validate_batch(request):
+    """
+    Valida en bloque las lecturas que el escáner acumuló sin conexión.
+
+    Espera JSON:
+      {"scans": [{"code": "<uuid>", "scanned_at": "<ISO>" | <epoch ms>}, ...],
+       "access_point_id": <id>}   # opcional, como en validate_ticket
+
+    Responde un resultado por lectura (mismo orden) con la misma semántica
+    que validate_ticket: OK, ALREADY_USED, NOT_FOUND, DENIED.
+    """
+    cuenta = get_current_cuenta(request)
+    if not cuenta:
+        return JsonResponse({"ok": False, "error": "NO_ACCOUNT"}, status=403)
+
+    data, error = leer_lote(request.body)
+    if error:
+        return JsonResponse({"ok": False, "error": error, "max": MAX_LOTE}, status=400)
+
+    # Puerta desde la que se escaneó (opcional): misma regla que validate_ticket
+    ap = None
+    ap_id = data.get("access_point_id") or None
+    if ap_id is not None:
+        if not str(ap_id).isdigit() or not puerta_autorizada(request.user, cuenta, ap_id):
+            return JsonResponse({"ok": False, "error": "INVALID_ACCESS_POINT"}, status=403)
+        ap = AccessPoint.objects.get(pk=int(ap_id))
+
+    resultados = validar_lote(
+        cuenta=cuenta,
+        scans=data["scans"],
+        usuario=request.user,
+        ip=request.META.get('REMOTE_ADDR'),
+        user_agent=request.META.get('HTTP_USER_AGENT', ''),
+        access_point=ap,
+    )
+    metricas_puerta.registrar_lote(
+        cuenta.id, ap.id if ap else None, [(r["result"], r["scanned_at"]) for r in resultados]
     )
 
-    return JsonResponse({"ok": True, "code": str(t.code), "evento": t.evento.nombre, "tipo": t.tipo.nombre})
+    items = [resultado_a_dict(r) for r in resultados]
+    return JsonResponse({"ok": True, "results": items})
 
 
 @require_role("admin","staff")
@@ -234,8 +330,13 @@ def validator_page(request):
     """
     Página de validación con autofocus. El input recibe el código del QR (uuid).
     Envía POST a /orders/validate/<code>/ y muestra el resultado sin recargar.
+    El evento elegido se envía como evento_id para rechazar QR de otros eventos
+    y la puerta como access_point_id (métricas por puerta).
     """
-    return render(request, "orders/validator.html")
+    cuenta = get_current_cuenta(request)
+    eventos = Evento.objects.filter(cuenta=cuenta).exclude(estado="cancelado")
+    puertas = puertas_de(request.user, cuenta)
+    return render(request, "orders/validator.html", {"eventos": eventos, "puertas": puertas})
 
 
 def _qr_data_url(data: str) -> str:
@@ -250,7 +351,7 @@ def ticket_pdf_by_code(request, code):
 
     context = {
         "ticket": ticket,
-        "qr_data_url": _qr_data_url(str(ticket.code)),
+        "qr_data_url": _qr_data_url(qr_firma.payload_qr(ticket)),
     }
     html = render_to_string("orders/ticket_pdf.html", context)
 
@@ -1,10 +1,18 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
 from django.shortcuts import get_object_or_404, render
 from django.db.models import Count
 from django.db.models.functions import TruncDate
-from django.http import JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
+from accounts.models import UsuarioRol
 from accounts.utils import get_current_cuenta, require_role
 from events.models import Evento
 from .models import Ticket
+from orders.services import feed_validaciones
 from django.utils.dateparse import parse_date
 
 
@@ -59,6 +67,8 @@ def event_summary(request, event_id):
         "validados_por_tipo": validados_por_tipo,
         "validados_por_dia": validados_por_dia,
         "emitidos_vs_validados": emitidos_vs_validados,
+        # Sin ASGI el panel no abre el stream y refresca el resumen por polling
+        "en_vivo": _es_asgi(request),
     }
 
     return render(request, "orders/event_dashboard.html", contexto)
@@ -125,3 +135,62 @@ def event_summary_data(request, event_id):
     }
 
     return JsonResponse(data)
+
+
+# --- Stream en vivo de validaciones (SSE, requiere ASGI) ---
+def _es_asgi(request):
+    return isinstance(request, ASGIRequest)
+
+
+def _stream_context(request, event_id):
+    cuenta = get_current_cuenta(request)
+    if not cuenta or not request.user.is_authenticated:
+        return None
+    autorizado = UsuarioRol.objects.filter(
+        usuario=request.user, cuenta=cuenta, rol__in=("superadmin", "admin", "staff"), activo=True
+    ).exists()
+    if not autorizado or not Evento.objects.filter(pk=event_id, cuenta=cuenta).exists():
+        return None
+    return cuenta
+
+
+def _sse(evento, data):
+    return f"event: {evento}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+async def event_validation_stream(request, event_id):
+    """
+    Server-sent events con cada validación del evento ("validacion") y los
+    contadores por puerta cada FEED_SNAPSHOT_SECONDS ("snapshot").
+
+    Sólo bajo ASGI. Con WSGI (gunicorn core.wsgi) StreamingHttpResponse
+    junta el iterador async completo antes de enviar: un stream sin fin no
+    mandaría nada y retendría el worker para siempre. Ahí responde 501 y el
+    dashboard refresca el resumen por polling.
+    """
+    if not _es_asgi(request):
+        return JsonResponse({"ok": False, "error": "ASGI_REQUIRED"}, status=501)
+    cuenta = await sync_to_async(_stream_context)(request, event_id)
+    if cuenta is None:
+        return JsonResponse({"ok": False, "error": "DENIED"}, status=403)
+
+    keepalive = getattr(settings, "FEED_KEEPALIVE_SECONDS", 15)
+
+    async def eventos():
+        q = feed_validaciones.suscribir(cuenta.id, event_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    msg = await asyncio.wait_for(q.get(), timeout=keepalive)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse(msg["tipo"], msg["data"])
+        finally:
+            feed_validaciones.desuscribir(cuenta.id, event_id, q)
+
+    response = StreamingHttpResponse(eventos(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
@@ -7,6 +7,7 @@ from xhtml2pdf import pisa
 import io, base64, qrcode
 from accounts.utils import get_current_cuenta, require_role
 from .models import Ticket, Orden
+from orders.services import qr_firma
 
 
 def _qr_data_url(data: str) -> str:
@@ -19,7 +20,7 @@ def _qr_data_url(data: str) -> str:
 def _render_ticket_pdf_bytes(ticket) -> bytes:
     html = render_to_string("orders/ticket_pdf.html", {
         "ticket": ticket,
-        "qr_data_url": _qr_data_url(str(ticket.code)),
+        "qr_data_url": _qr_data_url(qr_firma.payload_qr(ticket)),
     })
     out = io.BytesIO()
     pisa.CreatePDF(io.StringIO(html), dest=out)
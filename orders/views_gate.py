@@ -0,0 +1,212 @@
+# orders/views_gate.py
+"""
+Sincronización de puertas (AccessPoint) para validar sin conexión.
+
+Flujo del escáner:
+  1) GET  manifest/  → lista compacta de tickets válidos + cursor
+  2) GET  delta/?cursor=...  → sólo los cambios desde el cursor
+     (ventas nuevas, anulaciones, reemisiones y quemas en otras puertas)
+  3) POST upload/  → sube las quemas hechas sin conexión para conciliarlas
+
+Además, gate/metrics/ (+ panel/) muestra el flujo en vivo por puerta.
+"""
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db.models import Q
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404, render
+from django.utils import timezone
+from django.views.decorators.http import require_GET, require_POST
+
+from accounts.utils import get_current_cuenta, require_role
+from events.models import Evento
+from tickets.models import TipoTicket
+from .models import AccessPoint, Ticket
+from orders.services import metricas_puerta
+from orders.services.puertas import puede_operar
+from orders.services.validacion import validar_lote, leer_scans, resultado_a_dict, MAX_LOTE
+
+
+# Sólo se entregan cambios "asentados": una transacción que confirma tarde
+# con un updated_at anterior no queda fuera del siguiente delta.
+SYNC_LAG = timedelta(seconds=2)
+DELTA_LIMIT = 2000
+
+
+def _encode_cursor(ts, ticket_id=0):
+    micros = int(ts.timestamp() * 1_000_000)
+    return f"{micros}-{ticket_id}"
+
+
+def _decode_cursor(cursor):
+    try:
+        micros, ticket_id = cursor.split("-", 1)
+        ts = datetime.fromtimestamp(int(micros) / 1_000_000, tz=dt_timezone.utc)
+        return ts, int(ticket_id)
+    except (AttributeError, ValueError):
+        return None
+
+
+def _fila(t):
+    """[code, tipo_id, estado, code del reemplazo | None]"""
+    return [str(t["code"]), t["tipo_id"], t["estado"], str(t["replaced_by__code"]) if t["replaced_by__code"] else None]
+
+
+def _gate_context(request, ap_id, event_id):
+    """
+    Resuelve (access_point, evento) si el usuario puede operar esa puerta.
+    Retorna (ap, evento, None) o (None, None, JsonResponse de error).
+    """
+    cuenta = get_current_cuenta(request)
+    if not cuenta:
+        return None, None, JsonResponse({"ok": False, "error": "NO_ACCOUNT"}, status=403)
+
+    ap = get_object_or_404(AccessPoint, pk=ap_id, cuenta=cuenta, activo=True)
+    evento = get_object_or_404(Evento, pk=event_id, cuenta=cuenta)
+
+    if not puede_operar(request.user, cuenta, ap):
+        return None, None, JsonResponse({"ok": False, "error": "DENIED"}, status=403)
+
+    return ap, evento, None
+
+
+def _tipos(evento):
+    return {
+        str(tt.id): {
+            "nombre": tt.nombre,
+            "access_policy": tt.access_policy,
+            "reentry_rule": tt.reentry_rule,
+            "valid_day": tt.valid_day.isoformat() if tt.valid_day else None,
+        }
+        for tt in TipoTicket.objects.filter(evento=evento)
+    }
+
+
+@require_GET
+@login_required
+def gate_manifest(request, ap_id, event_id):
+    ap, evento, error = _gate_context(request, ap_id, event_id)
+    if error:
+        return error
+
+    corte = timezone.now() - SYNC_LAG
+    filas = (
+        Ticket.objects
+        .filter(evento=evento)
+        .exclude(estado="anulado")
+        .values("code", "tipo_id", "estado", "replaced_by__code")
+        .order_by("id")
+    )
+
+    return JsonResponse({
+        "ok": True,
+        "access_point": ap.id,
+        "evento": evento.id,
+        "cursor": _encode_cursor(corte),
+        "tipos": _tipos(evento),
+        "tickets": [_fila(t) for t in filas.iterator(chunk_size=5000)],
+    })
+
+
+@require_GET
+@login_required
+def gate_delta(request, ap_id, event_id):
+    ap, evento, error = _gate_context(request, ap_id, event_id)
+    if error:
+        return error
+
+    decoded = _decode_cursor(request.GET.get("cursor"))
+    if not decoded:
+        return JsonResponse({"ok": False, "error": "INVALID_CURSOR"}, status=400)
+    ts, last_id = decoded
+
+    corte = timezone.now() - SYNC_LAG
+    filas = list(
+        Ticket.objects
+        .filter(evento=evento, updated_at__lte=corte)
+        .filter(Q(updated_at__gt=ts) | Q(updated_at=ts, id__gt=last_id))
+        .values("id", "code", "tipo_id", "estado", "replaced_by__code", "updated_at")
+        .order_by("updated_at", "id")[:DELTA_LIMIT + 1]
+    )
+
+    has_more = len(filas) > DELTA_LIMIT
+    filas = filas[:DELTA_LIMIT]
+
+    if has_more:
+        cursor = _encode_cursor(filas[-1]["updated_at"], filas[-1]["id"])
+    else:
+        # Sin más cambios: avanzamos hasta el corte para no re-escanear el rango
+        cursor = _encode_cursor(max(corte, ts))
+
+    return JsonResponse({
+        "ok": True,
+        "cursor": cursor,
+        "has_more": has_more,
+        "tickets": [_fila(t) for t in filas],
+    })
+
+
+@require_POST
+@login_required
+def gate_upload(request, ap_id, event_id):
+    """
+    Concilia las quemas hechas sin conexión en Ticket y ValidationLog.
+    Mismo formato que validate_batch: {"scans": [{"code", "scanned_at"}, ...]}
+    """
+    ap, evento, error = _gate_context(request, ap_id, event_id)
+    if error:
+        return error
+
+    scans, error = leer_scans(request.body)
+    if error:
+        return JsonResponse({"ok": False, "error": error, "max": MAX_LOTE}, status=400)
+
+    resultados = validar_lote(
+        cuenta=ap.cuenta,
+        scans=scans,
+        usuario=request.user,
+        ip=request.META.get("REMOTE_ADDR"),
+        user_agent=request.META.get("HTTP_USER_AGENT", ""),
+        access_point=ap,
+        evento=evento,
+    )
+    # Las lecturas sin conexión cuentan en el minuto en que se escanearon
+    metricas_puerta.registrar_lote(ap.cuenta_id, ap.id, [(r["result"], r["scanned_at"]) for r in resultados])
+    return JsonResponse({"ok": True, "results": [resultado_a_dict(r) for r in resultados]})
+
+
+def _minutos(request):
+    """?minutos=N acotado a [1, VENTANA_MAX]; inválido o ausente: la ventana por defecto."""
+    try:
+        minutos = int(request.GET.get("minutos", ""))
+    except ValueError:
+        return getattr(settings, "GATE_METRICS_WINDOW_MINUTES", 5)
+    return max(1, min(minutos, metricas_puerta.VENTANA_MAX))
+
+
+@require_GET
+@require_role("superadmin", "admin", "staff")
+def gate_metrics(request):
+    """
+    Lecturas/min, tasa de rechazo y p95 de latencia por puerta en la ventana
+    ?minutos=N (contadores en cache, ver services/metricas_puerta).
+    """
+    cuenta = get_current_cuenta(request)
+    aps = list(AccessPoint.objects.filter(cuenta=cuenta, activo=True).values_list("id", "nombre"))
+    nombres = {0: "Sin puerta", **dict(aps)}
+
+    datos = metricas_puerta.resumen(cuenta.id, list(nombres), minutos=_minutos(request))
+    return JsonResponse({
+        "ok": True,
+        "generado": timezone.now(),
+        "puertas": [{"id": ap_id, "nombre": nombres[ap_id], **datos[ap_id]} for ap_id in nombres],
+    })
+
+
+@require_role("superadmin", "admin", "staff")
+def gate_metrics_panel(request):
+    return render(request, "orders/gate_metrics.html", {
+        "minutos": getattr(settings, "GATE_METRICS_WINDOW_MINUTES", 5),
+    })
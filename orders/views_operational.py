@@ -1,15 +1,20 @@
+import os
+
 from django.shortcuts import get_object_or_404, redirect
-from django.views.decorators.http import require_POST
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET, require_POST
 from django.contrib import messages
 from django.db import transaction
+from django.utils.timezone import now
 from accounts.utils import get_current_cuenta, require_role
 from .models import Ticket, TicketActionLog
-from django.contrib.auth.decorators import login_required
+from orders.services import busqueda_ordenes, filtro_codigos, paginacion
+from orders.services.inventario import StockInsuficiente, liberar_stock, tomar_stock
+from django.contrib.auth.decorators import login_required, user_passes_test
+from core import webpay
 from django.shortcuts import render
 from events.models import Evento
 from .models import Orden
-from django.core.paginator import Paginator
-from django.db.models import Q
 
 
 @require_POST
@@ -17,14 +22,19 @@ from django.db.models import Q
 def ticket_cancel(request, ticket_id):
     cuenta = get_current_cuenta(request)
     t = get_object_or_404(Ticket, pk=ticket_id, evento__cuenta=cuenta)
-    if t.estado == "anulado":
-        messages.info(request, f"El ticket #{t.id} ya estaba anulado.")
-        return redirect("orders:detail", pk=t.orden_id)
-    t.estado = "anulado"
-    t.save(update_fields=["estado"])
-    TicketActionLog.objects.create(
-        ticket=t, action="anular", performed_by=request.user, reason=request.POST.get("reason", "")
-    )
+    with transaction.atomic():
+        # UPDATE condicional: con dos anulaciones simultáneas sólo una
+        # devuelve la entrada a la venta
+        anulados = Ticket.objects.filter(pk=t.pk).exclude(estado="anulado").update(
+            estado="anulado", updated_at=now()
+        )
+        if not anulados:
+            messages.info(request, f"El ticket #{t.id} ya estaba anulado.")
+            return redirect("orders:detail", pk=t.orden_id)
+        liberar_stock([(t.tipo, 1)])  # la entrada vuelve a la venta
+        TicketActionLog.objects.create(
+            ticket=t, action="anular", performed_by=request.user, reason=request.POST.get("reason", "")
+        )
     messages.success(request, f"Ticket #{t.id} anulado.")
     return redirect("orders:detail", pk=t.orden_id)
 
@@ -35,11 +45,20 @@ def ticket_reissue(request, ticket_id):
     cuenta = get_current_cuenta(request)
     old = get_object_or_404(Ticket, pk=ticket_id, evento__cuenta=cuenta)
 
-    # 1) Anula el ticket original (si no lo está)
-    if old.estado != "anulado":
-        old.estado = "anulado"
-        old.save(update_fields=["estado"])
+    # 1) Anula el ticket original (si no lo está). Su entrada pasa al
+    # reemplazo; si ya estaba anulado, la entrada había vuelto a la venta y
+    # el reemplazo tiene que tomar stock.
+    anulados = Ticket.objects.filter(pk=old.pk).exclude(estado="anulado").update(
+        estado="anulado", updated_at=now()
+    )
+    if anulados:
         TicketActionLog.objects.create(ticket=old, action="anular", performed_by=request.user, reason="Reemisión")
+    else:
+        try:
+            tomar_stock([(old.tipo, 1)])
+        except StockInsuficiente:
+            messages.error(request, f"No quedan entradas {old.tipo.nombre} para reemitir el ticket #{old.id}.")
+            return redirect("orders:detail", pk=old.orden_id)
 
     # 2) Crea el reemplazo (mismo orden, evento y tipo)
     new_t = Ticket.objects.create(
@@ -47,9 +66,13 @@ def ticket_reissue(request, ticket_id):
         evento=old.evento,
         tipo=old.tipo,
         asistente_email=old.asistente_email,
+        precio=old.precio,
+        descuento=old.descuento,
+        neto=old.neto,
     )
+    filtro_codigos.registrar_codigos(cuenta.id, new_t.evento_id, [new_t.code])
     old.replaced_by = new_t
-    old.save(update_fields=["replaced_by"])
+    old.save(update_fields=["replaced_by", "updated_at"])
 
     TicketActionLog.objects.create(
         ticket=new_t, action="reemitir", performed_by=request.user, reason=f"Reemplaza al #{old.id}"
@@ -77,27 +100,39 @@ def orders_by_event(request, event_id):
     hasta = request.GET.get("hasta") or ""
 
     if q:
-        qs = qs.filter(
-            Q(id__icontains=q) |
-            Q(comprador_email__icontains=q)
-        )
+        qs = busqueda_ordenes.filtrar(qs, cuenta.id, q, por_evento=False)
 
     if desde:
         qs = qs.filter(created_at__date__gte=desde)
     if hasta:
         qs = qs.filter(created_at__date__lte=hasta)
 
-    # -------- Paginación --------
-    paginator = Paginator(qs, 20)
-    page_number = request.GET.get("page")
-    page_obj = paginator.get_page(page_number)
+    # -------- Paginación por cursor (sin COUNT ni OFFSET) --------
+    cursor = request.GET.get("cursor")
+    pagina = paginacion.contar_tickets(paginacion.paginar(qs, cursor))
+    total, total_exacto = paginacion.contar_hasta(qs) if not cursor else (None, False)
 
     contexto = {
         "evento": evento,
-        "ordenes": page_obj.object_list,
-        "page_obj": page_obj,
+        "ordenes": pagina.items,
+        "pagina": pagina,
+        "total": total,
+        "total_exacto": total_exacto,
         "q": q,
         "desde": desde,
         "hasta": hasta,
     }
     return render(request, "orders/list.html", contexto)
+
+
+@require_GET
+@login_required
+@user_passes_test(lambda u: u.is_superuser)
+def webpay_metrics(request):
+    """
+    Latencia y errores de las últimas llamadas a Webpay por operación
+    (core.webpay.metricas). Es del proceso que atiende el request, así que
+    en gunicorn muestra un worker. El worker process_webpay_commits escribe
+    las suyas (commit, status) en su salida cada minuto.
+    """
+    return JsonResponse({"ok": True, "generado": now(), "pid": os.getpid(), "operaciones": webpay.metricas()})
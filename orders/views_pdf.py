@@ -3,6 +3,7 @@ from django.shortcuts import get_object_or_404
 from django.template.loader import render_to_string
 from accounts.utils import get_current_cuenta, require_role
 from .models import Ticket
+from orders.services import qr_firma
 from xhtml2pdf import pisa
 import io, base64, qrcode
 from accounts.utils import get_current_cuenta, require_role
@@ -31,7 +32,7 @@ def ticket_pdf_by_code(request, code):
     if ticket.orden.cuenta != cuenta:
       raise Http404()
 
-    context = {"ticket": ticket, "qr_data_url": _qr_data_url(str(ticket.code))}
+    context = {"ticket": ticket, "qr_data_url": _qr_data_url(qr_firma.payload_qr(ticket))}
     html = render_to_string("orders/ticket_pdf.html", context)
 
     # generar PDF in-memory con xhtml2pdf
@@ -66,7 +67,7 @@ def order_tickets_pdf(request, order_id: int):
         c.drawString(20*mm, height - 44*mm, f"Código: {t.code}")
 
         # Generar QR como imagen PIL
-        qr_img = qrcode.make(str(t.code))
+        qr_img = qrcode.make(qr_firma.payload_qr(t))
         qr_size = 40 * mm
 
         # Convertir a imagen compatible con ReportLab
@@ -1,4 +1,6 @@
 import json
+import secrets
+from functools import wraps
 from django.shortcuts import render, get_object_or_404
 from events.models import Evento
 from tickets.models import TipoTicket
@@ -9,12 +11,68 @@ from core.webpay import wb
 from transbank.webpay.webpay_plus.transaction import Transaction
 from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
-from django.http import HttpResponse
-from .models import Orden
-from orders.services.checkout import finalizar_pago_y_generar_codigo
+from django.http import HttpResponse, JsonResponse
+from .models import Orden, TransaccionWebpay
+from orders.services import pagos_webpay, precios, reservas, sala_espera
+from orders.services.inventario import StockInsuficiente
 from django.contrib import messages
+import logging
 
 
+logger = logging.getLogger(__name__)
+
+
+
+def con_sala_espera(viewfunc):
+    """
+    Si el evento tiene sala de espera, sólo deja pasar compradores con un
+    turno admitido; al resto les entrega turno y los manda a la cola.
+    """
+    @wraps(viewfunc)
+    def _wrapped(request, slug, *args, **kwargs):
+        cfg = sala_espera.config(slug)
+        if cfg:
+            turno = sala_espera.leer(request.COOKIES.get(sala_espera.nombre_cookie(cfg["id"])), cfg["id"])
+            if not turno or not sala_espera.admitido(turno):
+                return redirect("orders:public-waiting-room", slug=slug)
+        return viewfunc(request, slug, *args, **kwargs)
+    return _wrapped
+
+
+def waiting_room(request, slug):
+    """
+    Página de cola. No consulta la base (config cacheada y turno firmado en
+    cookie) y se recarga sola hasta que llega el turno.
+    """
+    cfg = sala_espera.config(slug)
+    if not cfg:
+        return redirect("orders:public-checkout-step1", slug=slug)
+
+    cookie = sala_espera.nombre_cookie(cfg["id"])
+    token = request.COOKIES.get(cookie)
+    turno = sala_espera.leer(token, cfg["id"])
+    nuevo = turno is None
+    if nuevo:
+        token = sala_espera.emitir(cfg["id"], cfg["rate"])
+        turno = sala_espera.leer(token, cfg["id"])
+
+    info = sala_espera.estado(turno, cfg["rate"])
+    if info["admitido"]:
+        response = redirect("orders:public-checkout-step1", slug=slug)
+    else:
+        response = render(request, "orders/public_waiting_room.html", {
+            "slug": slug,
+            "info": info,
+            "refresh": max(2, min(info["espera_segundos"], 15)),
+        })
+        response["Cache-Control"] = "no-store"
+    if nuevo:
+        response.set_cookie(
+            cookie, token, max_age=info["espera_segundos"] + sala_espera.ttl_admision(),
+            httponly=True, samesite="Lax",
+        )
+    return response
+
 
 def _has_field(model, name: str) -> bool:
     return any(f.name == name for f in model._meta.get_fields())
@@ -42,6 +100,7 @@ def event_public_detail(request, slug):
     }
     return render(request, "orders/public_event_detail.html", context)
 
+@con_sala_espera
 def checkout_step1(request, slug):
     event = get_object_or_404(Evento, slug=slug)
     # Mostrar sólo tipos activos; si luego agregás visibilidad por fechas/stock, lo ajustamos aquí
@@ -69,6 +128,7 @@ def public_checkout_success(request, order_id):
 
 
 
+@con_sala_espera
 def checkout_step3_form(request, slug):
     event = get_object_or_404(Evento, slug=slug)
 
@@ -114,30 +174,29 @@ def checkout_step3_form(request, slug):
     return render(request, "orders/public_checkout_step3.html", context)
 
 
+@con_sala_espera
 def public_checkout_pay(request, slug):
     """
     Inicia el pago con Webpay (ambiente de integración).
 
-    Aquí armamos un payload mínimo en sesión para que webpay_return
-    pueda finalizar la orden usando finalizar_pago_y_generar_codigo(...)
+    Aquí armamos un payload mínimo y lo guardamos en una TransaccionWebpay
+    para que el worker de pagos finalice la orden usando
+    finalizar_pago_y_generar_codigo(...)
     """
     evento = get_object_or_404(Evento, slug=slug)
 
     # Por ahora: 1 ticket del primer tipo activo del evento (modo demo)
-    tipo = (
-        TipoTicket.objects
-        .filter(evento=evento, activo=True)
-        .order_by("precio")
-        .first()
-    )
-    if not tipo:
+    tipos = precios.tipos_activos(evento.id)
+    if not tipos:
         messages.error(request, "No hay tipos de ticket configurados para este evento.")
         return redirect("orders:public-checkout-step1", slug=slug)
+    tipo = tipos[0]
 
     # De momento usamos SIEMPRE 1 ticket de ese tipo (como tenías en la versión inicial)
     cantidad = 1
-    precio_unitario = int(tipo.precio)
-    total = precio_unitario * cantidad
+    cot = precios.cotizar(evento, [{"tipo_ticket_id": tipo.id, "cantidad": cantidad}])
+    precio_unitario = int(cot["lineas"][0]["precio_unitario"])
+    total = int(cot["total"])
 
     # --- Guardamos en sesión lo que webpay_return espera ---
     payload = {
@@ -149,12 +208,25 @@ def public_checkout_pay(request, slug):
                 "nombre": tipo.nombre,
             }
         ],
-        "subtotal": total,
-        "discount": 0,
+        "subtotal": int(cot["subtotal"]),
+        "discount": int(cot["descuento"]),
         "total": total,
         "promo_code": None,
     }
 
+    # Aparta el cupo mientras el comprador paga (vence en CHECKOUT_HOLD_MINUTES).
+    # Si reintenta el pago, la reserva anterior se libera.
+    anterior = (request.session.get("checkout_payload") or {}).get("reserva")
+    if anterior:
+        reservas.liberar(anterior)
+    try:
+        grupo, _ = reservas.reservar(evento, [(tipo, cantidad)])
+    except StockInsuficiente as e:
+        request.session.pop("checkout_payload", None)
+        messages.error(request, str(e))
+        return redirect("orders:public-checkout-step1", slug=slug)
+    payload["reserva"] = str(grupo)
+
         # Intentamos usar el email que viene del formulario (Step 3)
     email_form = request.POST.get("email")
 
@@ -179,7 +251,9 @@ def public_checkout_pay(request, slug):
     amount = total
 
     # Identificadores únicos requeridos por Webpay
-    buy_order = f"EVT{evento.id}-{int(timezone.now().timestamp())}"
+    # (el sufijo evita que dos compras del mismo segundo compartan buy_order,
+    # que es la llave con que se concilia contra Transbank; máx. 26 caracteres)
+    buy_order = f"EVT{evento.id}-{int(timezone.now().timestamp())}-{secrets.token_hex(2)}"
     session_id = f"sess-{request.session.session_key or 'anon'}"
 
     # URL a la que Webpay volverá después del pago
@@ -198,6 +272,9 @@ def public_checkout_pay(request, slug):
     token = resp["token"]
     url = resp["url"]
 
+    # El worker de pagos confirma con lo guardado acá, no con la sesión
+    pagos_webpay.registrar(evento, token, buy_order, amount, payload, buyer)
+
     # Redirigimos al formulario de Webpay con el token_ws
     return redirect(f"{url}?token_ws={token}")
 
@@ -205,13 +282,28 @@ def public_checkout_pay(request, slug):
 
 
 
+def _liberar_reserva_de_sesion(request):
+    payload = request.session.pop("checkout_payload", None) or {}
+    if payload.get("reserva"):
+        reservas.liberar(payload["reserva"])
+
+
 @csrf_exempt
 def webpay_return(request, slug):
-    # 1. Obtener token entregado por Webpay
+    """
+    Retorno desde Webpay. No confirma acá: deja la transacción en cola para
+    process_webpay_commits y manda al comprador a la página de estado, así
+    la latencia de Transbank no retiene workers web.
+    """
     token = request.GET.get("token_ws") or request.POST.get("token_ws")
     evento = get_object_or_404(Evento, slug=slug)
 
     if not token:
+        # Compra abortada en Webpay: se devuelve el cupo reservado
+        tbk_token = request.GET.get("TBK_TOKEN") or request.POST.get("TBK_TOKEN")
+        if tbk_token:
+            pagos_webpay.abortar(tbk_token)
+        _liberar_reserva_de_sesion(request)
         messages.error(request, "No se recibió el token de Webpay.")
         return render(
             request,
@@ -222,68 +314,50 @@ def webpay_return(request, slug):
             },
         )
 
-    # 2. Confirmar la transacción en Webpay
-    try:
-        tx = wb().commit(token)   # tx es un dict
-    except Exception as e:
-        # Cualquier error técnico hablando con Webpay cae acá
-        messages.error(request, "Error al confirmar el pago en Webpay.")
-        return render(
-            request,
-            "orders/public_checkout_error.html",
-            {
-                "event": evento,
-                "reason": "webpay-error",
-                "detail": str(e),
-            },
-        )
+    # Un segundo POST del mismo token (recarga o reintento de Transbank)
+    # no vuelve a encolar: también termina en la página de estado.
+    tx = pagos_webpay.recibir(token)
+    if tx is None or tx.evento_id != evento.id:
+        messages.error(request, _MENSAJES_ERROR["missing-session"])
+        return render(request, "orders/public_checkout_error.html", {"event": evento, "reason": "missing-session"})
 
-    # 3. Validar respuesta de Webpay
-    if tx.get("response_code") != 0 or tx.get("status") != "AUTHORIZED":
-        messages.error(request, "Pago rechazado o no autorizado por Webpay.")
-        return render(
-            request,
-            "orders/public_checkout_error.html",
-            {
-                "event": evento,
-                "reason": "not-authorized",
-                "detail": tx,
-            },
-        )
+    request.session.pop("checkout_payload", None)
+    request.session.pop("checkout_buyer", None)
+    if pagos_webpay.modo() == "sync":
+        pagos_webpay.procesar_ahora(token)
+    return redirect("orders:public-checkout-status", token=token)
 
-    # 4. Recuperar datos que guardamos en sesión en public_checkout_pay
-    payload = request.session.pop("checkout_payload", None)
-    buyer = request.session.pop("checkout_buyer", None)
 
-    if not payload or not buyer:
-        messages.error(request, "No encontramos los datos de la compra en la sesión.")
-        return render(
-            request,
-            "orders/public_checkout_error.html",
-            {
-                "event": evento,
-                "reason": "missing-session",
-            },
-        )
+_MENSAJES_ERROR = {
+    "webpay-error": "Error al confirmar el pago en Webpay.",
+    "not-authorized": "Pago rechazado o no autorizado por Webpay.",
+    "missing-session": "No encontramos los datos de la compra en la sesión.",
+}
 
-    cuenta = evento.cuenta
 
-    # 5. Armar info de Webpay para guardar en la orden
-    webpay_data = {
+def public_checkout_status(request, token):
+    """
+    Página de espera mientras el worker confirma el pago. Redirige a la
+    compra exitosa o muestra el error cuando la transacción termina.
+    """
+    tx = get_object_or_404(TransaccionWebpay.objects.select_related("evento"), token=token)
+    if tx.estado == "pagada":
+        return redirect("orders:public-checkout-success", order_id=tx.orden_id)
+    if tx.estado in pagos_webpay.FINALES:
+        resultado = tx.resultado or {}
+        messages.error(request, _MENSAJES_ERROR.get(resultado.get("reason"), "Error al procesar el pago."))
+        return render(request, "orders/public_checkout_error.html", {"event": tx.evento, **resultado})
+    return render(request, "orders/public_checkout_status.html", {
         "token": token,
-        "authorization_code": tx.get("authorization_code"),
-        "amount": tx.get("amount"),
-        "buy_order": tx.get("buy_order"),
-        "session_id": tx.get("session_id"),
-        "card_last4": (tx.get("card_detail") or {}).get("card_number"),
-    }
-
-    # 6. Crear la orden definitiva y generar códigos de ticket
-    orden = finalizar_pago_y_generar_codigo(
-        evento=evento,
-        payload=payload,
-        buyer=buyer,
-        webpay_data=webpay_data
-    )
-    # 7. Enviar al “compra exitosa” que ya tenías hecho
-    return redirect("orders:public-checkout-success", order_id=orden.id)
\ No newline at end of file
+        "data_url": reverse("orders:public-checkout-status-data", kwargs={"token": token}),
+    })
+
+
+def public_checkout_status_data(request, token):
+    """JSON que consulta la página de estado: una lectura por índice único."""
+    data = pagos_webpay.estado(token)
+    if data is None:
+        raise Http404
+    resp = JsonResponse(data)
+    resp["Cache-Control"] = "no-store"
+    return resp
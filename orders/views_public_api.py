@@ -5,15 +5,16 @@ from django.urls import reverse
 from events.models import Evento
 from .models import Orden
 from django.http import JsonResponse, HttpResponseBadRequest
-from orders.models import SharedPurchaseCode
-from decimal import Decimal
+from orders.models import PromoCode, SharedPurchaseCode
 from django.db import transaction
-from django.utils import timezone
 from django.urls import reverse
-from tickets.models import TipoTicket, DiscountCode
+from tickets.models import DiscountCode
+from orders.services import cupos_descuento, montos, precios
+from orders.services.emision import emitir_tickets
+from orders.services.idempotencia import idempotente_json
+from orders.services.inventario import StockInsuficiente, tomar_stock
 from orders.services.checkout import (
     finalizar_pago_y_generar_codigo,
-    aplicar_shared_code_en_carrito,
     confirmar_compra_con_shared_code,
 )
 
@@ -23,6 +24,7 @@ def _clean_email(v: str) -> str:
 
 
 @csrf_exempt  # puedes quitar el csrf_exempt si prefieres protegerlo con CSRF + header
+@idempotente_json("api-checkout")
 def checkout_crear_orden(request):
     """
     Crea la orden y los tickets a partir del payload del front.
@@ -39,6 +41,9 @@ def checkout_crear_orden(request):
         "promo_code": "CODIGO"      # opcional
       }
 
+    Con header Idempotency-Key los reintentos reciben la respuesta original
+    en vez de crear otra orden.
+
     Responde:
       {
         "order_id": <id>,
@@ -69,6 +74,13 @@ def checkout_crear_orden(request):
 
     evento = get_object_or_404(Evento, slug=evento_slug)
 
+    # Precios y código desde la tabla cacheada del evento (sin consultas por ítem)
+    try:
+        cot = precios.cotizar(evento, items, promo_code)
+    except precios.ItemInvalido as e:
+        return JsonResponse({"detail": str(e)}, status=400)
+    carrito = cot["lineas"]  # [{ 'tipo': TipoTicket, 'cantidad': int, 'precio_unitario': Decimal }, ...]
+
     # Transacción para consistencia
     with transaction.atomic():
         # Crear orden
@@ -78,83 +90,50 @@ def checkout_crear_orden(request):
             comprador_email=comprador_email or "",
         )
 
-        # Creamos tickets + construimos carrito para aplicar shared_code
-        tipos_map = {}
-        carrito = []  # [{ 'tipo': TipoTicket, 'cantidad': int, 'precio_unitario': Decimal }, ...]
-
-        for it in items:
-            try:
-                tt_id = int(it.get("tipo_ticket_id"))
-                cantidad = int(it.get("cantidad"))
-            except Exception:
-                return JsonResponse({"detail": "Ítems inválidos."}, status=400)
-
-            if cantidad <= 0:
-                continue
-
-            if tt_id not in tipos_map:
-                tipos_map[tt_id] = get_object_or_404(
-                    TipoTicket,
-                    pk=tt_id,
-                    evento=evento,
-                )
-            tipo = tipos_map[tt_id]
-
-            # Crear los tickets físicos
-            for _ in range(cantidad):
-                orden.tickets.create(evento=evento, tipo=tipo)
-
-            carrito.append({
-                "tipo": tipo,
-                "cantidad": cantidad,
-                "precio_unitario": Decimal(tipo.precio),
-            })
-
-        # Aplicar/consumir código si viene uno
-        if promo_code:
-            # 1) Intentamos consumir DiscountCode
-            dc = (
-                DiscountCode.objects
-                .select_for_update()
-                .filter(evento=evento, codigo__iexact=promo_code, activo=True)
-                .first()
+        # Descontar stock y crear los tickets físicos (un INSERT por lote)
+        lineas = [(c["tipo"], c["cantidad"]) for c in carrito]
+        try:
+            tomar_stock(lineas)
+        except StockInsuficiente as e:
+            transaction.set_rollback(True)  # descarta también la orden
+            return JsonResponse({"detail": str(e), "tipo_ticket_id": e.tipo.id}, status=409)
+        tickets = emitir_tickets(orden, lineas)
+
+        # Consumir el código que aplicó en la cotización (si no aplicó, la
+        # orden sigue sin descuento, como antes)
+        codigo = cot["codigo"]
+        aplicado = codigo is not None
+        if isinstance(codigo, DiscountCode):
+            # si ya no quedan usos, no se aplica
+            aplicado = cupos_descuento.consumir(codigo)
+        elif isinstance(codigo, PromoCode):
+            aplicado = codigo.registrar_uso()
+        elif isinstance(codigo, SharedPurchaseCode):
+            # Actualiza used_count según las entradas que usaron el código
+            confirmar_compra_con_shared_code(orden, codigo, carrito)
+
+        # Montos de la orden y de cada ticket, congelados
+        if aplicado:
+            montos.congelar(
+                orden, tickets,
+                descuento=cot["descuento"],
+                origen=cot["descuentos"][0]["origen"],
+                tipo_ticket_id=getattr(codigo, "tipo_ticket_id", None),
             )
-
-            hoy = timezone.now().date()
-
-            if dc:
-                # mismas validaciones que en la vista de validación
-                if (
-                    (not dc.vigente_desde or hoy >= dc.vigente_desde)
-                    and (not dc.vigente_hasta or hoy <= dc.vigente_hasta)
-                    and (dc.usos_maximos is None or dc.usos_actuales < dc.usos_maximos)
-                ):
-                    # si exige tipo_ticket, verificamos que esté en el carrito
-                    if not dc.tipo_ticket_id or any(
-                        c["tipo"].id == dc.tipo_ticket_id and c["cantidad"] > 0
-                        for c in carrito
-                    ):
-                        # consumimos un uso
-                        from django.db.models import F
-                        dc.usos_actuales = F("usos_actuales") + 1
-                        dc.save(update_fields=["usos_actuales"])
-            else:
-                # 2) Si no es DiscountCode, probamos SharedPurchaseCode (cortesía)
-                sc = (
-                    SharedPurchaseCode.objects
-                    .select_for_update()
-                    .filter(code=promo_code, evento=evento, active=True)
-                    .first()
-                )
-                if sc:
-                    # Actualiza used_count según las entradas que usaron el código
-                    confirmar_compra_con_shared_code(orden, sc, carrito)
+        else:
+            montos.congelar(orden, tickets)
 
         # Generar el código compartible N-1 para esta compra (si corresponde)
         finalizar_pago_y_generar_codigo(orden)
 
     success_url = f"/orders/public/checkout/success/{orden.id}/"
-    return JsonResponse({"order_id": orden.id, "success_url": success_url}, status=201)
+    return JsonResponse({
+        "order_id": orden.id,
+        "success_url": success_url,
+        "subtotal": int(orden.subtotal),
+        "discount": int(orden.descuento),
+        "total": int(orden.total),
+    }, status=201)
 
 
 
@@ -251,163 +230,50 @@ def validar_promocode(request):
     # Buscar evento
     event = get_object_or_404(Evento, slug=evento_slug)
 
-    # Construimos carrito a partir de items
-    # carrito = [{ 'tipo': TipoTicket, 'cantidad': int, 'precio_unitario': Decimal }, ...]
     if not isinstance(items, list) or not items:
         return JsonResponse(
             {"ok": False, "message": "No hay tickets en el carrito."},
             status=400,
         )
 
-    # Mapear ids de tipo de ticket
-    ids = set()
-    for it in items:
-        try:
-            tt_id = int(it.get("tipo_ticket_id"))
-            cantidad = int(it.get("cantidad") or 0)
-        except Exception:
-            continue
-        if cantidad > 0:
-            ids.add(tt_id)
-
-    if not ids:
-        return JsonResponse(
-            {"ok": False, "message": "No hay tickets en el carrito."},
-            status=400,
-        )
-
-    tipos_map = {
-        t.id: t
-        for t in TipoTicket.objects.filter(evento=event, id__in=ids)
-    }
-
-    carrito = []
-    subtotal = Decimal("0")
-
-    for it in items:
-        try:
-            tt_id = int(it.get("tipo_ticket_id"))
-            cantidad = int(it.get("cantidad") or 0)
-        except Exception:
-            continue
-        if cantidad <= 0:
-            continue
-        tt = tipos_map.get(tt_id)
-        if not tt:
-            continue
-        price = Decimal(tt.precio)
-        carrito.append({
-            "tipo": tt,
-            "cantidad": cantidad,
-            "precio_unitario": price,
-        })
-        subtotal += price * cantidad
-
-    if subtotal <= 0:
+    try:
+        cot = precios.cotizar(event, items, code)
+    except precios.ItemInvalido:
+        cot = None
+    if not cot or cot["subtotal"] <= 0:
         return JsonResponse(
             {"ok": False, "message": "No hay tickets válidos en el carrito."},
             status=400,
         )
 
-    # 1) Intentamos primero código de descuento manual (DiscountCode)
-    dc = (
-        DiscountCode.objects
-        .filter(evento=event, codigo__iexact=code, activo=True)
-        .first()
-    )
-
-    hoy = timezone.now().date()
-
-    if dc:
-        # Vigencia
-        if dc.vigente_desde and hoy < dc.vigente_desde:
-            return JsonResponse(
-                {"ok": False, "message": "El código aún no está vigente."},
-                status=400,
-            )
-        if dc.vigente_hasta and hoy > dc.vigente_hasta:
-            return JsonResponse(
-                {"ok": False, "message": "El código ya no está vigente."},
-                status=400,
-            )
-        if dc.usos_maximos is not None and dc.usos_actuales >= dc.usos_maximos:
-            return JsonResponse(
-                {"ok": False, "message": "Este código alcanzó su límite de usos."},
-                status=400,
-            )
-
-        # Si exige un tipo de ticket específico, validamos que esté en el carrito
-        if dc.tipo_ticket_id:
-            tiene_tipo = any(
-                c["tipo"].id == dc.tipo_ticket_id and c["cantidad"] > 0
-                for c in carrito
-            )
-            if not tiene_tipo:
-                return JsonResponse(
-                    {
-                        "ok": False,
-                        "message": "Este código requiere un tipo de ticket específico en el carrito.",
-                    },
-                    status=400,
-                )
-
-        # Descuento fijo en CLP, acotado al subtotal
-        discount_amount = int(min(Decimal(dc.monto_descuento), subtotal))
-        if discount_amount <= 0:
-            return JsonResponse(
-                {
-                    "ok": False,
-                    "message": "El código no genera descuento con este carrito.",
-                    "discount_amount": 0,
-                },
-                status=400,
-            )
-
-        return JsonResponse(
-            {
-                "ok": True,
-                "kind": "fixed",
-                "discount_amount": discount_amount,
-                "message": f"Código aplicado. Descuento de {discount_amount:,} CLP.",
-            }
-        )
-
-    # 2) Si no es DiscountCode, probamos con código de cortesía SharedPurchaseCode
-    sc = (
-        SharedPurchaseCode.objects
-        .filter(code=code, evento=event, active=True)
-        .first()
-    )
-
-    if sc:
-        # Usamos la función de servicio que ya calcula descuento N-1
-        discount_decimal = aplicar_shared_code_en_carrito(carrito, sc)
-        discount_amount = int(discount_decimal or 0)
-
-        if discount_amount <= 0:
-            return JsonResponse(
-                {
-                    "ok": False,
-                    "kind": "shared",
-                    "discount_amount": 0,
-                    "message": "El código de cortesía no se puede aplicar a este carrito.",
-                },
-                status=400,
-            )
+    if cot["codigo"] is None:
+        # 404 sólo si el código no existe; si existe pero no aplica, 400
+        status = 404 if cot["error_codigo"] == precios.CODIGO_INEXISTENTE else 400
+        return JsonResponse({"ok": False, "discount_amount": 0, "message": cot["error_codigo"]}, status=status)
 
+    discount_amount = int(cot["descuento"])
+    aplicado = cot["descuentos"][0]
+    if aplicado["origen"] == "cortesia":
         return JsonResponse(
             {
                 "ok": True,
                 "kind": "shared",
                 "discount_amount": discount_amount,
+                "subtotal": int(cot["subtotal"]),
+                "total": int(cot["total"]),
                 "message": "Código de cortesía aplicado.",
             }
         )
 
-    # 3) Ningún código encontrado
     return JsonResponse(
-        {"ok": False, "message": "El código ingresado no es válido."},
-        status=404,
+        {
+            "ok": True,
+            "kind": "fixed",
+            "discount_amount": discount_amount,
+            "subtotal": int(cot["subtotal"]),
+            "total": int(cot["total"]),
+            "message": f"Código aplicado. Descuento de {discount_amount:,} CLP.",
+        }
     )
 
 
@@ -11,7 +11,7 @@ from accounts.utils import get_current_cuenta, require_role
 from events.models import Evento
 from .models import Ticket
 
-from django.db.models import Sum, F
+from django.db.models import Sum, F, Q
 from django.shortcuts import get_object_or_404, render
 from django.contrib.auth.decorators import login_required
 
@@ -82,33 +82,34 @@ def event_financial_report(request, event_id):
     Reporte financiero por evento:
     - Total $ por tipo de ticket
     - Total $ estacionamiento vs otros
-    - Totales brutos (sin considerar descuentos explícitos)
+    - Totales bruto, descuentos y neto
     - Cantidades de tickets y porcentajes
+
+    Suma los montos congelados de cada ticket al comprar (precio, descuento,
+    neto), no el precio actual del tipo. Las órdenes anteriores a esos campos
+    se completan con el comando backfill_order_totals.
     """
     evento = get_object_or_404(Evento, id=event_id)
 
     # Tickets del evento, excluyendo anulados
-    tickets = (
-        Ticket.objects
-        .select_related("tipo")
-        .filter(evento=evento)
-        .exclude(estado="anulado")
+    tickets = Ticket.objects.filter(evento=evento).exclude(estado="anulado")
+
+    parking = Q(tipo__is_parking=True)
+    tot = tickets.aggregate(
+        total_bruto=Sum("precio"),
+        descuentos=Sum("descuento"),
+        total_neto=Sum("neto"),
+        total_parking=Sum("precio", filter=parking),
+        total_tickets=Count("id"),
+        parking_tickets=Count("id", filter=parking),
     )
-
-    # Totales de monto
-    total_bruto = tickets.aggregate(
-        total=Sum(F("tipo__precio"))
-    )["total"] or 0
-
-    total_parking = tickets.filter(tipo__is_parking=True).aggregate(
-        total=Sum(F("tipo__precio"))
-    )["total"] or 0
-
+    total_bruto = tot["total_bruto"] or 0
+    total_parking = tot["total_parking"] or 0
     total_no_parking = total_bruto - total_parking
 
     # Cantidades de tickets
-    total_tickets = tickets.count()
-    parking_tickets = tickets.filter(tipo__is_parking=True).count()
+    total_tickets = tot["total_tickets"]
+    parking_tickets = tot["parking_tickets"]
     no_parking_tickets = total_tickets - parking_tickets
 
     # Porcentajes (por monto y por cantidad)
@@ -122,20 +123,21 @@ def event_financial_report(request, event_id):
     else:
         parking_pct_count = 0.0
 
-    # Totales por tipo de ticket (incluye precio unitario)
+    # Totales por tipo de ticket (precio: el de lista actual del tipo)
     totales_por_tipo = (
         tickets.values("tipo__nombre", "tipo__is_parking")
         .annotate(
             cantidad=Count("id"),
-            monto=Sum(F("tipo__precio")),
+            monto=Sum("precio"),
+            descuento=Sum("descuento"),
+            neto=Sum("neto"),
             precio=F("tipo__precio"),
         )
         .order_by("tipo__nombre")
     )
 
-    # Por ahora no tenemos montos de descuento guardados en Orden
-    descuentos_totales = 0
-    total_neto = total_bruto - descuentos_totales
+    descuentos_totales = tot["descuentos"] or 0
+    total_neto = tot["total_neto"] or 0
 
     contexto = {
         "evento": evento,
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:38
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def contar_vendidos(apps, schema_editor):
+    """vendidos = tickets vigentes (no anulados) ya emitidos por tipo."""
+    TipoTicket = apps.get_model("tickets", "TipoTicket")
+    Ticket = apps.get_model("orders", "Ticket")
+    conteos = (
+        Ticket.objects.exclude(estado="anulado")
+        .values("tipo_id").annotate(n=Count("id")).values_list("tipo_id", "n")
+    )
+    for tipo_id, n in conteos:
+        TipoTicket.objects.filter(id=tipo_id).update(vendidos=n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0003_discountcode'),
+        ('orders', '0004_ticket_replaced_by_alter_ticket_estado_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tipoticket',
+            name='capacidad',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='tipoticket',
+            name='reservados',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='tipoticket',
+            name='vendidos',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(contar_vendidos, migrations.RunPython.noop),
+    ]
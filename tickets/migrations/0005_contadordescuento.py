@@ -0,0 +1,27 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tickets', '0004_tipoticket_inventario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContadorDescuento',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.PositiveSmallIntegerField()),
+                ('cupo', models.PositiveIntegerField(default=0)),
+                ('usados', models.PositiveIntegerField(default=0)),
+                ('codigo', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='contadores', to='tickets.discountcode')),
+            ],
+            options={
+                'unique_together': {('codigo', 'shard')},
+            },
+        ),
+    ]
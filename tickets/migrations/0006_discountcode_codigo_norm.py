@@ -0,0 +1,31 @@
+# Generated by Django 5.2.7 on 2026-10-18 13:53
+
+from django.db import migrations, models
+from django.db.models.functions import Trim, Upper
+
+
+def normalizar_codigos(apps, schema_editor):
+    DiscountCode = apps.get_model("tickets", "DiscountCode")
+    DiscountCode.objects.update(codigo_norm=Upper(Trim("codigo")))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_profile_cargo_profile_comuna_profile_empresa_and_more'),
+        ('events', '0004_evento_sala_espera'),
+        ('tickets', '0005_contadordescuento'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='discountcode',
+            name='codigo_norm',
+            field=models.CharField(default='', editable=False, max_length=50),
+        ),
+        migrations.AddIndex(
+            model_name='discountcode',
+            index=models.Index(fields=['evento', 'codigo_norm'], name='tickets_dis_evento__ac5ac4_idx'),
+        ),
+        migrations.RunPython(normalizar_codigos, migrations.RunPython.noop),
+    ]
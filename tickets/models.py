@@ -19,6 +19,12 @@ class TipoTicket(models.Model):
     creado_en = models.DateTimeField(auto_now_add=True)
     is_parking = models.BooleanField(default=False)
 
+    # Inventario: capacidad vacía = sin límite. vendidos/reservados se mueven
+    # sólo con UPDATE condicionales (ver orders/services/inventario.py).
+    capacidad = models.PositiveIntegerField(null=True, blank=True)
+    vendidos = models.PositiveIntegerField(default=0, editable=False)
+    reservados = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         unique_together = ("evento", "nombre")
         ordering = ("-creado_en",)
@@ -26,6 +32,12 @@ class TipoTicket(models.Model):
     def __str__(self):
         return f"{self.nombre} · {self.evento.nombre}"
 
+    @property
+    def disponibles(self):
+        if self.capacidad is None:
+            return None
+        return max(self.capacidad - self.vendidos - self.reservados, 0)
+
 
 class DiscountCode(models.Model):
     cuenta = models.ForeignKey("accounts.Cuenta", on_delete=models.CASCADE, related_name="discount_codes")
@@ -33,6 +45,8 @@ class DiscountCode(models.Model):
 
     nombre = models.CharField(max_length=120)
     codigo = models.CharField(max_length=50, unique=True)
+    # codigo en mayúsculas: búsquedas exactas por índice en vez de iexact
+    codigo_norm = models.CharField(max_length=50, editable=False, default="")
 
     # Si se selecciona, exige que en el carrito exista al menos 1 de ese tipo
     tipo_ticket = models.ForeignKey("tickets.TipoTicket", null=True, blank=True,
@@ -50,11 +64,17 @@ class DiscountCode(models.Model):
 
     class Meta:
         ordering = ["-id"]
+        indexes = [models.Index(fields=["evento", "codigo_norm"])]
 
     def __str__(self):
         return f"{self.codigo} — {self.nombre}"
 
+    def save(self, *args, **kwargs):
+        self.codigo_norm = (self.codigo or "").strip().upper()
+        super().save(*args, **kwargs)
+
     def disponible(self) -> bool:
+        """Vigencia y cupo. Hace la suma de usos_totales(): una consulta."""
         if not self.activo:
             return False
         hoy = timezone.now().date()
@@ -62,6 +82,31 @@ class DiscountCode(models.Model):
             return False
         if self.vigente_hasta and hoy > self.vigente_hasta:
             return False
-        if self.usos_actuales >= self.usos_maximos:
+        if self.usos_totales() >= self.usos_maximos:
             return False
-        return True
\ No newline at end of file
+        return True
+
+    def usos_totales(self) -> int:
+        """
+        usos_actuales (previos a los contadores) + lo consumido en
+        ContadorDescuento. Cada llamada es una consulta (SUM por índice
+        sobre a lo más DISCOUNT_COUNTER_SHARDS filas): leerla una vez por
+        operación y no en bucles.
+        """
+        extra = self.contadores.aggregate(n=models.Sum("usados"))["n"] or 0
+        return self.usos_actuales + extra
+
+
+class ContadorDescuento(models.Model):
+    """
+    Parte del cupo de usos de un DiscountCode (orders.services.cupos_descuento).
+    Los checkouts consumen de una parte al azar, así no compiten todos por
+    el lock de la fila del código.
+    """
+    codigo = models.ForeignKey(DiscountCode, on_delete=models.CASCADE, related_name="contadores")
+    shard = models.PositiveSmallIntegerField()
+    cupo = models.PositiveIntegerField(default=0)
+    usados = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("codigo", "shard")
@@ -9,7 +9,7 @@ from django.views.decorators.http import require_GET
 class TipoForm(forms.ModelForm):
     class Meta:
         model = TipoTicket
-        fields = ["nombre","precio","access_policy","reentry_rule","includes_congress","is_vip","is_free","valid_day","is_parking","activo"]
+        fields = ["nombre","precio","capacidad","access_policy","reentry_rule","includes_congress","is_vip","is_free","valid_day","is_parking","activo"]
 
 def _evento_del_tenant(request, event_id):
     cuenta = get_current_cuenta(request)
@@ -51,5 +51,5 @@ def tipos_json(request, event_id):
     from accounts.utils import get_current_cuenta
     cuenta = get_current_cuenta(request)
     evento = get_object_or_404(Evento, pk=event_id, cuenta=cuenta)
-    data = [{"id": t.id, "nombre": t.nombre} for t in evento.tipos.filter(activo=True)]
+    data = [{"id": t.id, "nombre": t.nombre, "disponibles": t.disponibles} for t in evento.tipos.filter(activo=True)]
     return JsonResponse(data, safe=False)
\ No newline at end of file
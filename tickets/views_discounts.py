@@ -6,6 +6,9 @@ from accounts.models import Cuenta           # <— usamos el modelo directo
 from events.models import Evento
 from tickets.models import TipoTicket, DiscountCode
 from django.contrib import messages
+from django.db.models import F, Sum
+from django.db.models.functions import Coalesce
+from orders.services import cupos_descuento
 
 # Fallback para resolver la cuenta actual SIN depender de accounts.utils
 def _current_account(request):
@@ -45,7 +48,11 @@ class DiscountForm(forms.ModelForm):
 @login_required
 def discounts_list(request):
     cuenta = _current_account(request)
-    qs = DiscountCode.objects.filter(cuenta=cuenta).select_related("evento", "tipo_ticket")
+    qs = (
+        DiscountCode.objects.filter(cuenta=cuenta)
+        .select_related("evento", "tipo_ticket")
+        .annotate(usos=F("usos_actuales") + Coalesce(Sum("contadores__usados"), 0))
+    )
     return render(request, "tickets/discounts_list.html", {"cuenta": cuenta, "items": qs})
 
 @login_required
@@ -65,6 +72,7 @@ def discounts_create(request):
         else:
             d.usos_actuales = 0
             d.save()
+            cupos_descuento.redimensionar(d)
             return redirect("tickets:discounts_list")
 
     return render(request, "tickets/discounts_form.html", {"cuenta": cuenta, "form": form})
@@ -87,6 +95,7 @@ def discounts_edit(request, pk):
         else:
             # NO tocamos usos_actuales aquí, solo se modifica lo que venga del form
             d.save()
+            cupos_descuento.redimensionar(d)  # por si cambió usos_maximos
             messages.success(request, "Descuento actualizado correctamente.")
             return redirect("tickets:discounts_list")
 